@@ -0,0 +1,222 @@
+'''File containing the headless batch runner for mapping, localisation and return to start experiments.'''
+import argparse, json, multiprocessing, os, platform, random, sys, time, traceback
+from collections import namedtuple
+from timeit import default_timer
+from grid import Grid
+from robot_handler import RobotHandler
+from directions import DIRECTIONS
+from simulator import SimulatedRobot, random_obstacles
+from occupancy_grid import OccupancyGrid
+from map_store import read_map, obstacle_nodes
+from coordinator import TASK_FLAGS
+
+# Constants
+DEFAULT_SIZES = [5, 10, 20]
+DEFAULT_DENSITIES = [0.2]
+PHASES = ['map', 'localise', 'return']
+LOCALISATION_MAX_MOVES = 1000
+
+'''
+One experiment: a map, made from a size, density and seed or read from map_file, explored from its start node.
+The seed also picks where the robot is put down before localising. An unbounded scenario maps without being told the size of the map.
+'''
+Scenario = namedtuple('Scenario', ['rows', 'columns', 'density', 'seed', 'map_file', 'localisation_mode', 'localisation_policy', 'unbounded'])
+
+'''Returns the map of a scenario as rows, columns, start node and the set of obstacles.'''
+def scenario_map(scenario):
+    if scenario.map_file:
+        saved_map = read_map(scenario.map_file)
+        start = saved_map.start if saved_map.start is not None else (saved_map.rows // 2, saved_map.columns // 2)
+        return saved_map.rows, saved_map.columns, start, obstacle_nodes(saved_map) - set([start])
+    start = (scenario.rows // 2, scenario.columns // 2)
+    return scenario.rows, scenario.columns, start, random_obstacles(scenario.rows, scenario.columns, scenario.density, scenario.seed, keep = [start])
+
+'''Returns the label that scenarios are grouped under in the summary.'''
+def scenario_label(scenario):
+    label = os.path.basename(scenario.map_file) if scenario.map_file else '%dx%d@%g' % (scenario.rows, scenario.columns, scenario.density)
+    return label + ' unbounded' if scenario.unbounded else label
+
+'''
+Maps a scenario from scratch, then puts the robot down on a random reachable node and localises it on the map it made,
+then returns it to the start node. Returns the result record; an error ends the scenario and is recorded in it.
+'''
+def run_scenario(scenario):
+    record = dict(scenario._asdict())
+    record['label'] = scenario_label(scenario)
+    record['error'] = None
+    for phase in PHASES:
+        record[phase] = {'success': False, 'moves': None, 'seconds': None}
+    robot = None
+    try:
+        rows, columns, start, obstacles = scenario_map(scenario)
+        record['rows'], record['columns'] = rows, columns
+        grid = Grid(500, 500)
+        grid.set_start(start)
+        if scenario.unbounded:
+            grid.make_unbounded_grid()
+        else:
+            grid.set_grid_rows(rows)
+            grid.set_grid_cols(columns)
+            grid.make_grid()
+        grid.set_localisation_mode(scenario.localisation_mode)
+        grid.set_localisation_policy(scenario.localisation_policy)
+        grid.localisation_max_moves = LOCALISATION_MAX_MOVES
+        # The simulated robot is walled in at the edges of its world.
+        grid.walls_at_border = True
+        simulator = SimulatedRobot(rows, columns, obstacles, location = start)
+        robot = RobotHandler(simulator)
+
+        # The map is right if it leaves the same nodes reachable as the real obstacles do.
+        world = OccupancyGrid(rows, columns)
+        world.fill()
+        reachable = world.flood_fill(start, obstacles)
+        run_phase(record['map'], simulator, grid, robot, 'map')
+        record['map']['success'] = grid.connected_nodes(start) == reachable
+
+        # Localising works on a bounded grid, whose nodes may be shifted from those of the world.
+        shift = grid.bound()
+        generator = random.Random(scenario.seed)
+        simulator.location = sorted(reachable)[generator.randrange(len(reachable))]
+        simulator.direction = generator.choice(DIRECTIONS)
+        run_phase(record['localise'], simulator, grid, robot, 'localise')
+        expected = (simulator.location[0] + shift[0], simulator.location[1] + shift[1])
+        record['localise']['success'] = grid.current_location == expected and grid.current_direction == simulator.direction
+
+        if record['localise']['success']:
+            run_phase(record['return'], simulator, grid, robot, 'return_to_start')
+            record['return']['success'] = simulator.location == start
+        record['collisions'] = simulator.collisions
+    except Exception:
+        record['error'] = traceback.format_exc()
+    finally:
+        if robot is not None:
+            robot.close()
+    return record
+
+'''Runs a grid task ('map', 'localise' or 'return_to_start') as one phase of a scenario, filling in its moves and time.'''
+def run_phase(result, simulator, grid, robot, task):
+    moves = simulator.forwards + simulator.turns
+    setattr(grid, TASK_FLAGS[task], True)
+    start = default_timer()
+    getattr(grid, task)(robot)
+    result['seconds'] = default_timer() - start
+    result['moves'] = simulator.forwards + simulator.turns - moves
+
+'''Returns every scenario asked for: each map, or each size and density, with each seed.'''
+def make_scenarios(sizes, densities, seeds, map_files, localisation_mode, localisation_policy, unbounded = False):
+    scenarios = []
+    for seed in seeds:
+        for map_file in map_files:
+            scenarios.append(Scenario(None, None, None, seed, map_file, localisation_mode, localisation_policy, unbounded))
+        if not map_files:
+            for rows, columns in sizes:
+                for density in densities:
+                    scenarios.append(Scenario(rows, columns, density, seed, None, localisation_mode, localisation_policy, unbounded))
+    return scenarios
+
+'''
+Runs scenarios across a pool of processes and returns their records in the order the scenarios were given.
+With one process they run in this process, which is easier to debug.
+'''
+def run(scenarios, processes = None, progress = None):
+    records = []
+    if processes == 1:
+        results = (run_scenario(scenario) for scenario in scenarios)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(run_scenario, scenarios, chunksize = max(1, len(scenarios) // (4 * (processes or multiprocessing.cpu_count()))))
+    try:
+        for record in results:
+            records.append(record)
+            if progress:
+                progress(len(records), len(scenarios), record)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return records
+
+'''Returns the mean, median and largest of a list of numbers, or Nones if it is empty.'''
+def statistics(values):
+    if not values:
+        return {'mean': None, 'median': None, 'max': None}
+    values = sorted(values)
+    middle = len(values) // 2
+    median = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+    return {'mean': float(sum(values)) / len(values), 'median': median, 'max': values[-1]}
+
+'''Aggregates the records by label into success rates and statistics of the moves and times of each phase.'''
+def summarise(records):
+    groups = {}
+    for record in records:
+        groups.setdefault(record['label'], []).append(record)
+    summary = {}
+    for label, group in groups.items():
+        summary[label] = {'scenarios': len(group), 'errors': sum(1 for record in group if record['error'])}
+        for phase in PHASES:
+            ran = [record[phase] for record in group if record[phase]['seconds'] is not None]
+            summary[label][phase] = {
+                'success_rate': float(sum(1 for result in ran if result['success'])) / len(group),
+                'moves': statistics([result['moves'] for result in ran]),
+                'seconds': statistics([result['seconds'] for result in ran])
+            }
+    return summary
+
+'''Returns the summary as lines of text for the terminal.'''
+def format_summary(summary):
+    lines = ['%-24s %6s %6s %9s %9s %9s %10s %10s %10s' % ('scenario', 'runs', 'errors', 'mapped', 'localised', 'returned', 'map moves', 'loc moves', 'ret moves')]
+    for label in sorted(summary):
+        group = summary[label]
+        moves = ['%.1f' % group[phase]['moves']['mean'] if group[phase]['moves']['mean'] is not None else '-' for phase in PHASES]
+        lines.append('%-24s %6d %6d %8.1f%% %8.1f%% %8.1f%% %10s %10s %10s' % (label, group['scenarios'], group['errors'], 100 * group['map']['success_rate'], 100 * group['localise']['success_rate'], 100 * group['return']['success_rate'], moves[0], moves[1], moves[2]))
+    return lines
+
+'''Parses a size given as N or ROWSxCOLUMNS, both positive.'''
+def parse_size(text):
+    parts = text.lower().split('x')
+    if len(parts) in (1, 2) and all(part.isdigit() and int(part) > 0 for part in parts):
+        return int(parts[0]), int(parts[-1])
+    raise argparse.ArgumentTypeError('%r is not a size such as 10 or 10x20.' % text)
+
+'''Prints how far the batch has got.'''
+def report_progress(done, total, record):
+    if record['error']:
+        sys.stderr.write('scenario %s seed %s failed:\n%s' % (record['label'], record['seed'], record['error']))
+    if done == total or done % max(1, total // 100) == 0:
+        sys.stderr.write('%d/%d scenarios\n' % (done, total))
+        sys.stderr.flush()
+
+'''Parses the command line, runs the scenarios and writes every record and the summary as JSON.'''
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Run mapping, localisation and return to start headlessly against a simulated robot on many maps.')
+    parser.add_argument('--sizes', type = parse_size, nargs = '+', default = [(size, size) for size in DEFAULT_SIZES], help = 'map sizes such as 10 or 10x20')
+    parser.add_argument('--densities', type = float, nargs = '+', default = DEFAULT_DENSITIES, help = 'fractions of cells that are obstacles')
+    parser.add_argument('--maps', nargs = '+', default = [], help = 'saved maps to run instead of random ones')
+    parser.add_argument('--seeds', type = int, default = 10, help = 'number of seeds to run each map with')
+    parser.add_argument('--first-seed', type = int, default = 0)
+    parser.add_argument('--localisation-mode', choices = ['exact', 'histogram'], default = 'exact')
+    parser.add_argument('--localisation-policy', choices = ['random', 'active'], default = 'active')
+    parser.add_argument('--unbounded', action = 'store_true', help = 'map without being told the size of the map')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes, by default one per CPU')
+    parser.add_argument('--output', default = 'batch.json', help = 'file to write the JSON results to')
+    args = parser.parse_args(argv)
+    scenarios = make_scenarios(args.sizes, args.densities, range(args.first_seed, args.first_seed + args.seeds), args.maps, args.localisation_mode, args.localisation_policy, args.unbounded)
+    start = default_timer()
+    records = run(scenarios, args.processes, report_progress)
+    summary = summarise(records)
+    for line in format_summary(summary):
+        print(line)
+    with open(args.output, 'w') as output:
+        json.dump({
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'processes': args.processes or multiprocessing.cpu_count(),
+            'seconds': default_timer() - start,
+            'summary': summary,
+            'results': records
+        }, output, indent = 2, sort_keys = True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
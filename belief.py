@@ -0,0 +1,345 @@
+'''File containing the belief states used to localise the robot.'''
+import binascii, copy
+from collections import defaultdict
+from directions import DIRECTIONS, DIRECTION_MAP, DIRECTION_TURN_LEFT, DIRECTION_TURN_RIGHT
+
+'''Returns the number of set bits of an integer.'''
+def popcount(bits):
+    return bin(bits).count('1')
+
+'''Converts a little-endian bitmap held in a bytearray to an integer.'''
+def bitmap_to_int(bitmap):
+    if not bitmap:
+        return 0
+    return int(binascii.hexlify(bytes(bytearray(reversed(bitmap)))), 16)
+
+'''Returns the indices of the set bits of an integer, lowest first.'''
+def int_to_indices(bits):
+    if not bits:
+        return []
+    digits = '%x' % bits
+    bitmap = bytearray(reversed(bytearray(binascii.unhexlify(('0' if len(digits) % 2 else '') + digits))))
+    indices = []
+    for byte_index, byte in enumerate(bitmap):
+        if byte:
+            for bit in range(8):
+                if byte & (1 << bit):
+                    indices.append(byte_index * 8 + bit)
+    return indices
+
+'''Returns an integer with the given bits set.'''
+def indices_to_int(indices, size):
+    bitmap = bytearray((size + 7) // 8)
+    for index in indices:
+        bitmap[index >> 3] |= 1 << (index & 7)
+    return bitmap_to_int(bitmap)
+
+'''Repeats a pattern of the given width count times, each copy above the last.'''
+def repeat_bits(pattern, width, count):
+    bits, copies = pattern, 1
+    while copies < count:
+        bits |= bits << (width * copies)
+        copies *= 2
+    return bits & ((1 << (width * count)) - 1)
+
+'''
+Set of possible poses of the robot on a grid, stored as one bitboard per direction.
+Bit row * columns + column of a direction's bitboard is set if the robot may be at that node facing that direction.
+Motion and sensor updates are shifts and masks over whole bitboards, so they cost the same however many poses remain.
+'''
+class BeliefState(object):
+    '''Initialises the belief with every reachable node in every direction, taking the masks from the grid's signature index.'''
+    def __init__(self, grid):
+        self.index = grid.signature_index()
+        self.rows = self.index.rows
+        self.columns = self.index.columns
+        self.full = self.index.full
+        self.free = self.index.free
+        self.not_first_column = self.index.not_first_column
+        self.not_last_column = self.index.not_last_column
+        self.border = self.index.border
+        self.blocked = self.index.blocked
+        self.ignored = dict((direction, 0) for direction in DIRECTIONS)
+        self.planes = dict((direction, self.free) for direction in DIRECTIONS)
+
+    '''Makes the poses facing any of the nodes, such as those other robots stand on, agree with either reading, like those facing an unmapped border.'''
+    def ignore_nodes(self, nodes):
+        self.ignored = dict((direction, 0) for direction in DIRECTIONS)
+        for row, column in nodes:
+            for direction in DIRECTIONS:
+                behind = (row - DIRECTION_MAP[direction][0], column - DIRECTION_MAP[direction][1])
+                if 0 <= behind[0] < self.rows and 0 <= behind[1] < self.columns:
+                    self.ignored[direction] |= 1 << (behind[0] * self.columns + behind[1])
+
+    '''Keeps the poses consistent with whether an obstacle was seen in front. Poses facing an unmapped border or an ignored node agree with either reading.'''
+    def observe(self, obstacle_in_front):
+        consistent = self.index.consistent(obstacle_in_front)
+        for direction in DIRECTIONS:
+            self.planes[direction] &= consistent[direction] | self.ignored[direction]
+
+    '''Moves every pose one node forwards, dropping those that leave the reachable nodes.'''
+    def forwards(self):
+        self.planes['up'] = (self.planes['up'] << self.columns) & self.free
+        self.planes['down'] = (self.planes['down'] >> self.columns) & self.free
+        self.planes['right'] = ((self.planes['right'] & self.not_last_column) << 1) & self.free
+        self.planes['left'] = ((self.planes['left'] & self.not_first_column) >> 1) & self.free
+
+    '''Turns every pose left.'''
+    def left(self):
+        self.planes = dict((DIRECTION_TURN_LEFT[direction], plane) for direction, plane in self.planes.items())
+
+    '''Turns every pose right.'''
+    def right(self):
+        self.planes = dict((DIRECTION_TURN_RIGHT[direction], plane) for direction, plane in self.planes.items())
+
+    '''Applies a movement to every pose.'''
+    def apply(self, movement):
+        if movement == 'forwards':
+            self.forwards()
+        elif movement == 'left':
+            self.left()
+        elif movement == 'right':
+            self.right()
+
+    '''Returns if some pose faces an unmapped border. It agrees with a clear reading, so if the robot were in it, moving forwards would drive it off the map.'''
+    def faces_border(self):
+        return any(plane & self.border[direction] & ~self.blocked[direction] for direction, plane in self.planes.items())
+
+    '''Returns if some pose can move forwards without leaving the grid or running into an obstacle, and no pose faces an unmapped border.'''
+    def can_move_forwards(self):
+        if self.faces_border():
+            return False
+        return any(plane & ~self.border[direction] & ~self.blocked[direction] & ~self.ignored[direction] for direction, plane in self.planes.items())
+
+    '''Returns a copy of the belief that can be changed independently.'''
+    def copy(self):
+        belief = copy.copy(self)
+        belief.planes = dict(self.planes)
+        return belief
+
+    '''
+    Returns the expected number of poses left after making a movement and taking a reading.
+    Each reading is weighted by the share of poses that definitely expect it; poses facing an unmapped border or an ignored node survive either reading.
+    This way an expected reduction is always realised, so choosing by it cannot go round in circles.
+    '''
+    def expected_count(self, movement):
+        belief = self.copy()
+        belief.apply(movement)
+        blocked = clear = border = 0
+        for direction, plane in belief.planes.items():
+            expect_blocked = self.blocked[direction] & ~self.ignored[direction]
+            expect_either = (self.border[direction] | self.ignored[direction]) & ~expect_blocked
+            blocked += popcount(plane & expect_blocked)
+            border += popcount(plane & expect_either)
+            clear += popcount(plane & ~expect_blocked & ~expect_either)
+        if not blocked + clear:
+            return float(border)
+        return (blocked * (blocked + border) + clear * (clear + border)) / float(blocked + clear)
+
+    '''Returns the number of possible poses.'''
+    def count(self):
+        return sum(popcount(plane) for plane in self.planes.values())
+
+    '''Returns the number of poses, which expected_count is measured against.'''
+    def effective_count(self):
+        return float(self.count())
+
+    '''Returns the fraction of the belief held by the most likely pose.'''
+    def confidence(self):
+        count = self.count()
+        return 1.0 / count if count else 0.0
+
+    '''Returns if a single pose remains.'''
+    def localised(self, confidence_threshold = 1.0):
+        return self.count() <= 1
+
+    '''Returns the only remaining pose, or None if there is not exactly one.'''
+    def best_pose(self):
+        poses = self.poses() if self.count() == 1 else []
+        return poses[0] if poses else None
+
+    '''Returns the possible poses as (row, column, direction) tuples.'''
+    def poses(self):
+        poses = []
+        for direction in DIRECTIONS:
+            plane = self.planes[direction]
+            while plane:
+                lowest = plane & -plane
+                row, column = divmod(lowest.bit_length() - 1, self.columns)
+                poses.append((row, column, direction))
+                plane ^= lowest
+        return poses
+
+'''Probabilities of the proximity sensor reporting an obstacle in front.'''
+class SensorModel(object):
+    '''
+    Initialises the model with the chance of a reading when something is in front, when nothing is, and when facing an unmapped border.
+    A border_rate of None makes a pose facing an unmapped border agree with either reading as well as the best matching pose,
+    so a robot facing an open edge is not talked out of the pose it is in by readings that keep coming back clear.
+    '''
+    def __init__(self, hit_rate = 0.9, false_alarm_rate = 0.1, border_rate = None):
+        self.hit_rate = hit_rate
+        self.false_alarm_rate = false_alarm_rate
+        self.border_rate = border_rate
+
+    '''Returns the probability of a reading given what is expected in front of the pose.'''
+    def likelihood(self, obstacle_in_front, expected):
+        if expected == 'border' and self.border_rate is None:
+            return max(self.likelihood(obstacle_in_front, 'blocked'), self.likelihood(obstacle_in_front, 'clear'))
+        rate = {'blocked': self.hit_rate, 'clear': self.false_alarm_rate, 'border': self.border_rate}[expected]
+        return rate if obstacle_in_front else 1.0 - rate
+
+'''Probabilities of the robot's movements succeeding.'''
+class MotionModel(object):
+    '''Initialises the model with the chance of a forwards move and of a turn actually happening.'''
+    def __init__(self, forwards_success = 0.95, turn_success = 0.98):
+        self.forwards_success = forwards_success
+        self.turn_success = turn_success
+
+'''
+Histogram filter over the poses of the robot, tolerant of noisy readings and failed movements.
+The belief is a sparse dict from (row, column, direction) to probability; poses below min_probability are dropped.
+'''
+class HistogramBelief(object):
+    '''Initialises a uniform belief over every reachable node in every direction.'''
+    def __init__(self, grid, sensor_model = None, motion_model = None, min_probability = 1e-6):
+        self.grid = grid
+        self.sensor_model = sensor_model or SensorModel()
+        self.motion_model = motion_model or MotionModel()
+        self.min_probability = min_probability
+        self.index = grid.signature_index()
+        self.free = self.index.free_nodes
+        self.ignored = set([])
+        self.reset()
+
+    '''Spreads the belief uniformly over every reachable pose.'''
+    def reset(self):
+        probability = 1.0 / (len(self.free) * len(DIRECTIONS)) if self.free else 0.0
+        self.probabilities = dict(((row, column, direction), probability) for row, column in self.free for direction in DIRECTIONS)
+
+    '''Returns the node in front of a pose.'''
+    def front(self, pose):
+        return (pose[0] + DIRECTION_MAP[pose[2]][0], pose[1] + DIRECTION_MAP[pose[2]][1])
+
+    '''Makes the poses facing any of the nodes, such as those other robots stand on, expect either reading, like those facing an unmapped border.'''
+    def ignore_nodes(self, nodes):
+        self.ignored = set(tuple(node) for node in nodes)
+
+    '''Returns whether a pose expects an obstacle in front ('blocked'), nothing ('clear') or an unmapped border or ignored node ('border').'''
+    def expected(self, pose):
+        if self.ignored and self.front(pose) in self.ignored:
+            return 'border'
+        return self.index.signature(pose)
+
+    '''Weights every pose by the likelihood of a reading.'''
+    def observe(self, obstacle_in_front):
+        likelihood = self.sensor_model.likelihood
+        self.probabilities = dict((pose, probability * likelihood(obstacle_in_front, self.expected(pose))) for pose, probability in self.probabilities.items())
+        self.normalise()
+
+    '''Moves the belief forwards, allowing for the move failing.'''
+    def forwards(self):
+        success = self.motion_model.forwards_success
+        probabilities = defaultdict(float)
+        for pose, probability in self.probabilities.items():
+            front = self.front(pose)
+            if front in self.free:
+                probabilities[(front[0], front[1], pose[2])] += probability * success
+                probabilities[pose] += probability * (1.0 - success)
+            elif self.expected(pose) == 'blocked':
+                probabilities[pose] += probability
+            else:
+                probabilities[pose] += probability * (1.0 - success)
+        self.probabilities = probabilities
+        self.normalise()
+
+    '''Turns the belief using a table of turns, allowing for the turn failing.'''
+    def turn(self, turns):
+        success = self.motion_model.turn_success
+        probabilities = defaultdict(float)
+        for pose, probability in self.probabilities.items():
+            probabilities[(pose[0], pose[1], turns[pose[2]])] += probability * success
+            probabilities[pose] += probability * (1.0 - success)
+        self.probabilities = probabilities
+        self.normalise()
+
+    '''Turns the belief left.'''
+    def left(self):
+        self.turn(DIRECTION_TURN_LEFT)
+
+    '''Turns the belief right.'''
+    def right(self):
+        self.turn(DIRECTION_TURN_RIGHT)
+
+    '''Applies a movement to the belief.'''
+    def apply(self, movement):
+        if movement == 'forwards':
+            self.forwards()
+        elif movement == 'left':
+            self.left()
+        elif movement == 'right':
+            self.right()
+
+    '''Scales the belief to sum to one, dropping unlikely poses. Starts again from a uniform belief if nothing is left.'''
+    def normalise(self):
+        total = sum(self.probabilities.values())
+        if total <= 0.0:
+            self.reset()
+            return
+        threshold = self.min_probability * total
+        self.probabilities = dict((pose, probability / total) for pose, probability in self.probabilities.items() if probability > threshold)
+
+    '''Returns a copy of the belief that can be changed independently.'''
+    def copy(self):
+        belief = copy.copy(self)
+        belief.probabilities = dict(self.probabilities)
+        return belief
+
+    '''Returns the expected effective number of poses, one over the sum of squared probabilities, after making a movement and taking a reading.'''
+    def expected_count(self, movement):
+        belief = self.copy()
+        belief.apply(movement)
+        expected = 0.0
+        for obstacle_in_front in (True, False):
+            weights = [probability * self.sensor_model.likelihood(obstacle_in_front, belief.expected(pose)) for pose, probability in belief.probabilities.items()]
+            total = sum(weights)
+            if total > 0.0:
+                expected += total * total / sum(weight * weight for weight in weights)
+        return expected
+
+    '''Returns if some pose still considered faces an unmapped border, past which the robot could drive off the map.'''
+    def faces_border(self):
+        return any(self.index.signature(pose) == 'border' for pose in self.probabilities)
+
+    '''Returns if the most likely pose can move forwards and no pose still considered faces an unmapped border.'''
+    def can_move_forwards(self):
+        pose = self.best_pose()
+        if pose is None or self.expected(pose) != 'clear':
+            return False
+        return not self.faces_border()
+
+    '''Returns the number of poses still considered.'''
+    def count(self):
+        return len(self.probabilities)
+
+    '''Returns the effective number of poses, one over the sum of squared probabilities.'''
+    def effective_count(self):
+        return 1.0 / sum(probability * probability for probability in self.probabilities.values()) if self.probabilities else 0.0
+
+    '''Returns the probability of the most likely pose.'''
+    def confidence(self):
+        return max(self.probabilities.values()) if self.probabilities else 0.0
+
+    '''Returns if the most likely pose is at least as likely as the threshold.'''
+    def localised(self, confidence_threshold = 0.95):
+        return self.confidence() >= confidence_threshold
+
+    '''Returns the most likely pose.'''
+    def best_pose(self):
+        if not self.probabilities:
+            return None
+        return max(self.probabilities.items(), key = lambda item: item[1])[0]
+
+    '''Returns the poses still considered.'''
+    def poses(self):
+        return list(self.probabilities)
@@ -0,0 +1,194 @@
+'''File containing the benchmark harness for mapping, localisation and path planning.'''
+import argparse, json, os, platform, random, sys, time, traceback
+from itertools import islice
+from timeit import default_timer
+from grid import Grid
+from robot_handler import RobotHandler
+from simulator import SimulatedRobot, random_obstacles
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Constants
+DEFAULT_SIZES = [5, 10, 50, 100, 500, 1000, 2000]
+OPERATIONS = ['make_grid', 'connected_nodes', 'bfs', 'path2directions', 'map', 'localise']
+LOCALISATION_MAX_MOVES = 1000
+
+'''
+Measures the wall time and peak memory of a call.
+Without tracemalloc the peak memory is how far the peak RSS of the process grew during the call,
+which only means something when the call runs in a fresh process; see isolated.
+'''
+class Measurement(object):
+    '''Starts measuring.'''
+    def __enter__(self):
+        if tracemalloc:
+            tracemalloc.start()
+        elif resource:
+            self.start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.start = default_timer()
+        return self
+
+    '''Stops measuring.'''
+    def __exit__(self, *exc_info):
+        self.seconds = default_timer() - self.start
+        if tracemalloc:
+            self.peak_memory_kb = tracemalloc.get_traced_memory()[1] / 1024.0
+            tracemalloc.stop()
+        elif resource:
+            self.peak_memory_kb = float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.start_rss)
+        else:
+            self.peak_memory_kb = None
+
+'''
+Calls a function and returns its result, which must be JSON serialisable.
+Without tracemalloc the call runs in a forked child, whose peak RSS starts from its current RSS rather than the highest
+the benchmark has reached so far, so the growth Measurement reports belongs to that call alone.
+Raises RuntimeError if the child fails.
+'''
+def isolated(function):
+    if tracemalloc or not hasattr(os, 'fork'):
+        return function()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            output = json.dumps({'result': function()})
+        except BaseException:
+            output = json.dumps({'error': traceback.format_exc()})
+        with os.fdopen(write_end, 'w') as pipe:
+            pipe.write(output)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        output = pipe.read()
+    os.waitpid(pid, 0)
+    if not output:
+        raise RuntimeError('The benchmark child process died without a result.')
+    output = json.loads(output)
+    if 'error' in output:
+        raise RuntimeError('The benchmark child process failed:\n' + output['error'])
+    return output['result']
+
+'''Returns a grid of the given size with its start node in the centre.'''
+def make_grid(size):
+    grid = Grid(500, 500)
+    grid.set_grid_rows(size)
+    grid.set_grid_cols(size)
+    grid.set_start((size // 2, size // 2))
+    grid.make_grid()
+    return grid
+
+'''Sets up a map for one operation, runs the operation on its own and returns its result record.'''
+def run_operation(operation, size, obstacles, seed):
+    generator = random.Random(seed)
+    record = {'operation': operation, 'size': size, 'obstacles': len(obstacles), 'seed': seed, 'moves': None, 'expansions': None}
+    if operation == 'make_grid':
+        record.update(isolated(lambda: measure_make_grid(size)))
+        return record
+    grid = make_grid(size)
+    # The simulated robot is walled in at the edges of its world.
+    grid.walls_at_border = True
+    simulator = SimulatedRobot(size, size, obstacles, location = grid.start_node)
+    if operation != 'map':
+        for obstacle in obstacles:
+            grid.obstacles.add(obstacle)
+    # The reachable nodes are kept one byte per cell, so the heap is left with little freed memory for the operation to reuse unseen.
+    reachable = grid.nodes.flood_marks(grid.start_node, grid.obstacles) if operation in ('bfs', 'path2directions', 'localise') else None
+    goal = next(islice(reachable, generator.randrange(len(reachable)), None)) if reachable else None
+    path = grid.bfs(grid.start_node, goal) if operation == 'path2directions' else None
+    if operation == 'localise':
+        simulator.location = goal
+        simulator.direction = generator.choice(['up', 'right', 'down', 'left'])
+        grid.set_localisation_policy('active')
+        grid.localisation_max_moves = LOCALISATION_MAX_MOVES
+    record.update(isolated(lambda: measure_operation(operation, grid, simulator, goal, path)))
+    return record
+
+'''Measures making a grid and returns the measurements.'''
+def measure_make_grid(size):
+    with Measurement() as measurement:
+        make_grid(size)
+    return {'seconds': measurement.seconds, 'peak_memory_kb': measurement.peak_memory_kb}
+
+'''Measures an operation on a grid set up by run_operation and returns the measurements, moves and expansions.'''
+def measure_operation(operation, grid, simulator, goal, path):
+    robot = RobotHandler(simulator)
+    expansions = grid.planner.expansions
+    with Measurement() as measurement:
+        if operation == 'connected_nodes':
+            grid.connected_nodes(grid.start_node)
+        elif operation == 'bfs':
+            grid.bfs(grid.start_node, goal)
+        elif operation == 'path2directions':
+            robot.path2directions(path, grid.current_direction)
+        elif operation == 'map':
+            grid.mapping = True
+            grid.map(robot)
+        elif operation == 'localise':
+            grid.localising = True
+            grid.localise(robot)
+    robot.close()
+    result = {
+        'seconds': measurement.seconds,
+        'peak_memory_kb': measurement.peak_memory_kb,
+        'expansions': grid.planner.expansions - expansions,
+        'moves': simulator.forwards + simulator.turns
+    }
+    if operation == 'localise':
+        result['localised'] = grid.current_location == simulator.location and grid.current_direction == simulator.direction
+    return result
+
+'''Runs every selected operation on every map size and returns the result records.'''
+def run(sizes, operations, density, seed, limits):
+    records = []
+    for size in sizes:
+        obstacles = random_obstacles(size, size, density, seed, keep = [(size // 2, size // 2)])
+        for operation in operations:
+            if size > limits.get(operation, size):
+                continue
+            record = run_operation(operation, size, obstacles, seed)
+            records.append(record)
+            print('%-16s %5dx%-5d %10.4fs %12s KB %8s moves %10s expansions' % (operation, size, size, record['seconds'], '%.0f' % record['peak_memory_kb'] if record['peak_memory_kb'] is not None else '-', record['moves'], record['expansions']))
+            sys.stdout.flush()
+    return records
+
+'''Parses the command line, runs the benchmarks and writes the results as JSON.'''
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark mapping, localisation and path planning on random maps against a simulated robot.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = DEFAULT_SIZES, help = 'side lengths of the square maps')
+    parser.add_argument('--operations', nargs = '+', choices = OPERATIONS, default = OPERATIONS)
+    parser.add_argument('--density', type = float, default = 0.2, help = 'fraction of cells that are obstacles')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--max-search-size', type = int, default = 1000, help = 'largest map for connected_nodes, bfs and path2directions')
+    parser.add_argument('--max-localise-size', type = int, default = 500, help = 'largest map for localise')
+    parser.add_argument('--max-map-size', type = int, default = 50, help = 'largest map for map, which drives the simulated robot over every cell')
+    parser.add_argument('--output', default = 'benchmark.json', help = 'file to write the JSON results to')
+    args = parser.parse_args(argv)
+    limits = {
+        'connected_nodes': args.max_search_size,
+        'bfs': args.max_search_size,
+        'path2directions': args.max_search_size,
+        'localise': args.max_localise_size,
+        'map': args.max_map_size
+    }
+    records = run(args.sizes, args.operations, args.density, args.seed, limits)
+    with open(args.output, 'w') as output:
+        json.dump({
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'density': args.density,
+            'seed': args.seed,
+            'memory': 'tracemalloc' if tracemalloc else 'peak rss growth' if resource else None,
+            'results': records
+        }, output, indent = 2, sort_keys = True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+'''File containing the sparse chunked grid used as the node store of unbounded maps.'''
+from collections import deque
+from occupancy_grid import ABSENT, PRESENT, PRESENT_BYTE, NEIGHBOUR_OFFSETS
+
+# Constants
+CHUNK_SIZE = 32
+
+'''
+Stores the nodes of a map with no fixed size in square chunks of CHUNK_SIZE x CHUNK_SIZE bytes, allocated as nodes are added.
+Rows and columns may be negative. A chunk is freed when its last node is removed, so memory follows the area explored.
+The object behaves like OccupancyGrid for membership, neighbours, flood fills and iteration.
+'''
+class ChunkedGrid(object):
+    '''Initialises an empty grid.'''
+    def __init__(self, chunk_size = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.counts = {}
+        self.size = 0
+        # Nodes taken off the queue by flood fills, counted like the expansions of a planner.
+        self.expansions = 0
+
+    '''Returns the chunk holding a node and the index of the node inside it.'''
+    def locate(self, node):
+        chunk_row, row = divmod(node[0], self.chunk_size)
+        chunk_column, column = divmod(node[1], self.chunk_size)
+        return (chunk_row, chunk_column), row * self.chunk_size + column
+
+    '''Adds a node, allocating its chunk if needed.'''
+    def add(self, node):
+        key, index = self.locate(node)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = bytearray(self.chunk_size * self.chunk_size)
+            self.counts[key] = 0
+        if not chunk[index]:
+            chunk[index] = PRESENT
+            self.counts[key] += 1
+            self.size += 1
+
+    '''Removes a node if it is present, freeing its chunk if it was the last one.'''
+    def discard(self, node):
+        key, index = self.locate(node)
+        chunk = self.chunks.get(key)
+        if chunk is not None and chunk[index]:
+            chunk[index] = ABSENT
+            self.size -= 1
+            self.counts[key] -= 1
+            if not self.counts[key]:
+                del self.chunks[key]
+                del self.counts[key]
+
+    '''Returns the present 4-neighbours of a node.'''
+    def neighbours(self, node):
+        row, column = node
+        return [(row + row_diff, column + column_diff) for row_diff, column_diff in NEIGHBOUR_OFFSETS if (row + row_diff, column + column_diff) in self]
+
+    '''Returns the nodes reachable from start without passing through a blocked node.'''
+    def flood_fill(self, start, blocked = ()):
+        start = tuple(start)
+        if not start in self:
+            return set([])
+        reached = set([start])
+        queue = deque([start])
+        while queue:
+            self.expansions += 1
+            for neighbour in self.neighbours(queue.popleft()):
+                if not neighbour in reached and not neighbour in blocked:
+                    reached.add(neighbour)
+                    queue.append(neighbour)
+        return reached
+
+    '''Returns an empty grid with the same chunk size, which serves as a compact set of nodes.'''
+    def empty_copy(self):
+        return ChunkedGrid(self.chunk_size)
+
+    '''Returns the nodes reachable from start without passing through a blocked node, as a grid holding only them.'''
+    def flood_marks(self, start, blocked = ()):
+        marks = self.empty_copy()
+        for node in self.flood_fill(start, blocked):
+            marks.add(node)
+        return marks
+
+    '''Returns the first row, first column, number of rows and number of columns of the smallest rectangle holding every node, or None if there are none.'''
+    def bounds(self):
+        if not self.size:
+            return None
+        rows = [row for row, _ in self]
+        columns = [column for _, column in self]
+        return min(rows), min(columns), max(rows) - min(rows) + 1, max(columns) - min(columns) + 1
+
+    '''Returns the neighbours of a node as a set, like the old dict of sets.'''
+    def __getitem__(self, node):
+        if not node in self:
+            raise KeyError(node)
+        return set(self.neighbours(node))
+
+    '''Returns if a node is present.'''
+    def __contains__(self, node):
+        key, index = self.locate(node)
+        chunk = self.chunks.get(key)
+        return chunk is not None and chunk[index] == PRESENT
+
+    '''Returns the number of nodes.'''
+    def __len__(self):
+        return self.size
+
+    '''Iterates over the present nodes, chunk by chunk in row-major order.'''
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            first_row, first_column = key[0] * self.chunk_size, key[1] * self.chunk_size
+            index = chunk.find(PRESENT_BYTE)
+            while index != -1:
+                row, column = divmod(index, self.chunk_size)
+                yield (first_row + row, first_column + column)
+                index = chunk.find(PRESENT_BYTE, index + 1)
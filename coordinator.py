@@ -0,0 +1,163 @@
+'''File containing the coordinator driving several robots over one shared grid.'''
+from collections import deque
+from threading import Thread
+
+# Constants
+TASK_FLAGS = {
+    'map': 'mapping',
+    'localise': 'localising',
+    'return_to_start': 'returning'
+}
+# Tasks run on one robot at a time, so the others stand still where they were last seen.
+SEQUENTIAL_TASKS = ('localise',)
+
+'''
+Drives several robots at once over a shared grid.
+The first robot uses the grid itself; every other robot gets a grid from Grid.add_robot that shares the map but has its own pose.
+Each task runs every robot on its own thread. While mapping, the robots claim different frontiers and never drive into each other.
+Localising is the exception: the robots take turns, since one robot can only tell a teammate in front from an obstacle if the teammate keeps still.
+So is returning, where the first robot goes first, since its teammates come home to the nodes around the start and could shut it out.
+'''
+class Coordinator(object):
+    '''
+    Initialises the coordinator for a grid and a list of robot handlers.
+    Takes poses as an optional argument: the (location, direction) of every robot after the first.
+    By default they stand on the nodes nearest the start node, facing the same way as the first robot.
+    '''
+    def __init__(self, grid, robots, poses = None):
+        self.grid = grid
+        self.robots = list(robots)
+        self.poses = poses
+        self.grids = [grid]
+        self.threads = []
+        self.stopped = False
+
+    '''Places the robots on the grid. Call it again whenever the map is made or loaded anew.'''
+    def place(self):
+        del self.grid.team[1:]
+        self.grid.claims.clear()
+        poses = self.poses if self.poses is not None else self.default_poses()
+        self.grids = [self.grid] + [self.grid.add_robot(location, direction) for location, direction in poses[:len(self.robots) - 1]]
+        if len(self.grids) < len(self.robots):
+            raise ValueError('There is only room for %d of the %d robots.' % (len(self.grids), len(self.robots)))
+
+    '''Returns poses on the free nodes nearest the start node, in breadth first order.'''
+    def default_poses(self):
+        start = self.grid.start_node
+        seen = set([start])
+        queue = deque([start])
+        poses = []
+        while queue and len(poses) < len(self.robots) - 1:
+            node = queue.popleft()
+            for neighbour in self.grid.planner.neighbours(node):
+                if not neighbour in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+                    poses.append((neighbour, self.grid.current_direction))
+        return poses[:len(self.robots) - 1]
+
+    '''
+    Runs a task ('map', 'localise' or 'return_to_start') on every robot, returning when all of them have finished.
+    Tasks in SEQUENTIAL_TASKS run on one robot after another, skipping those stopped before their turn, and the others at once.
+    '''
+    def run(self, task):
+        flag = TASK_FLAGS[task]
+        self.threads = []
+        self.stopped = False
+        for grid in self.grids:
+            setattr(grid, flag, True)
+        if task == 'return_to_start':
+            self.return_in_turn()
+            return
+        if task in SEQUENTIAL_TASKS:
+            for grid, robot in zip(self.grids, self.robots):
+                if getattr(grid, flag):
+                    getattr(grid, task)(robot)
+            return
+        for grid, robot in zip(self.grids, self.robots):
+            thread = Thread(target = getattr(grid, task), args = (robot,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        for thread in self.threads:
+            thread.join()
+
+    '''
+    Returns the robots home one at a time, the first robot first. The others stand still meanwhile, so waiting for them is pointless:
+    a robot whose way they block stops at once and gets another turn after they have moved.
+    A robot sits the round out if, once it is home, the others could no longer come home in any order,
+    as when a teammate would take the last way into the start. If that holds every robot back, the next round lets them go in order regardless.
+    Rounds go on until every robot is home, the task is stopped or a whole round moves no robot.
+    '''
+    def return_in_turn(self):
+        pending = zip(self.grids, self.robots)
+        in_order = False
+        while pending and not self.stopped:
+            moved = False
+            waiting = []
+            for grid, robot in pending:
+                if self.stopped:
+                    break
+                if not in_order and not self.leaves_way_home(grid, pending):
+                    waiting.append((grid, robot))
+                    continue
+                location = grid.current_location
+                grid.return_to_start(robot, patience = 0)
+                moved = moved or grid.current_location != location
+                if grid.current_location != grid.home_node():
+                    waiting.append((grid, robot))
+            if not moved and in_order:
+                break
+            in_order = not moved
+            pending = waiting
+            for grid, robot in pending:
+                grid.returning = True
+        for grid in self.grids:
+            grid.returning = False
+
+    '''
+    Returns if, once a robot is home, the other robots still out could come home one after another in some order,
+    each past the homes filled before it. Robots standing anywhere else are taken to move out of the way.
+    Robots that cannot reach their homes even now are left out.
+    '''
+    def leaves_way_home(self, grid, pending):
+        filled = set(other.home_node() for other in self.grids if other.current_location == other.home_node())
+        out = [other for other, _ in pending if other is not grid and other.current_location != other.home_node() and self.reaches_home(other, filled)]
+        return self.orderable(out, filled | set([grid.home_node()]), {})
+
+    '''Returns if robots can come home one after another in some order, past the homes already filled. Known answers are kept by the homes filled.'''
+    def orderable(self, robots, filled, known):
+        if not robots:
+            return True
+        key = frozenset(filled)
+        if not key in known:
+            known[key] = any(self.reaches_home(robot, filled) and self.orderable([other for other in robots if other is not robot], filled | set([robot.home_node()]), known) for robot in robots)
+        return known[key]
+
+    '''Returns if a robot can reach its home without passing through any of the filled homes.'''
+    def reaches_home(self, grid, filled):
+        home = grid.home_node()
+        return self.grid.planner.nearest(grid.current_location, lambda node: node == home, filled) is not None
+
+    '''Maps the environment with every robot.'''
+    def map(self):
+        self.run('map')
+
+    '''Localises every robot.'''
+    def localise(self):
+        self.run('localise')
+
+    '''Returns every robot to the start node.'''
+    def return_to_start(self):
+        self.run('return_to_start')
+
+    '''Returns if any robot is busy with a task.'''
+    def busy(self):
+        return any(getattr(grid, flag) for grid in self.grids for flag in TASK_FLAGS.values())
+
+    '''Asks every robot to stop its task.'''
+    def stop(self):
+        self.stopped = True
+        for grid in self.grids:
+            for flag in TASK_FLAGS.values():
+                setattr(grid, flag, False)
@@ -0,0 +1,30 @@
+'''File containing the directions the robot can face and the tables for stepping and turning between them.'''
+
+# Constants
+# Clockwise from up.
+DIRECTIONS = ('up', 'right', 'down', 'left')
+DIRECTION_MAP = {
+    'up': (1, 0),
+    'right': (0, 1),
+    'down': (-1, 0),
+    'left': (0, -1)
+}
+STEP_DIRECTIONS = dict((step, direction) for direction, step in DIRECTION_MAP.items())
+DIRECTION_TURN_RIGHT = {
+    'up': 'right',
+    'right': 'down',
+    'down': 'left',
+    'left': 'up'
+}
+DIRECTION_TURN_LEFT = {
+    'up': 'left',
+    'left': 'down',
+    'down': 'right',
+    'right': 'up'
+}
+OPPOSITE_DIRECTIONS = {
+    'up': 'down',
+    'left': 'right',
+    'down': 'up',
+    'right': 'left'
+}
@@ -1,58 +1,54 @@
 '''File containing the grid class and search class.'''
-import random, math
-from time import sleep
+import random, math, copy
+from itertools import takewhile
+from Queue import Queue
+from threading import Lock
+from occupancy_grid import OccupancyGrid
+from chunked_grid import ChunkedGrid
+from obstacle_index import ObstacleIndex
+from path_planner import PathPlanner
+from reachability import ReachabilityTracker
+from map_store import SavedMap, read_map, write_map
+from directions import DIRECTION_MAP, DIRECTION_TURN_LEFT, DIRECTION_TURN_RIGHT, OPPOSITE_DIRECTIONS
+from belief import BeliefState, HistogramBelief, SensorModel, MotionModel
+from signature_index import SignatureIndex
+from hierarchy import BlockMap
+from incremental_planner import DStarLite
+from instrumentation import instruments
 
 # Constants
-DIRECTION_MAP = {
-    'up': (1, 0),
-    'right': (0, 1),
-    'down': (-1, 0),
-    'left': (0, -1)
-}
-DIRECTION_TURN_RIGHT = {
-    'up': 'right',
-    'right': 'down',
-    'down': 'left',
-    'left': 'up'
-}
-DIRECTION_TURN_LEFT = {
-    'up': 'left',
-    'left': 'down',
-    'down': 'right',
-    'right': 'up'
-}
-OPPOSITE_DIRECTIONS = {
-    'up': 'down',
-    'left': 'right',
-    'down': 'up',
-    'right': 'left'
-}
 DIRECTION_TO_ANGLE = {
     'right': 0.0,
     'up': math.pi / 2,
     'left': math.pi,
     'down': math.pi * 3 / 2
 }
-ANGLE_TO_MOVEMENT = {
-    math.pi * 3 / 2: ['right'],
-    math.pi: ['right', 'right'],
-    math.pi / 2: ['left'],
-    0: [],
-    - math.pi / 2: ['right'],
-    - math.pi: ['left, left'],
-    - math.pi * 3 / 2: ['left']
-}
-
+TEAM_WAIT = 0.05
+TASK_RADIUS = 3
+# Grids with more nodes than this plan paths, flood and look for frontiers over the blocks of a BlockMap.
+HIERARCHY_THRESHOLD = 250000
+# How many nodes the search for the nearest frontier expands on such grids before heading for the closest one as the crow flies.
+NEAREST_LIMIT = 4096
+# How many times a robot returning to the start waits for the others to clear its way before giving up.
+RETURN_PATIENCE = 200
 '''Stores the grid in an object.'''
 class Grid(object):
     '''Initialises grid object with the canvas with and height.'''
     def __init__(self, canvas_width, canvas_height):
-        self.nodes = {}
+        self.nodes = OccupancyGrid()
         self.start_node = None
         self.goal_node = None
         self.grid_rows = None
         self.grid_columns = None
-        self.obs_list = []
+        self.unbounded = False
+        self.origin = (0, 0)
+        self.display_size = (0, 0)
+        self.obstacles = ObstacleIndex()
+        self.obstacles.listeners.append(self.obstacle_changed)
+        self.subscribers = []
+        self.planner = PathPlanner(self)
+        self.blocks = BlockMap(self)
+        self.reachability = ReachabilityTracker(self)
         self.node_display_locations={}
         self.canvas_width = float(canvas_width)
         self.canvas_height = float(canvas_height)
@@ -63,7 +59,33 @@ class Grid(object):
         self.returning = False
         self.current_location = self.start_node
         self.current_direction = 'up'
-        self.visited = []
+        self.explorer = FrontierExplorer()
+        self.exploration_stats = {}
+        self.localisation_mode = 'exact'
+        self.sensor_model = SensorModel()
+        self.motion_model = MotionModel()
+        self.confidence_threshold = 0.95
+        self.localisation_confidence = None
+        self.localised = None
+        self.localisation_policy = 'random'
+        # Random movements are drawn from the grid's own generator, so a session replayed from a log with the same seed makes the same choices.
+        self.random = random.Random()
+        self.localisation_lookahead = 4
+        self.localisation_plan = []
+        self.localisation_plan_count = None
+        self.localisation_max_moves = None
+        self.localisation_log = []
+        # Whether the edges of a bounded grid are walls the robot senses. Otherwise what lies beyond an edge is unknown,
+        # so localisation never drives forwards while the robot may face it, and often has to give up.
+        self.walls_at_border = True
+        self.signatures = None
+        self.robot_id = 0
+        self.team = [self]
+        self.team_lock = Lock()
+        self.claims = {}
+        self.reserved = set([])
+        self.home = None
+        self.return_planner = None
 
     '''Sets the number of rows in the grid.'''
     def set_grid_rows(self, rows):
@@ -75,14 +97,113 @@ class Grid(object):
         self.grid_columns = int(cols)
         self.column_width = float(self.canvas_width) / float(self.grid_columns * 2.0 + 1.0)
 
-    '''Adds a node.'''
+    '''
+    Adds a node.
+    Raises ValueError if a bounded grid has no size yet or its size has changed since make_grid, which must be called first.
+    '''
     def add_node(self, name):
-        self.nodes[name] = set([])
+        if not self.unbounded:
+            if self.grid_rows is None or self.grid_columns is None:
+                raise ValueError('Set the rows and columns of the grid and call make_grid before adding node %s.' % (name,))
+            if self.nodes.rows != self.grid_rows or self.nodes.columns != self.grid_columns:
+                raise ValueError('The grid is %dx%d but its nodes were made for %dx%d; call make_grid before adding node %s.' % (self.grid_rows, self.grid_columns, self.nodes.rows, self.nodes.columns, name))
+        self.nodes.add(name)
 
     '''Sets the starting node.'''
     def set_start(self, name):
         self.start_node = name
-        self.current_location = self.start_node
+        self.set_pose(self.start_node, self.current_direction)
+
+    '''Sets the location and direction of the robot.'''
+    def set_pose(self, location, direction):
+        self.current_location = location
+        self.current_direction = direction
+        self.publish('pose', location, direction, self.robot_id)
+
+    '''
+    Returns the grid of another robot at a pose. It shares this grid's map, events and task claims but has its own pose and plans.
+    Add robots once the map has been made, since the copies keep the nodes they were made with.
+    '''
+    def add_robot(self, location, direction = 'up'):
+        grid = copy.copy(self)
+        grid.robot_id = len(self.team)
+        grid.explorer = FrontierExplorer()
+        grid.exploration_stats = {}
+        grid.random = random.Random(self.random.getrandbits(32))
+        grid.localisation_plan = []
+        grid.localisation_log = []
+        grid.reserved = set([])
+        grid.home = location
+        grid.return_planner = None
+        grid.mapping = grid.localising = grid.returning = False
+        self.team.append(grid)
+        grid.set_pose(location, direction)
+        if self.unbounded:
+            self.discover(location)
+        return grid
+
+    '''Returns the nodes the other robots of the team stand on or are about to drive into.'''
+    def occupied(self):
+        with self.team_lock:
+            nodes = set([])
+            for grid in self.team:
+                if grid is not self:
+                    nodes.add(grid.current_location)
+                    nodes |= grid.reserved
+            return nodes
+
+    '''Reserves the nodes the robot is about to drive into. Returns False, reserving nothing, if another robot has one of them.'''
+    def reserve(self, nodes):
+        with self.team_lock:
+            for grid in self.team:
+                if grid is not self and (grid.current_location in nodes or grid.reserved & set(nodes)):
+                    return False
+            self.reserved = set(nodes)
+            return True
+
+    '''Reserves the longest leading part of a run of nodes that no other robot stands on or has reserved. Returns how many nodes it reserved.'''
+    def reserve_run(self, nodes):
+        with self.team_lock:
+            taken = set([])
+            for grid in self.team:
+                if grid is not self:
+                    taken.add(grid.current_location)
+                    taken |= grid.reserved
+            free = list(takewhile(lambda node: not node in taken, nodes))
+            self.reserved = set(free)
+            return len(free)
+
+    '''Claims a node as the robot's next exploration target, dropping its previous claim. Claims None to drop it only.'''
+    def claim(self, node):
+        with self.team_lock:
+            if node is None:
+                self.claims.pop(self.robot_id, None)
+            else:
+                self.claims[self.robot_id] = node
+
+    '''Returns the exploration targets claimed by the other robots.'''
+    def claimed_by_others(self):
+        with self.team_lock:
+            return [node for robot_id, node in self.claims.items() if robot_id != self.robot_id]
+
+    '''Returns a new queue that receives ('cell', node), ('pose', location, direction, robot_id), ('path', path, robot_id), ('localised', localised, robot_id) and ('map',) events as the grid changes.'''
+    def subscribe(self):
+        events = Queue()
+        self.subscribers.append(events)
+        return events
+
+    '''Stops sending events to a queue.'''
+    def unsubscribe(self, events):
+        self.subscribers.remove(events)
+
+    '''Sends an event to every subscriber.'''
+    def publish(self, *event):
+        for events in self.subscribers:
+            events.put(event)
+
+    '''Publishes a cell event when an obstacle is added or removed.'''
+    def obstacle_changed(self, node, added):
+        self.publish('cell', node)
 
     '''Returns the name of the starting node.'''
     def get_start_node(self):
@@ -98,172 +219,477 @@ class Grid(object):
 
     '''Add make two nodes each others' neighbours.'''
     def add_neighbour(self, node1, node2):
-        self.nodes[node1].add(node2)
-        self.nodes[node2].add(node1)
+        if abs(node1[0] - node2[0]) + abs(node1[1] - node2[1]) != 1:
+            raise ValueError('Nodes %s and %s are not 4-adjacent.' % (node1, node2))
+        self.add_node(node1)
+        self.add_node(node2)
 
     '''Initialise the grid.'''
     def make_grid(self):
-        for row in xrange(self.grid_rows):
-            for column in xrange(self.grid_columns):
-                if not [row, column] in self.obs_list:
-                    self.add_node((row, column))
-
-        for row in xrange(self.grid_rows):
-            for column in xrange(self.grid_columns):
-                if not [row, column] in self.obs_list:
-                    difference = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-                    for diff in difference:
-                        neighbour_row, neighbour_column = map(lambda x, y: x + y, (row, column), diff)
-                        if 0 <= neighbour_row < self.grid_rows and 0 <= neighbour_column < self.grid_columns and not [neighbour_row, neighbour_column] in self.obs_list:
-                            self.add_neighbour((row, column), (neighbour_row, neighbour_column))
-
-    '''Compute where to display the grid.'''
+        self.unbounded = False
+        self.origin = (0, 0)
+        self.nodes = OccupancyGrid(self.grid_rows, self.grid_columns)
+        self.nodes.fill()
+        self.obstacles.resize(self.grid_rows, self.grid_columns)
+        for obstacle in self.obstacles:
+            self.nodes.discard(obstacle)
+
+    '''
+    Initialises an unbounded grid holding only the start node, which must be set first, and its neighbours.
+    Mapping adds the neighbours of every node the robot visits, so the map grows as it is explored, in any direction.
+    It ends once the robot has been everywhere inside the obstacles found; in an open space it goes on until stopped.
+    '''
+    def make_unbounded_grid(self):
+        self.unbounded = True
+        self.grid_rows = self.grid_columns = None
+        self.nodes = ChunkedGrid()
+        self.obstacles.resize(0, 0)
+        self.node_display_locations = {}
+        self.discover(self.start_node)
+
+    '''Adds a node and its neighbours to an unbounded grid, unless they are already nodes.'''
+    def discover(self, location):
+        with self.team_lock:
+            for node in [tuple(location)] + [(location[0] + row_diff, location[1] + column_diff) for row_diff, column_diff in DIRECTION_MAP.values()]:
+                if not node in self.nodes:
+                    self.nodes.add(node)
+                    self.reachability.add_node(node)
+                    self.publish('cell', node)
+
+    '''
+    Turns an unbounded grid into an ordinary one just large enough for the nodes found so far,
+    shifting every node, pose and obstacle so the first row and column are 0. Publishes a ('map',) event.
+    Returns the (row, column) shift, which is (0, 0) for a grid that is already bounded.
+    Localising and saving need a bounded grid, so they call this first.
+    '''
+    def bound(self):
+        with self.team_lock:
+            if not self.unbounded or not len(self.nodes):
+                return (0, 0)
+            first_row, first_column, rows, columns = self.nodes.bounds()
+            shift = lambda node: (node[0] - first_row, node[1] - first_column) if node is not None else None
+            nodes = OccupancyGrid(rows, columns)
+            for node in self.nodes:
+                nodes.add(shift(node))
+            bits = bytearray((rows * columns + 7) // 8)
+            outside = []
+            for node in self.obstacles:
+                row, column = shift(node)
+                if 0 <= row < rows and 0 <= column < columns:
+                    bits[(row * columns + column) >> 3] |= 1 << ((row * columns + column) & 7)
+                else:
+                    outside.append((row, column))
+            self.obstacles.load(rows, columns, bits, outside, self.obstacles.version + 1)
+            self.claims.clear()
+            for grid in self.team:
+                grid.unbounded = False
+                grid.origin = (0, 0)
+                grid.nodes = nodes
+                grid.set_grid_rows(rows)
+                grid.set_grid_cols(columns)
+                grid.node_display_locations = {}
+                grid.start_node = shift(grid.start_node)
+                grid.home = shift(grid.home)
+                grid.set_pose(shift(grid.current_location), grid.current_direction)
+        self.publish('map')
+        return (-first_row, -first_column)
+
+    '''Saves the grid dimensions, start node and obstacles to a file. An unbounded grid is bounded first.'''
+    def save_map(self, filename):
+        self.bound()
+        rows, columns, version, bits, outside = self.obstacles.dump()
+        write_map(filename, SavedMap(rows, columns, self.start_node, version, bits, outside))
+
+    '''
+    Replaces the grid with one saved by save_map, so it can be used without mapping it again.
+    Publishes a ('map',) event, after which subscribers should redraw everything.
+    '''
+    def load_map(self, filename):
+        saved_map = read_map(filename)
+        self.set_grid_rows(saved_map.rows)
+        self.set_grid_cols(saved_map.columns)
+        self.obstacles.load(saved_map.rows, saved_map.columns, saved_map.bits, saved_map.outside, saved_map.version)
+        self.unbounded = False
+        self.origin = (0, 0)
+        nodes = OccupancyGrid(saved_map.rows, saved_map.columns)
+        nodes.fill_except(saved_map.bits)
+        self.nodes = nodes
+        self.node_display_locations = {}
+        self.set_start(saved_map.start)
+        self.publish('map')
+
+    '''
+    Returns the first row, first column, number of rows and number of columns of the area to display.
+    For an unbounded grid this is the nodes found so far with half as much again on every side,
+    so the map can grow for a while before it has to be laid out again, and each layout doubles the room.
+    '''
+    def display_area(self):
+        if not self.unbounded:
+            return (0, 0, self.grid_rows, self.grid_columns)
+        first_row, first_column, rows, columns = self.nodes.bounds()
+        row_margin, column_margin = rows // 2 + 1, columns // 2 + 1
+        return (first_row - row_margin, first_column - column_margin, rows + 2 * row_margin, columns + 2 * column_margin)
+
+    '''Compute where to display the grid. An unbounded grid is fitted to its display area.'''
     def compute_node_locations(self):
+        if self.unbounded:
+            first_row, first_column, rows, columns = self.display_area()
+            self.origin = (first_row, first_column)
+            self.display_size = (rows, columns)
+            self.row_height = float(self.canvas_height) / float(rows * 2.0 + 1.0)
+            self.column_width = float(self.canvas_width) / float(columns * 2.0 + 1.0)
+            self.node_display_locations = {}
         for node in self.nodes:
-            x = self.column_width * (2.0 * float(node[1]) + 1.5)
-            y = self.canvas_height - self.row_height * (2.0 * float(node[0]) + 1.5)
-            self.node_display_locations[node] = (x, y)
+            self.locate_node(node)
+
+    '''Computes where to display a node. Returns False if it lies outside the area laid out by compute_node_locations.'''
+    def locate_node(self, node):
+        if self.unbounded and not (0 <= node[0] - self.origin[0] < self.display_size[0] and 0 <= node[1] - self.origin[1] < self.display_size[1]):
+            return False
+        x = self.column_width * (2.0 * float(node[1] - self.origin[1]) + 1.5)
+        y = self.canvas_height - self.row_height * (2.0 * float(node[0] - self.origin[0]) + 1.5)
+        self.node_display_locations[node] = (x, y)
+        return True
 
     '''Map the entire grid.'''
     def map(self, robot):
-        count = 1
-        while self.mapping:
-            self.visited.append(self.current_location)
-            if count % 5 == 0:
-                pass
-                if set(self.visited) == set(self.connected_nodes(self.start_node)):
-                    self.mapping = False
+        with instruments.operation('map', robot = self.robot_id):
+            expansions = self.planner.expansions
+            self.reachability.track(self.start_node)
+            self.explorer.reset(self)
+            self.exploration_stats = {'moves': 0, 'forwards': 0, 'turns': 0}
+            while self.mapping:
+                if self.unbounded:
+                    self.discover(self.current_location)
+                self.reachability.visit(self.current_location)
+                if self.reachability.complete():
                     break
-            node_in_front = tuple(map(lambda x, y: x + y, self.current_location, DIRECTION_MAP[self.current_direction]))
-            if robot.obstacle_in_front() or node_in_front in self.obs_list:
-                if not node_in_front in self.obs_list and node_in_front != self.start_node:
-                    self.obs_list.append(node_in_front)
-                direction = False
-                neighbours = []
-                neighbours.append(node_in_front)
-                for d in OPPOSITE_DIRECTIONS:
-                    if d != self.current_direction and OPPOSITE_DIRECTIONS[d] != self.current_direction:
-                        neighbours.append(tuple(map(lambda x, y: x + y, self.current_location, DIRECTION_MAP[d])))
-                neighbours.append(tuple(map(lambda x, y: x + y, self.current_location, DIRECTION_MAP[OPPOSITE_DIRECTIONS[self.current_direction]])))
-                for neighbour in neighbours:
-                    if not neighbour in self.obs_list:
-                        diff = tuple(map(lambda x, y: x - y, neighbour, self.current_location))
-                        target_direction = None
-                        for d in DIRECTION_MAP:
-                            if DIRECTION_MAP[d] == diff:
-                                target_direction = d
-                                break
-                        current_direction_angle = DIRECTION_TO_ANGLE[self.current_direction]
-                        target_direction_angle = DIRECTION_TO_ANGLE[target_direction]
-                        angle_diff = target_direction_angle - current_direction_angle
-                        movement = ANGLE_TO_MOVEMENT[angle_diff]
-                        robot.move(movement)
-                        self.current_direction = target_direction
+                node_in_front = self.node_in_front()
+                occupied = self.occupied()
+                obstacle_in_front = robot.obstacle_in_front() or node_in_front in self.obstacles or node_in_front in occupied
+                # Another robot in front is not an obstacle.
+                if obstacle_in_front and node_in_front != self.start_node and not node_in_front in occupied:
+                    self.obstacles.add(node_in_front)
+                with instruments.timer('map.plan'):
+                    movements = self.explorer.next_movements(self, robot, obstacle_in_front)
+                if movements is None:
+                    if len(self.team) == 1:
                         break
-            else:
-                if self.facing_border():
-                    direction = random.choice(['left', 'right'])
-                else:
-                    direction = random.choice(['forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'left', 'right'])
-                if direction == 'forwards':
-                    robot.forwards()
-                    self.current_location = tuple(map(lambda x, y: x + y, self.current_location, DIRECTION_MAP[self.current_direction]))
-                elif direction == 'left':
-                    robot.left()
-                    self.current_direction = DIRECTION_TURN_LEFT[self.current_direction]
-                elif direction == 'right':
-                    robot.right()
-                    self.current_direction = DIRECTION_TURN_RIGHT[self.current_direction]
-            count += 1
-        robot.robot.set_musical_note(50)
-        sleep(0.3)
-        robot.robot.set_musical_note(0)
-
-    '''Determine the location of the robot given a random direction and location.'''
+                    # The other robots are in the way or have the last frontiers; wait for them to move on.
+                    self.explorer.reset(self)
+                    robot.sleep(TEAM_WAIT)
+                    continue
+                if not self.perform(robot, movements):
+                    # Another robot took a node on the way first, so the rest of the plan no longer starts from here.
+                    self.explorer.reset(self)
+                    robot.sleep(TEAM_WAIT)
+            self.mapping = False
+            self.claim(None)
+            cells = len(self.reachability.visited)
+            self.exploration_stats['cells'] = cells
+            self.exploration_stats['moves_per_cell'] = float(self.exploration_stats['moves']) / cells if cells else 0.0
+            robot.beep()
+            instruments.count('planner.expansions', self.planner.expansions - expansions)
+
+    '''Sets the strategy used to choose movements while mapping.'''
+    def set_explorer(self, explorer):
+        self.explorer = explorer
+
+    '''
+    Makes a list of movements, keeping track of the location and direction of the robot.
+    Every movement is queued at once, so the robot goes straight on to the next while the pose of the last one is recorded.
+    Returns False, without moving, if another robot has reserved a node the movements enter.
+    '''
+    def perform(self, robot, movements):
+        location, direction = self.current_location, self.current_direction
+        entered = []
+        for movement in movements:
+            if movement == 'forwards':
+                location = self.node_in_front(location, direction)
+                entered.append(location)
+            elif movement == 'left':
+                direction = DIRECTION_TURN_LEFT[direction]
+            elif movement == 'right':
+                direction = DIRECTION_TURN_RIGHT[direction]
+        if entered and not self.reserve(entered):
+            return False
+        futures = [robot.submit(movement) for movement in movements]
+        for movement, future in zip(movements, futures):
+            future.result()
+            instruments.count('grid.' + movement)
+            if movement == 'forwards':
+                self.set_pose(self.node_in_front(), self.current_direction)
+                self.exploration_stats['forwards'] += 1
+            elif movement == 'left':
+                self.set_pose(self.current_location, DIRECTION_TURN_LEFT[self.current_direction])
+                self.exploration_stats['turns'] += 1
+            elif movement == 'right':
+                self.set_pose(self.current_location, DIRECTION_TURN_RIGHT[self.current_direction])
+                self.exploration_stats['turns'] += 1
+            self.exploration_stats['moves'] += 1
+        self.reserve([])
+        return True
+
+    '''Returns the node in front of a location facing a direction, by default the robot's.'''
+    def node_in_front(self, location = None, direction = None):
+        location = self.current_location if location is None else location
+        direction = self.current_direction if direction is None else direction
+        return (location[0] + DIRECTION_MAP[direction][0], location[1] + DIRECTION_MAP[direction][1])
+
+    '''Sets how to localise: 'exact' drops every pose contradicting a reading, 'histogram' weighs them with the sensor and motion models.'''
+    def set_localisation_mode(self, mode, sensor_model = None, motion_model = None, confidence_threshold = None):
+        if not mode in ('exact', 'histogram'):
+            raise ValueError('Unknown localisation mode %r.' % (mode,))
+        self.localisation_mode = mode
+        self.sensor_model = sensor_model or self.sensor_model
+        self.motion_model = motion_model or self.motion_model
+        self.confidence_threshold = confidence_threshold or self.confidence_threshold
+
+    '''Sets how to choose movements while localising: 'random' or 'active', which picks the movement expected to rule out the most poses.'''
+    def set_localisation_policy(self, policy):
+        if not policy in ('random', 'active'):
+            raise ValueError('Unknown localisation policy %r.' % (policy,))
+        self.localisation_policy = policy
+
+    '''
+    Returns the next movement while localising and the number of poses expected to remain after it, if known,
+    or None and None if no safe movement is left that could rule out a pose.
+    The active policy looks for the shortest sequence of up to localisation_lookahead movements expected to rule out some poses,
+    preferring forwards on ties, and follows it until a reading rules out a pose. It falls back to a random movement if there is none.
+    '''
+    def choose_localisation_movement(self, belief, obstacle_in_front):
+        can_move_forwards = not obstacle_in_front and belief.can_move_forwards()
+        if self.localisation_policy == 'active':
+            count = belief.count()
+            if self.localisation_plan and count == self.localisation_plan_count and (can_move_forwards or self.localisation_plan[0] != 'forwards'):
+                movement = self.localisation_plan.pop(0)
+                return movement, belief.expected_count(movement)
+            self.localisation_plan = []
+            self.localisation_plan_count = count
+            best = self.informative_movements(belief, can_move_forwards)
+            if best:
+                self.localisation_plan = best[1][1:]
+                movement = best[1][0]
+                return movement, best[0] if len(best[1]) == 1 else belief.expected_count(movement)
+            if not can_move_forwards and self.border_in_the_way(belief):
+                return None, None
+        elif not can_move_forwards and self.border_in_the_way(belief) and not self.informative_movements(belief, can_move_forwards):
+            return None, None
+        if can_move_forwards:
+            return self.random.choice(['forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'left', 'right']), None
+        return self.random.choice(['left', 'right']), None
+
+    '''Returns if some pose faces an unmapped border however the robot turns, so forwards is never safe.'''
+    def border_in_the_way(self, belief):
+        for turns in ([], ['left'], ['right'], ['left', 'left']):
+            state = belief.copy()
+            for turn in turns:
+                state.apply(turn)
+            if not state.faces_border():
+                return False
+        return True
+
+    '''
+    Returns the shortest sequence of up to localisation_lookahead movements expected to rule out some poses, preferring forwards on ties,
+    with the number of poses expected to remain after it, or None if there is none.
+    Forwards is only tried where the belief allows it, so the sequence never risks driving off the map.
+    '''
+    def informative_movements(self, belief, can_move_forwards):
+        baseline = belief.effective_count() - 1e-9
+        sequences = [([], belief)]
+        for depth in xrange(self.localisation_lookahead):
+            best = None
+            extended = []
+            for movements, state in sequences:
+                candidates = ['left', 'right']
+                if (can_move_forwards if not movements else state.can_move_forwards()):
+                    candidates.insert(0, 'forwards')
+                for movement in candidates:
+                    if movements and set([movements[-1], movement]) == set(['left', 'right']):
+                        continue
+                    expected = state.expected_count(movement)
+                    if expected < baseline and (best is None or expected < best[0]):
+                        best = (expected, movements + [movement])
+                    if depth + 1 < self.localisation_lookahead:
+                        next_state = state.copy()
+                        next_state.apply(movement)
+                        extended.append((movements + [movement], next_state))
+            if best:
+                return best
+            sequences = extended
+        return None
+
+    '''Returns a new belief over the poses of the robot for the current localisation mode.'''
+    def make_belief(self):
+        if self.localisation_mode == 'histogram':
+            return HistogramBelief(self, self.sensor_model, self.motion_model)
+        return BeliefState(self)
+
+    '''Returns what a signature index depends on, so a stale one can be told apart.'''
+    def signature_key(self):
+        return (id(self.nodes), len(self.nodes), self.start_node, self.obstacles.version, self.walls_at_border)
+
+    '''Returns the signature index of the current map, building it only when the map has changed since the last one.'''
+    def signature_index(self):
+        if self.signatures is None or self.signatures.key != self.signature_key():
+            self.signatures = SignatureIndex(self)
+        return self.signatures
+
+    '''
+    Determine the location of the robot given a random direction and location. An unbounded grid is bounded first.
+    The robot may sense another robot in front, so readings taken facing where the others were last seen tell nothing.
+    It gives up when no safe movement is left that could rule out a pose, such as when forwards could drive it off an unwalled map.
+    Sets localised to whether it succeeded and publishes a ('localised', localised, robot_id) event.
+    '''
     def localise(self, robot):
-        possible_locations = self.connected_nodes(self.start_node)
-        possible_directions = ['up', 'right', 'down', 'left']
-        possible_places = [(possible_location[0], possible_location[1], possible_direction) for possible_location in possible_locations for possible_direction in possible_directions]
-        while self.localising:
-            if len(possible_places) == 1:
-                break
-            possible_places_in_front = [tuple(map(lambda x, y: x + y, (possible_place[0], possible_place[1]), DIRECTION_MAP[possible_place[2]]) + [possible_place[2]]) for possible_place in possible_places]
-            if robot.obstacle_in_front():
-                for i in xrange(len(possible_places)):
-                    if not (possible_places_in_front[i][0], possible_places_in_front[i][1]) in self.obs_list:
-                        possible_places[i] = False
-                possible_places = filter(lambda x: x, possible_places)
-                direction = random.choice(['left', 'right'])
-                if direction == 'left':
-                    robot.left()
-                    possible_places = [(possible_place[0], possible_place[1], DIRECTION_TURN_LEFT[possible_place[2]]) for possible_place in possible_places]
-                elif direction == 'right':
-                    robot.right()
-                    self.current_direction = DIRECTION_TURN_RIGHT[self.current_direction]
-                    possible_places = [(possible_place[0], possible_place[1], DIRECTION_TURN_RIGHT[possible_place[2]]) for possible_place in possible_places]
-            else:
-                if self.facing_border():
-                    direction = random.choice(['left', 'right'])
-                else:
-                    direction = random.choice(['forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'left', 'right'])
-                if direction == 'forwards':
-                    robot.forwards()
-                    possible_places = possible_places_in_front
-                elif direction == 'left':
-                    robot.left()
-                    possible_places = [(possible_place[0], possible_place[1], DIRECTION_TURN_LEFT[possible_place[2]]) for possible_place in possible_places]
-                elif direction == 'right':
-                    robot.right()
-                    possible_places = [(possible_place[0], possible_place[1], DIRECTION_TURN_RIGHT[possible_place[2]]) for possible_place in possible_places]
-        self.current_location = (possible_places[0][0], possible_places[0][1])
-        self.current_direction = possible_places[0][2]
-        robot.robot.set_musical_note(50)
-        sleep(0.3)
-        robot.robot.set_musical_note(0)
-
-    '''Return to start node.'''
-    def return_to_start(self, robot):
-        path = self.bfs(self.current_location, self.start_node)
-        if path:
-            directions, self.current_direction = robot.path2directions(path, self.current_direction)
-            robot.move(directions)
-        self.current_location = path[-1]
-        robot.robot.set_musical_note(50)
-        sleep(0.3)
-        robot.robot.set_musical_note(0)
-        
-
-    '''BFS to find a path.'''
-    def bfs(self, start, goal):
-        visited = set([])
-        queue = [(start, [start])]
-        while queue:
-            node, path = queue.pop(0)
-            visited.add(node)
-            for neighbour in self.nodes[node] - set(path):
-                if neighbour in self.obs_list:
+        self.bound()
+        with instruments.operation('localise', robot = self.robot_id):
+            expansions = self.planner.expansions
+            with instruments.timer('localise.setup'):
+                belief = self.make_belief()
+                if len(self.team) > 1:
+                    belief.ignore_nodes(self.occupied())
+            self.localisation_log = []
+            self.localisation_plan = []
+            while self.localising:
+                obstacle_in_front = robot.obstacle_in_front()
+                with instruments.timer('localise.update'):
+                    belief.observe(obstacle_in_front)
+                instruments.sample('localise.hypotheses', belief.count())
+                if self.localisation_log:
+                    self.localisation_log[-1]['actual'] = belief.effective_count()
+                if belief.localised(self.confidence_threshold):
+                    break
+                if self.localisation_max_moves is not None and len(self.localisation_log) >= self.localisation_max_moves:
+                    break
+                with instruments.timer('localise.choose'):
+                    direction, expected = self.choose_localisation_movement(belief, obstacle_in_front)
+                if direction is None:
+                    instruments.count('localise.gave_up')
+                    break
+                # Update the belief while the robot is still moving.
+                future = robot.submit(direction)
+                instruments.count('grid.' + direction)
+                with instruments.timer('localise.update'):
+                    belief.apply(direction)
+                self.localisation_log.append({'movement': direction, 'expected': expected, 'actual': None})
+                future.result()
+            pose = belief.best_pose()
+            self.localisation_confidence = belief.confidence()
+            self.localised = belief.localised(self.confidence_threshold)
+            if pose:
+                self.set_pose((pose[0], pose[1]), pose[2])
+            self.localising = False
+            self.publish('localised', self.localised, self.robot_id)
+            robot.beep()
+            instruments.count('planner.expansions', self.planner.expansions - expansions)
+
+    '''Returns the node the robot returns to: the start node, or for robots added with add_robot where they were placed.'''
+    def home_node(self):
+        return tuple(self.start_node if self.home is None else self.home)
+
+    '''
+    Return to start node, or for robots added with add_robot to where they were placed.
+    The path is planned with D* Lite, which is kept between returns to the same node, and driven a straight run at a time.
+    The robot checks for an obstacle in front before each run and at every line it crosses, stopping short of a new one.
+    A new obstacle is added to the map and the rest of the path replanned incrementally, keeping to the fewest turns.
+    Other robots in the way are avoided, and waited for up to patience times if there is no way around them.
+    '''
+    def return_to_start(self, robot, patience = RETURN_PATIENCE):
+        with instruments.operation('return_to_start', robot = self.robot_id):
+            goal = self.home_node()
+            if self.return_planner is None or self.return_planner.goal != goal:
+                self.return_planner = DStarLite(self, self.current_location, goal)
+            planner = self.return_planner
+            expansions = planner.expansions
+            waits = 0
+            while self.returning and self.current_location != goal:
+                occupied = self.occupied()
+                planner.move_to(self.current_location)
+                planner.set_blocked(occupied)
+                with instruments.timer('return.plan'):
+                    path = planner.path(DIRECTION_MAP[self.current_direction])
+                if not path:
+                    # Only wait if the other robots are what is in the way.
+                    if not occupied or waits >= patience:
+                        break
+                    waits += 1
+                    robot.sleep(TEAM_WAIT)
                     continue
-                if neighbour == goal:
-                    return path + [neighbour]
-                else:
-                    queue.append((neighbour, path + [neighbour]))
+                self.publish('path', list(path), self.robot_id)
+                directions, _ = robot.path2directions(list(path), self.current_direction)
+                turns = directions[:directions.index('forwards')]
+                if turns:
+                    robot.move(turns)
+                    for turn in turns:
+                        self.set_pose(self.current_location, DIRECTION_TURN_LEFT[self.current_direction] if turn == 'left' else DIRECTION_TURN_RIGHT[self.current_direction])
+                run = len(list(takewhile(lambda movement: movement == 'forwards', directions[len(turns):])))
+                if robot.obstacle_in_front():
+                    instruments.count('return.blocked')
+                    # Another robot in front is not an obstacle, and neither is the start.
+                    if not path[1] in self.occupied() and not path[1] in (goal, self.start_node):
+                        self.obstacles.add(path[1])
+                    elif waits >= patience:
+                        break
+                    else:
+                        waits += 1
+                        robot.sleep(TEAM_WAIT)
+                    continue
+                # Drive only as far as the first node another robot has taken since the path was planned, and wait if that is the next one.
+                run = self.reserve_run(path[1:run + 1])
+                if not run:
+                    instruments.count('return.waits')
+                    if waits >= patience:
+                        break
+                    waits += 1
+                    robot.sleep(TEAM_WAIT)
+                    continue
+                future = robot.submit('forwards', run, robot.obstacle_in_front)
+                robot.submit('stop').result()
+                future.result()
+                instruments.count('grid.forwards', future.completed)
+                self.set_pose(path[future.completed], self.current_direction)
+                self.reserve([])
+            self.publish('path', [], self.robot_id)
+            self.returning = False
+            robot.beep()
+            instruments.count('planner.expansions', planner.expansions - expansions)
 
-    '''Uses BFS to find the number of nodes connected in some way to the hamster.'''
+    '''
+    BFS to find a path. Among the shortest paths it picks one with the fewest turns, counting from direction if given.
+    Grids of more than HIERARCHY_THRESHOLD nodes are planned over blocks instead, which can give longer paths; see BlockMap.
+    Where start and goal are in the same or neighbouring blocks that detour would be out of all proportion to the trip,
+    so once the blocks have shown the goal can be reached the path is planned cell by cell, like on a small grid.
+    '''
+    def bfs(self, start, goal, direction = None):
+        if self.hierarchical():
+            path = self.blocks.path(start, goal)
+            if path is None or not self.blocks.nearby(start, goal):
+                return path
+        return self.planner.fewest_turns(start, goal, DIRECTION_MAP[direction] if direction else None)
+
+    '''
+    Uses BFS to find the number of nodes connected in some way to the hamster. Mostly open hierarchical grids are flooded a block at a time.
+    The flood's expansions are added to the planner's.
+    '''
     def connected_nodes(self, start):
-        visited = set([])
-        queue = [(start, [start])]
-        while queue:
-            node, path = queue.pop(0)
-            node = tuple(node)
-            visited.add(node)
-            for neighbour in self.nodes[node] - set(path):
-                if not neighbour in self.obs_list:
-                    queue.append((neighbour, path + [neighbour]))
-        return visited
-
-    '''Check if the robot is facing the border of the grid.'''
+        if self.hierarchical() and self.blocks.mostly_open() and self.planner.passable(start):
+            return self.blocks.flood(start)
+        nodes = self.nodes
+        expansions = nodes.expansions
+        reached = nodes.flood_fill(start, self.obstacles)
+        self.planner.expansions += nodes.expansions - expansions
+        return reached
+
+    '''Returns if the grid is large enough to plan over blocks. Unbounded grids never are.'''
+    def hierarchical(self):
+        return not self.unbounded and len(self.nodes) > HIERARCHY_THRESHOLD
+
+    '''Check if the robot is facing the border of the grid. An unbounded grid has no border, only cells not explored yet.'''
     def facing_border(self):
-        if self.current_direction == 'up' and self.current_location[0] == self.grid_rows - 1:
+        if self.unbounded:
+            return False
+        elif self.current_direction == 'up' and self.current_location[0] == self.grid_rows - 1:
             return True
         elif self.current_direction == 'right' and self.current_location[1] == self.grid_columns - 1:
             return True
@@ -274,4 +700,115 @@ class Grid(object):
         else:
             return False
 
-        
\ No newline at end of file
+'''Returns the turns taking the robot from one direction to another.'''
+def turn_movements(current_direction, target_direction):
+    if current_direction == target_direction:
+        return []
+    elif DIRECTION_TURN_RIGHT[current_direction] == target_direction:
+        return ['right']
+    elif DIRECTION_TURN_LEFT[current_direction] == target_direction:
+        return ['left']
+    else:
+        return ['right', 'right']
+
+'''Base class for the strategies choosing where the robot goes next while mapping.'''
+class ExplorationStrategy(object):
+    '''Clears any state kept from a previous mapping run.'''
+    def reset(self, grid):
+        pass
+
+    '''
+    Returns the next movements for the robot, or None when there is nowhere left to explore.
+    The grid senses in front of the robot before every call, so a returned 'forwards' must be the last movement.
+    '''
+    def next_movements(self, grid, robot, obstacle_in_front):
+        raise NotImplementedError
+
+'''Wanders randomly, preferring to go forwards and turning away from obstacles.'''
+class RandomWalkExplorer(ExplorationStrategy):
+    '''Returns a random movement.'''
+    def next_movements(self, grid, robot, obstacle_in_front):
+        if obstacle_in_front:
+            directions = [DIRECTION_TURN_LEFT[grid.current_direction], DIRECTION_TURN_RIGHT[grid.current_direction]]
+            grid.random.shuffle(directions)
+            directions.append(OPPOSITE_DIRECTIONS[grid.current_direction])
+            for direction in directions:
+                neighbour = grid.node_in_front(direction = direction)
+                if neighbour in grid.nodes and not neighbour in grid.obstacles:
+                    return turn_movements(grid.current_direction, direction)
+            return None
+        elif grid.facing_border():
+            return [grid.random.choice(['left', 'right'])]
+        else:
+            return [grid.random.choice(['forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'forwards', 'left', 'right'])]
+
+'''
+Heads for the nearest reachable node that has not been visited yet, along a shortest known path.
+The plan is kept between calls and only redone when it runs out or runs into an obstacle.
+'''
+class FrontierExplorer(ExplorationStrategy):
+    '''Initialises the explorer with an empty plan.'''
+    def __init__(self):
+        self.path = []
+        self.plan = []
+        self.plans = 0
+
+    '''Throws away the current plan.'''
+    def reset(self, grid):
+        self.path = []
+        self.plan = []
+
+    '''Returns the turns up to the next forwards of the plan, or that forwards.'''
+    def next_movements(self, grid, robot, obstacle_in_front):
+        if not self.plan or (self.plan[0] == 'forwards' and obstacle_in_front) or any(node in grid.obstacles for node in self.path):
+            if not self.replan(grid, robot):
+                return None
+        if self.plan[0] == 'forwards':
+            self.path.pop(0)
+            return [self.plan.pop(0)]
+        movements = []
+        while self.plan and self.plan[0] != 'forwards':
+            movements.append(self.plan.pop(0))
+        return movements
+
+    '''
+    Plans a path to the nearest unvisited node, avoiding the other robots. Returns if there is one.
+    Nodes within TASK_RADIUS of another robot's target are left to that robot unless nothing else is left.
+    '''
+    def replan(self, grid, robot):
+        visited = grid.reachability.visited
+        occupied = grid.occupied()
+        claimed = grid.claimed_by_others()
+        unclaimed = lambda node: not node in visited and all(abs(node[0] - target[0]) + abs(node[1] - target[1]) > TASK_RADIUS for target in claimed)
+        path = self.nearest(grid, unclaimed, occupied)
+        if not path and claimed:
+            path = self.nearest(grid, lambda node: not node in visited, occupied)
+        if not path or len(path) < 2:
+            self.path = []
+            self.plan = []
+            grid.claim(None)
+            grid.publish('path', [], grid.robot_id)
+            return False
+        self.plans += 1
+        grid.claim(path[-1])
+        self.path = path[1:]
+        grid.publish('path', path, grid.robot_id)
+        self.plan, _ = robot.path2directions(list(path), grid.current_direction)
+        return True
+
+    '''
+    Returns a path to the nearest reachable node satisfying a predicate, avoiding the occupied nodes, or None if there is none.
+    On hierarchical grids the search gives up after NEAREST_LIMIT expansions, and the robot heads along the blocks
+    for the remaining node closest as the crow flies instead.
+    '''
+    def nearest(self, grid, predicate, occupied):
+        if not grid.hierarchical():
+            return grid.planner.nearest(grid.current_location, predicate, occupied)
+        path = grid.planner.nearest(grid.current_location, predicate, occupied, NEAREST_LIMIT)
+        if path:
+            return path
+        row, column = grid.current_location
+        targets = [node for node in grid.reachability.remaining() if predicate(node) and not node in occupied]
+        if not targets:
+            return None
+        return grid.bfs(grid.current_location, min(targets, key = lambda node: abs(node[0] - row) + abs(node[1] - column)))
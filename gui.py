@@ -1,8 +1,22 @@
 '''File containing the class controlling the GUI'''
 import Tkinter as tk
+import tkFileDialog, tkMessageBox
 from threading import Thread
-from Queue import Queue
-from time import sleep
+from Queue import Empty
+from map_view import TiledMapView
+from map_store import FILE_EXTENSION
+from instrumentation import instruments
+
+# Constants
+EVENT_INTERVAL = 50
+RASTER_THRESHOLD = 2500
+DIRECTION_MARKERS = {
+    'up': '^',
+    'right': '>',
+    'left': '<',
+    'down': 'v'
+}
+ROBOT_COLOURS = ['#fff', '#ff0', '#f0f', '#0ff', '#f80', '#888']
 
 '''
 GUI object that uses Tkinter to display information from the robot\'s sensors.
@@ -13,8 +27,13 @@ class GUI(object):
     Initialises GUI.
     Takes canvas_size (tuple containing width and height) as the first argument.
     Takes the robot_handler as the second argument.
+    Takes render_mode as an optional argument: 'vector' draws every node and edge, 'raster' draws a TiledMapView
+    and 'auto' picks raster for grids of more than RASTER_THRESHOLD nodes.
+    Takes coordinator as an optional argument, to drive several robots with the buttons instead of robot_handler alone.
+    Takes the size of the grid (rows, columns) as an optional argument, with the start node in its centre,
+    or map_file to start from a saved map instead, or unbounded to start from the start node alone and grow the map while mapping.
     '''
-    def __init__(self, robot_handler, grid):
+    def __init__(self, robot_handler, grid, render_mode = 'auto', coordinator = None, size = (5, 5), map_file = None, unbounded = False):
         # Initialise variables
         self.root = tk.Tk()
         self.canvas_width, self.canvas_height = grid.canvas_width, grid.canvas_height
@@ -22,7 +41,14 @@ class GUI(object):
         self.graph = grid
         self.robot = robot_handler
         self.nodes = {}
-        self.current_location_marker = None
+        self.events = self.graph.subscribe()
+        self.markers = {}
+        self.render_mode = render_mode
+        self.coordinator = coordinator
+        self.view = None
+        self.size = size
+        self.map_file = map_file
+        self.unbounded = unbounded
 
         # Initialise buttons
         self.frame = tk.Frame(self.root)
@@ -34,40 +60,82 @@ class GUI(object):
         self.return_btn.bind('<Button-1>', self.return_to_start)
         self.stop_btn = tk.Button(self.frame, text = 'Stop')
         self.stop_btn.bind('<Button-1>', self.stop)
+        self.save_btn = tk.Button(self.frame, text = 'Save')
+        self.save_btn.bind('<Button-1>', self.save_map)
+        self.load_btn = tk.Button(self.frame, text = 'Load')
+        self.load_btn.bind('<Button-1>', self.load_map)
+        self.stats_btn = tk.Button(self.frame, text = 'Record stats')
+        self.stats_btn.bind('<Button-1>', self.toggle_stats)
         self.map_btn.pack(side = 'left')
         self.localise_btn.pack(side = 'left')
         self.return_btn.pack(side = 'left')
         self.stop_btn.pack(side = 'left')
+        self.save_btn.pack(side = 'left')
+        self.load_btn.pack(side = 'left')
+        self.stats_btn.pack(side = 'left')
 
         # Initialise threads
-        self.main_thread = Thread(target = self.main)
-        self.main_thread.daemon = True
         self.mapping_thread = None
         self.localising_thread = None
         self.returning_thread = None
-        self.display_thread = Thread(target = self.update_graph)
-        self.display_thread.daemon = True
+        self.team_thread = None
 
     '''Starts the Tkinter process.'''
     def start(self):
         self.canvas.pack()
         self.frame.pack()
-        self.main_thread.start()
+        self.root.after(0, self.main)
         self.root.mainloop()
     
     '''Main process.'''
     def main(self):
-        self.graph.set_grid_rows(5)
-        self.graph.set_grid_cols(5)
-        self.graph.set_start((self.graph.grid_rows / 2, self.graph.grid_columns / 2))
-        self.graph.make_grid()
-        self.graph.compute_node_locations()
-        self.display_graph()
-        self.display_thread.start()
+        if self.map_file:
+            self.graph.load_map(self.map_file)
+        elif self.unbounded:
+            self.graph.set_start((self.size[0] / 2, self.size[1] / 2))
+            self.graph.make_unbounded_grid()
+        else:
+            self.graph.set_grid_rows(self.size[0])
+            self.graph.set_grid_cols(self.size[1])
+            self.graph.set_start((self.graph.grid_rows / 2, self.graph.grid_columns / 2))
+            self.graph.make_grid()
+        if self.coordinator:
+            self.coordinator.place()
+        self.display()
+        self.root.after(EVENT_INTERVAL, self.process_events)
+
+    '''Clears the canvas and draws the whole grid, as raster tiles or as nodes and edges depending on the render mode.'''
+    def display(self):
+        if self.view:
+            self.view.close()
+            self.view = None
+        self.canvas.delete('all')
+        self.canvas.configure(scrollregion = (0, 0, self.canvas_width, self.canvas_height))
+        self.canvas.xview_moveto(0)
+        self.canvas.yview_moveto(0)
+        self.nodes = {}
+        self.markers = {}
+        if self.render_mode == 'raster' or (self.render_mode == 'auto' and len(self.graph.nodes) > RASTER_THRESHOLD):
+            self.view = TiledMapView(self.canvas, self.graph)
+            for grid in self.graph.team:
+                self.view.show_pose(grid.current_location, grid.current_direction, grid.robot_id)
+            self.view.draw()
+        else:
+            self.graph.compute_node_locations()
+            self.display_graph()
+
+    '''Runs a coordinator task on every robot from a thread, unless one is already running.'''
+    def run_team(self, task):
+        if self.team_thread is None or not self.team_thread.is_alive():
+            self.team_thread = Thread(target = self.coordinator.run, args = (task,))
+            self.team_thread.daemon = True
+            self.team_thread.start()
 
     '''Start mapping the surrounding environment.'''
     def map(self, event = None):
-        if not self.graph.mapping:
+        if self.coordinator:
+            self.run_team('map')
+        elif not self.graph.mapping:
             self.graph.mapping = True
             self.mapping_thread = Thread(target = self.graph.map, args=(self.robot,))
             self.mapping_thread.daemon = True
@@ -75,7 +143,9 @@ class GUI(object):
 
     '''Start localisation.'''
     def localise(self, event = None):
-        if not self.graph.localising:
+        if self.coordinator:
+            self.run_team('localise')
+        elif not self.graph.localising:
             self.graph.localising = True
             self.localising_thread = Thread(target = self.graph.localise, args=(self.robot,))
             self.localising_thread.daemon = True
@@ -83,14 +153,65 @@ class GUI(object):
 
     '''Start returning to start position.'''
     def return_to_start(self, event = None):
-        if not self.graph.returning:
+        if self.coordinator:
+            self.run_team('return_to_start')
+        elif not self.graph.returning:
             self.graph.returning = True
             self.returning_thread = Thread(target = self.graph.return_to_start, args=(self.robot,))
             self.returning_thread.daemon = True
             self.returning_thread.start()
 
+    '''Returns if any robot is mapping, localising or returning.'''
+    def busy(self):
+        return self.graph.mapping or self.graph.localising or self.graph.returning or (self.coordinator and self.coordinator.busy())
+
+    '''Asks for a file and saves the map to it, unless the robot is busy.'''
+    def save_map(self, event = None):
+        if self.busy():
+            return
+        filename = tkFileDialog.asksaveasfilename(defaultextension = FILE_EXTENSION, filetypes = [('Maps', '*' + FILE_EXTENSION)])
+        if filename:
+            try:
+                self.graph.save_map(filename)
+            except (IOError, OSError) as error:
+                tkMessageBox.showerror('Save', str(error))
+
+    '''Asks for a saved map and loads it, unless the robot is busy.'''
+    def load_map(self, event = None):
+        if self.busy():
+            return
+        filename = tkFileDialog.askopenfilename(filetypes = [('Maps', '*' + FILE_EXTENSION)])
+        if filename:
+            try:
+                self.graph.load_map(filename)
+                if self.coordinator:
+                    self.coordinator.place()
+            except (IOError, OSError, ValueError) as error:
+                tkMessageBox.showerror('Load', str(error))
+
+    '''Starts recording timers and counters, or stops and asks where to save them as JSON.'''
+    def toggle_stats(self, event = None):
+        if not instruments.enabled:
+            instruments.reset()
+            instruments.enable()
+            self.stats_btn.config(text = 'Save stats')
+            return
+        instruments.disable()
+        self.stats_btn.config(text = 'Record stats')
+        filename = tkFileDialog.asksaveasfilename(defaultextension = '.json', filetypes = [('JSON', '*.json')])
+        if filename:
+            try:
+                instruments.export(filename)
+            except (IOError, OSError) as error:
+                tkMessageBox.showerror('Save stats', str(error))
+
     '''Stop every single process.'''
     def stop(self, event = None):
+        if self.coordinator:
+            self.coordinator.stop()
+            if self.team_thread:
+                self.team_thread.join()
+            return
         try:
             self.graph.mapping = False
             self.mapping_thread.join()
@@ -103,43 +224,103 @@ class GUI(object):
         except AttributeError:
             pass
 
-    '''Update the graph with the current obstacle list.'''
-    def update_graph(self):
+    '''
+    Redraws the nodes, poses and paths changed since the last call, then schedules the next call.
+    Runs on the Tkinter main loop, so the mapping, localising and returning threads never touch the canvas.
+    '''
+    def process_events(self):
+        with instruments.timer('gui.events'):
+            self.redraw_changes()
+        self.root.after(EVENT_INTERVAL, self.process_events)
+
+    '''Applies the queued grid events to the canvas.'''
+    def redraw_changes(self):
+        cells = set([])
+        poses = {}
+        paths = {}
+        lost = []
+        redraw = False
         while True:
-            for node in self.graph.nodes:
-                if node == self.graph.start_node:
-                    self.canvas.itemconfig(self.nodes[node], fill = '#f00')
-                elif node in self.graph.obs_list:
-                    self.canvas.itemconfig(self.nodes[node], fill = '#0f0')
-                else:
-                    self.canvas.itemconfig(self.nodes[node], fill = '#00f')
-                if node == self.graph.current_location:
-                    self.canvas.coords(self.current_location_marker, self.graph.node_display_locations[node][0], self.graph.node_display_locations[node][1])
-                    self.canvas.itemconfig(self.current_location_marker, text = {
-                        'up': '^',
-                        'right': '>',
-                        'left': '<',
-                        'down': 'v'
-                    }[self.graph.current_direction])
-            sleep(0.1)
+            try:
+                event = self.events.get_nowait()
+            except Empty:
+                break
+            if event[0] == 'cell':
+                cells.add(event[1])
+            elif event[0] == 'pose':
+                poses[event[3]] = event[1:3]
+            elif event[0] == 'path':
+                paths[event[2]] = event[1]
+            elif event[0] == 'localised' and not event[1]:
+                lost.append(event[2])
+            elif event[0] == 'map':
+                redraw = True
+        for robot_id in lost:
+            tkMessageBox.showwarning('Localise', 'Robot %d stopped localising without knowing where it is.' % robot_id)
+        # An unbounded grid grows while mapping. New nodes are added to the canvas, unless they fall outside the area laid out.
+        if self.graph.unbounded and not redraw:
+            if self.view:
+                redraw = not all(self.view.covers(node) for node in cells)
+            else:
+                new_nodes = [node for node in cells if not node in self.nodes and node in self.graph.nodes]
+                redraw = not all(self.graph.locate_node(node) for node in new_nodes)
+                if not redraw:
+                    for node in new_nodes:
+                        self.draw_node(node)
+        if redraw:
+            self.display()
+            return
+        if self.view:
+            for node in cells:
+                self.view.update_cell(node)
+            for robot_id, pose in poses.items():
+                self.view.show_pose(pose[0], pose[1], robot_id)
+            for robot_id, path in paths.items():
+                self.view.show_path(path, robot_id)
+            return
+        for node in cells:
+            if node in self.nodes:
+                self.canvas.itemconfig(self.nodes[node], fill = self.node_colour(node))
+        for robot_id, pose in poses.items():
+            self.show_marker(pose[0], pose[1], robot_id)
+
+    '''Returns the colour of a node: red for the start, green for obstacles and blue otherwise.'''
+    def node_colour(self, node):
+        if node == self.graph.start_node:
+            return '#f00'
+        elif node in self.graph.obstacles:
+            return '#0f0'
+        else:
+            return '#00f'
 
     '''Display the graph on the Tkinter canvas.'''
-    def display_graph(self):        
+    def display_graph(self):
         for node in self.graph.nodes:
-            for neighbour in self.graph.nodes[node]:
-                self.canvas.create_line(self.graph.node_display_locations[node][0], self.graph.node_display_locations[node][1], self.graph.node_display_locations[neighbour][0], self.graph.node_display_locations[neighbour][1], width = 2)
-        for node in self.graph.nodes:
-            x_top_left = int(self.graph.node_display_locations[node][0] - 0.5 * self.graph.column_width)
-            y_top_left = int(self.graph.node_display_locations[node][1] - 0.5 * self.graph.row_height)
-            x_bottom_right = int(self.graph.node_display_locations[node][0] + 0.5 * self.graph.column_width)
-            y_bottom_right = int(self.graph.node_display_locations[node][1] + 0.5 * self.graph.row_height)
-            if node == self.graph.start_node:
-                self.nodes[node] = self.canvas.create_oval(x_top_left, y_top_left, x_bottom_right, y_bottom_right, outline = '#000', fill = '#f00', width = 2)
-            elif node in self.graph.obs_list:
-                self.nodes[node] = self.canvas.create_oval(x_top_left, y_top_left, x_bottom_right, y_bottom_right, outline = '#000', fill = '#0f0', width = 2)
-            else:
-                self.nodes[node] = self.canvas.create_oval(x_top_left, y_top_left, x_bottom_right, y_bottom_right, outline = '#000', fill = '#00f', width = 2)
-        self.current_location_marker = self.canvas.create_text(self.graph.node_display_locations[self.graph.start_node][0], self.graph.node_display_locations[self.graph.start_node][1], text = '^', fill = '#fff', font = ('Arial', 30))
+            self.draw_node(node)
+        for grid in self.graph.team:
+            self.show_marker(grid.current_location, grid.current_direction, grid.robot_id)
+
+    '''Draws a node and its edges to the neighbours already drawn, keeping edges below nodes and nodes below markers.'''
+    def draw_node(self, node):
+        x, y = self.graph.node_display_locations[node]
+        for neighbour in self.graph.nodes.neighbours(node):
+            if neighbour in self.nodes:
+                neighbour_x, neighbour_y = self.graph.node_display_locations[neighbour]
+                self.canvas.tag_lower(self.canvas.create_line(x, y, neighbour_x, neighbour_y, width = 2))
+        self.nodes[node] = self.canvas.create_oval(int(x - 0.5 * self.graph.column_width), int(y - 0.5 * self.graph.row_height), int(x + 0.5 * self.graph.column_width), int(y + 0.5 * self.graph.row_height), outline = '#000', fill = self.node_colour(node), width = 2)
+        for marker in self.markers.values():
+            self.canvas.tag_raise(marker)
+
+    '''Moves the marker of a robot to a pose, creating the marker the first time.'''
+    def show_marker(self, location, direction, robot_id = 0):
+        if not location in self.graph.node_display_locations:
+            return
+        x, y = self.graph.node_display_locations[location]
+        if robot_id in self.markers:
+            self.canvas.coords(self.markers[robot_id], x, y)
+            self.canvas.itemconfig(self.markers[robot_id], text = DIRECTION_MARKERS[direction])
+        else:
+            self.markers[robot_id] = self.canvas.create_text(x, y, text = DIRECTION_MARKERS[direction], fill = ROBOT_COLOURS[robot_id % len(ROBOT_COLOURS)], font = ('Arial', 30))
     
     '''Highlight the graph based on the path.'''
     def highlight_path(self, path):
@@ -0,0 +1,359 @@
+'''File containing the hierarchical block map used to plan over large grids.'''
+import heapq
+from collections import deque
+from itertools import product
+from threading import RLock
+from occupancy_grid import ABSENT_BYTE, PRESENT_BYTE
+
+# Constants
+BLOCK_SIZE = 16
+# Runs of open cells along a border at least this long get an entrance at each end rather than one in the middle.
+LONG_RUN = 6
+# The blocks on the other side of each side of a block, as (row, column) steps.
+SIDES = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+'''
+A square block of cells in a BlockMap.
+Its exits are the cells where an entrance crosses its border, each with the cells across the border it leads to.
+A block without any obstacle or missing node is open: any two of its cells are joined by an L shaped path, so nothing is searched.
+Otherwise searches stay inside the block and work on flat indices of its own cells. Those from its exits are cached.
+'''
+class Block(object):
+    '''Initialises the block at a (row, column) position among the blocks of a BlockMap.'''
+    def __init__(self, blocks, key):
+        self.blocks = blocks
+        self.key = key
+        size = blocks.block_size
+        self.first_row, self.first_column = key[0] * size, key[1] * size
+        self.last_row = min(self.first_row + size, blocks.grid.nodes.rows)
+        self.last_column = min(self.first_column + size, blocks.grid.nodes.columns)
+        self.width = self.last_column - self.first_column
+        self.cells_open = self.passable_cells()
+        self.open = self.cells_open.find(ABSENT_BYTE) == -1
+        self.exits = {}
+        for side in SIDES:
+            neighbour = (key[0] + side[0], key[1] + side[1])
+            if side[0] + side[1] > 0:
+                pairs = blocks.border(key, neighbour)
+            else:
+                pairs = [(inside, outside) for outside, inside in blocks.border(neighbour, key)]
+            for inside, outside in pairs:
+                self.exits.setdefault(inside, []).append(outside)
+        self.entrances = sorted(self.exits)
+        self.searches = {}
+        self.links = {}
+        self.labels = None
+        self.components = None
+        self.cell_list = None
+
+    '''Returns a bytearray with a byte per cell of the block, in row-major order, that is 1 where the cell is passable.'''
+    def passable_cells(self):
+        nodes, obstacles = self.blocks.grid.nodes, self.blocks.grid.obstacles
+        rows = []
+        for row in xrange(self.first_row, self.last_row):
+            start = row * nodes.columns + self.first_column
+            cells = nodes.cells[start:start + self.width]
+            for index in obstacles.indices_in_range(start, start + self.width):
+                cells[index - start] = 0
+            rows.append(cells)
+        return bytearray().join(rows)
+
+    '''Returns if a cell lies inside the block.'''
+    def contains(self, cell):
+        return self.first_row <= cell[0] < self.last_row and self.first_column <= cell[1] < self.last_column
+
+    '''Returns the index of a cell among the cells of the block.'''
+    def index(self, cell):
+        return (cell[0] - self.first_row) * self.width + cell[1] - self.first_column
+
+    '''Returns the cell at an index among the cells of the block.'''
+    def cell(self, index):
+        row, column = divmod(index, self.width)
+        return (row + self.first_row, column + self.first_column)
+
+    '''
+    BFS inside the block from a cell, which need not be passable itself.
+    Returns the depths (-1 where unreached) and parents of the cells of the block by index, or None for an open block.
+    '''
+    def search(self, source):
+        if self.open:
+            return None
+        if source in self.searches:
+            return self.searches[source]
+        planner = self.blocks.grid.planner
+        width, cells = self.width, self.cells_open
+        start = self.index(source)
+        depths = [-1] * len(cells)
+        parents = [-1] * len(cells)
+        depths[start] = 0
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            planner.expansions += 1
+            column = index % width
+            for neighbour, valid in ((index + width, True), (index - width, index >= width), (index + 1, column != width - 1), (index - 1, column != 0)):
+                if valid and neighbour < len(cells) and cells[neighbour] and depths[neighbour] < 0:
+                    depths[neighbour] = depths[index] + 1
+                    parents[neighbour] = index
+                    queue.append(neighbour)
+        if source in self.exits:
+            self.searches[source] = (depths, parents)
+        return depths, parents
+
+    '''Returns the length of a shortest path inside the block between two cells, or None if there is none.'''
+    def distance(self, source, target, search = None):
+        if self.open:
+            return abs(source[0] - target[0]) + abs(source[1] - target[1])
+        depth = (search or self.search(source))[0][self.index(target)]
+        return depth if depth >= 0 else None
+
+    '''Returns the other exits of the block reachable from an exit, with the length of a shortest path inside the block to each.'''
+    def exit_links(self, source):
+        if not source in self.links:
+            links = [(cell, self.distance(source, cell)) for cell in self.entrances if cell != source]
+            self.links[source] = [(cell, distance) for cell, distance in links if distance is not None]
+        return self.links[source]
+
+    '''Returns a shortest path inside the block between two cells, or None if there is none.'''
+    def path(self, source, target, search = None):
+        if self.open:
+            step = 1 if target[0] >= source[0] else -1
+            path = [(row, source[1]) for row in xrange(source[0], target[0] + step, step)]
+            step = 1 if target[1] >= source[1] else -1
+            path.extend((target[0], column) for column in xrange(source[1] + step, target[1] + step, step))
+            return path
+        depths, parents = search or self.search(source)
+        index = self.index(target)
+        if depths[index] < 0:
+            return None
+        path = [target]
+        while depths[index] > 0:
+            index = parents[index]
+            path.append(self.cell(index))
+        path.reverse()
+        return path
+
+    '''Returns the connected component of the block a passable cell belongs to, as an index into components.'''
+    def label(self, cell):
+        if self.open:
+            return 0
+        if self.labels is None:
+            self.label_components()
+        return self.labels[self.index(cell)]
+
+    '''Returns the cells of a component of the block.'''
+    def cells(self, label):
+        every_cell = product(xrange(self.first_row, self.last_row), xrange(self.first_column, self.last_column))
+        if self.open:
+            return every_cell
+        if self.cell_list is None:
+            self.cell_list = list(every_cell)
+        return [self.cell_list[index] for index in self.components[label]]
+
+    '''Splits the passable cells of the block into connected components.'''
+    def label_components(self):
+        width, cells = self.width, self.cells_open
+        labels = self.labels = [-1] * len(cells)
+        self.components = []
+        first = cells.find(PRESENT_BYTE)
+        while first != -1:
+            if labels[first] < 0:
+                label = len(self.components)
+                component = [first]
+                labels[first] = label
+                queue = deque(component)
+                while queue:
+                    index = queue.popleft()
+                    column = index % width
+                    for neighbour, valid in ((index + width, True), (index - width, index >= width), (index + 1, column != width - 1), (index - 1, column != 0)):
+                        if valid and neighbour < len(cells) and cells[neighbour] and labels[neighbour] < 0:
+                            labels[neighbour] = label
+                            component.append(neighbour)
+                            queue.append(neighbour)
+                self.components.append(component)
+            first = cells.find(PRESENT_BYTE, first + 1)
+
+'''
+Coarse view of a grid as square blocks of block_size cells, in the style of HPA*.
+Where a run of passable cells lines both sides of the border between two blocks, an entrance crosses it in the middle of the run,
+or at both ends of a long run. Paths are planned with A* over the entrances and then filled in inside each block,
+so a query only looks at the blocks along its way. They are shortest over the entrances, not over the cells:
+on random maps with up to 30% obstacles they came out up to 16 cells or 1.6 times longer than shortest,
+and relatively worse the shorter the trip, which is why Grid.bfs plans trips to the same or a neighbouring block cell by cell.
+Blocks are worked out when a query first needs them and forgotten when an obstacle in them changes.
+Several robots may share the map, so its public methods hold a lock.
+'''
+class BlockMap(object):
+    '''Initialises the block map for a grid.'''
+    def __init__(self, grid, block_size = BLOCK_SIZE):
+        self.grid = grid
+        self.block_size = block_size
+        self.nodes = None
+        self.version = 0
+        self.blocks = {}
+        self.borders = {}
+        self.lock = RLock()
+
+    '''Forgets the blocks that the obstacle changes since the last sync touched, or every block if the nodes were replaced.'''
+    def sync(self):
+        if self.nodes is not self.grid.nodes:
+            self.nodes = self.grid.nodes
+            self.version = self.grid.obstacles.version
+            self.blocks = {}
+            self.borders = {}
+            return
+        self.version, changes = self.grid.obstacles.changes_since(self.version)
+        if changes is None:
+            self.blocks = {}
+            self.borders = {}
+            return
+        for node, _ in changes:
+            self.forget(node)
+
+    '''Forgets the block holding a node, and the borders and neighbouring blocks it lies next to.'''
+    def forget(self, node):
+        key = self.block_key(node)
+        self.blocks.pop(key, None)
+        for side in SIDES:
+            neighbour = self.block_key((node[0] + side[0], node[1] + side[1]))
+            if neighbour != key:
+                self.blocks.pop(neighbour, None)
+                self.borders.pop((min(key, neighbour), max(key, neighbour)), None)
+
+    '''Returns the position of the block holding a node.'''
+    def block_key(self, node):
+        return (node[0] // self.block_size, node[1] // self.block_size)
+
+    '''Returns if two nodes are in the same block or in blocks next to each other, diagonally included.'''
+    def nearby(self, node, other):
+        key, other_key = self.block_key(node), self.block_key(other)
+        return abs(key[0] - other_key[0]) <= 1 and abs(key[1] - other_key[1]) <= 1
+
+    '''Returns the block at a position, working it out if needed.'''
+    def block(self, key):
+        if not key in self.blocks:
+            self.blocks[key] = Block(self, key)
+        return self.blocks[key]
+
+    '''
+    Returns the entrances across the border between a block and the one above it or to its right,
+    as pairs of a cell in the first block and the cell next to it in the second.
+    '''
+    def border(self, low, high):
+        if (low, high) in self.borders:
+            return self.borders[(low, high)]
+        nodes, size = self.grid.nodes, self.block_size
+        pairs = []
+        if high[0] * size < nodes.rows and high[1] * size < nodes.columns and min(high) >= 0 and min(low) >= 0:
+            passable = self.grid.planner.passable
+            if high[0] > low[0]:
+                row = high[0] * size
+                cells = [((row - 1, column), (row, column)) for column in xrange(low[1] * size, min(low[1] * size + size, nodes.columns))]
+            else:
+                column = high[1] * size
+                cells = [((row, column - 1), (row, column)) for row in xrange(low[0] * size, min(low[0] * size + size, nodes.rows))]
+            run = []
+            for pair in cells + [None]:
+                if pair is not None and passable(pair[0]) and passable(pair[1]):
+                    run.append(pair)
+                    continue
+                if len(run) >= LONG_RUN:
+                    pairs.extend([run[0], run[-1]])
+                elif run:
+                    pairs.append(run[len(run) // 2])
+                run = []
+        self.borders[(low, high)] = pairs
+        return pairs
+
+    '''Returns a path from start to goal planned over the blocks, or None if there is no path. Like PathPlanner.bfs, only the goal must be passable.'''
+    def path(self, start, goal):
+        with self.lock:
+            self.sync()
+            planner = self.grid.planner
+            start, goal = tuple(start), tuple(goal)
+            if start == goal:
+                return [start]
+            if not planner.passable(goal):
+                return None
+            goal_block = self.block(self.block_key(goal))
+            start_search = self.block(self.block_key(start)).search(start)
+            parents = {start: None}
+            costs = {start: 0}
+            heap = [(planner.heuristic(start, goal), 0, start)]
+            while heap:
+                _, negative_cost, node = heapq.heappop(heap)
+                cost = -negative_cost
+                if node == goal:
+                    break
+                if cost > costs[node]:
+                    continue
+                planner.expansions += 1
+                block = self.block(self.block_key(node))
+                search = start_search if node == start else None
+                if node in block.exits and node != start:
+                    links = list(block.exit_links(node))
+                else:
+                    links = [(cell, block.distance(node, cell, search)) for cell in block.entrances if cell != node]
+                if block is goal_block:
+                    links.append((goal, block.distance(node, goal, search)))
+                links.extend((outside, 1) for outside in block.exits.get(node, ()))
+                if node == start:
+                    # The start may be an obstacle on the edge of its block, which no entrance leaves from.
+                    links.extend((neighbour, 1) for neighbour in planner.neighbours(start) if not block.contains(neighbour))
+                for neighbour, step in links:
+                    if step is None:
+                        continue
+                    neighbour_cost = cost + step
+                    if neighbour_cost < costs.get(neighbour, neighbour_cost + 1):
+                        costs[neighbour] = neighbour_cost
+                        parents[neighbour] = node
+                        heapq.heappush(heap, (neighbour_cost + planner.heuristic(neighbour, goal), -neighbour_cost, neighbour))
+            if not goal in parents:
+                return None
+            return self.refine(planner.reconstruct(parents, goal), start_search)
+
+    '''Fills in the cells between the cells of a path planned over the blocks.'''
+    def refine(self, waypoints, start_search):
+        path = [waypoints[0]]
+        for source, target in zip(waypoints, waypoints[1:]):
+            key = self.block_key(source)
+            if key != self.block_key(target):
+                path.append(target)
+            else:
+                path.extend(self.block(key).path(source, target, start_search if source == waypoints[0] else None)[1:])
+        return path
+
+    '''
+    Returns if there are fewer obstacles than blocks, so most blocks are open.
+    Flooding over blocks only beats flooding cell by cell when it can fill in whole open blocks.
+    '''
+    def mostly_open(self):
+        return len(self.grid.obstacles) * self.block_size ** 2 < len(self.grid.nodes)
+
+    '''Returns the nodes reachable from start, which must be passable, filling in whole components of blocks at a time.'''
+    def flood(self, start):
+        with self.lock:
+            self.sync()
+            start = tuple(start)
+            if not self.grid.planner.passable(start):
+                return set([])
+            key = self.block_key(start)
+            first = (key, self.block(key).label(start))
+            seen = set([first])
+            queue = deque([first])
+            reached = set([])
+            while queue:
+                key, label = queue.popleft()
+                self.grid.planner.expansions += 1
+                block = self.block(key)
+                reached.update(block.cells(label))
+                for cell, outside in block.exits.items():
+                    if block.label(cell) != label:
+                        continue
+                    for neighbour in outside:
+                        neighbour_key = self.block_key(neighbour)
+                        component = (neighbour_key, self.block(neighbour_key).label(neighbour))
+                        if not component in seen:
+                            seen.add(component)
+                            queue.append(component)
+            return reached
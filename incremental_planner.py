@@ -0,0 +1,173 @@
+'''File containing the incremental planner used to drive back to the start around obstacles found on the way.'''
+import heapq
+
+# Constants
+INFINITY = float('inf')
+
+'''
+Plans a shortest path from a moving start to a fixed goal with D* Lite, searching backwards from the goal.
+When obstacles appear or disappear, or the robot moves, only the nodes whose distance to the goal changed are searched again,
+so replanning after a blocked node costs the region around it rather than a whole new search.
+Besides the grid's obstacles, a set of blocked nodes, such as those other robots stand on, can be avoided for a while.
+Obstacle changes are picked up from the change log of the grid's ObstacleIndex. If the nodes change or the log has moved on too far, the search starts over.
+'''
+class DStarLite(object):
+    '''Initialises the planner for a grid and a goal, with the robot at start.'''
+    def __init__(self, grid, start, goal):
+        self.grid = grid
+        self.goal = tuple(goal)
+        self.start = tuple(start)
+        self.blocked = set([])
+        self.expansions = 0
+        self.reset()
+
+    '''Throws away the search and starts again from the goal.'''
+    def reset(self):
+        self.nodes = self.grid.nodes
+        self.version = self.grid.obstacles.version
+        self.last = self.start
+        self.modifier = 0
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.keys = {}
+        self.queue = []
+        self.push(self.goal)
+
+    '''Returns if a node can be entered.'''
+    def passable(self, node):
+        return node in self.nodes and not node in self.grid.obstacles and not node in self.blocked
+
+    '''Returns the Manhattan distance between two nodes.'''
+    def heuristic(self, node, other):
+        return abs(node[0] - other[0]) + abs(node[1] - other[1])
+
+    '''Returns the priority of a node, ordered first by its estimated path length through it and then by its distance to the goal.'''
+    def key(self, node):
+        distance = min(self.g.get(node, INFINITY), self.rhs.get(node, INFINITY))
+        return (distance + self.heuristic(self.start, node) + self.modifier, distance)
+
+    '''Queues a node with its current priority. Older entries for it are skipped when popped.'''
+    def push(self, node):
+        key = self.key(node)
+        self.keys[node] = key
+        heapq.heappush(self.queue, (key, node))
+
+    '''Drops stale entries from the top of the queue.'''
+    def prune(self):
+        while self.queue and self.keys.get(self.queue[0][1]) != self.queue[0][0]:
+            heapq.heappop(self.queue)
+
+    '''Recomputes the one-step lookahead distance of a node from its neighbours and queues it if it is inconsistent.'''
+    def update_node(self, node):
+        if node != self.goal:
+            if self.passable(node) or node == self.start:
+                self.rhs[node] = min([self.g.get(neighbour, INFINITY) + 1 for neighbour in self.nodes.neighbours(node) if self.passable(neighbour)] or [INFINITY])
+            else:
+                self.rhs[node] = INFINITY
+        self.keys.pop(node, None)
+        if self.g.get(node, INFINITY) != self.rhs.get(node, INFINITY):
+            self.push(node)
+
+    '''Searches until the distance from the start to the goal is known.'''
+    def compute(self):
+        while True:
+            self.prune()
+            start_key = self.key(self.start)
+            if not self.queue or (self.queue[0][0] >= start_key and self.rhs.get(self.start, INFINITY) == self.g.get(self.start, INFINITY)):
+                return
+            old_key, node = heapq.heappop(self.queue)
+            del self.keys[node]
+            self.expansions += 1
+            new_key = self.key(node)
+            if old_key < new_key:
+                self.push(node)
+            elif self.g.get(node, INFINITY) > self.rhs.get(node, INFINITY):
+                self.g[node] = self.rhs[node]
+                for neighbour in self.nodes.neighbours(node):
+                    self.update_node(neighbour)
+            else:
+                self.g[node] = INFINITY
+                self.update_node(node)
+                for neighbour in self.nodes.neighbours(node):
+                    self.update_node(neighbour)
+
+    '''Updates a node whose passability changed and its neighbours.'''
+    def changed(self, node):
+        self.update_node(node)
+        for neighbour in self.nodes.neighbours(node):
+            self.update_node(neighbour)
+
+    '''Catches up with the obstacles added or removed since the last call, starting over if that is no longer possible.'''
+    def sync(self):
+        if self.nodes is not self.grid.nodes:
+            self.reset()
+            return
+        self.version, changes = self.grid.obstacles.changes_since(self.version)
+        if changes is None:
+            self.reset()
+            return
+        for node in set(node for node, _ in changes):
+            if node in self.nodes:
+                self.changed(node)
+
+    '''Sets the nodes to avoid besides the obstacles, updating those that were blocked or freed.'''
+    def set_blocked(self, nodes):
+        nodes = set(nodes) - set([self.start])
+        changed = nodes ^ self.blocked
+        self.blocked = nodes
+        for node in changed:
+            if node in self.nodes:
+                self.changed(node)
+
+    '''Moves the start to where the robot now is.'''
+    def move_to(self, start):
+        start = tuple(start)
+        if start != self.start:
+            self.modifier += self.heuristic(self.last, start)
+            self.last, self.start, previous = start, start, self.start
+            self.update_node(previous)
+            self.update_node(start)
+
+    '''
+    Brings the search up to date and returns a shortest path from the start to the goal, or None if there is none.
+    Among the shortest paths it picks one with the fewest turns, counting from heading, the (row, column) step the robot faces, if given.
+    Every node on a shortest path has been searched, so they are the nodes one step closer to the goal than one already on a path.
+    '''
+    def path(self, heading = None):
+        self.sync()
+        self.compute()
+        if self.start == self.goal:
+            return [self.start]
+        distance = self.g.get(self.start, INFINITY)
+        if distance == INFINITY:
+            return None
+        turn_cost = self.grid.planner.turn_cost
+        # The cheapest way into every node on a shortest path for each heading, with the state it came from.
+        states = {self.start: {heading: (0, None)}}
+        layer = [self.start]
+        for depth in xrange(distance - 1, -1, -1):
+            next_layer = []
+            for node in layer:
+                for neighbour in self.nodes.neighbours(node):
+                    if self.g.get(neighbour) != depth or not self.passable(neighbour):
+                        continue
+                    if not neighbour in states:
+                        states[neighbour] = {}
+                        next_layer.append(neighbour)
+                    step = (neighbour[0] - node[0], neighbour[1] - node[1])
+                    entries = states[neighbour]
+                    for node_heading, (cost, _) in states[node].items():
+                        step_cost = cost + turn_cost(node_heading, step)
+                        if not step in entries or step_cost < entries[step][0]:
+                            entries[step] = (step_cost, (node, node_heading))
+            layer = next_layer
+        entries = states.get(self.goal)
+        if not entries:
+            return None
+        state = entries[min(entries, key = lambda step: entries[step][0])][1]
+        path = [self.goal]
+        while state is not None:
+            path.append(state[0])
+            state = states[state[0]][state[1]][1]
+        path.reverse()
+        return path
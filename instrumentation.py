@@ -0,0 +1,198 @@
+'''File containing the timers and counters used to see where robot operations spend their time.'''
+import cProfile, json, pstats, time
+from threading import Lock
+from timeit import default_timer
+
+'''Context manager that does nothing, handed out while instrumentation is off.'''
+class NullTimer(object):
+    '''Does nothing.'''
+    def __enter__(self):
+        return self
+
+    '''Does nothing.'''
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = NullTimer()
+
+'''Context manager adding the time spent inside it to a named timer.'''
+class Timer(object):
+    '''Initialises the timer for a name.'''
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    '''Starts timing.'''
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    '''Stops timing and records the time.'''
+    def __exit__(self, *exc_info):
+        self.instrumentation.add_time(self.name, default_timer() - self.start)
+        return False
+
+'''
+Context manager around a whole operation such as mapping. Times it, records the counters it changed and,
+when profiling, runs cProfile over it. cProfile only sees the thread it runs on, which is the operation's own.
+'''
+class Operation(Timer):
+    '''Initialises the operation with a name and details to record with it, such as the robot.'''
+    def __init__(self, instrumentation, name, details):
+        Timer.__init__(self, instrumentation, name)
+        self.details = details
+        self.profiler = None
+
+    '''Starts timing and, if asked to, profiling.'''
+    def __enter__(self):
+        self.counters = self.instrumentation.snapshot()['counters']
+        self.started = time.time()
+        if self.instrumentation.profiling:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return Timer.__enter__(self)
+
+    '''Stops timing and profiling, and logs the operation.'''
+    def __exit__(self, *exc_info):
+        Timer.__exit__(self, *exc_info)
+        if self.profiler:
+            self.profiler.disable()
+            self.instrumentation.add_profile(self.profiler)
+        counters = self.instrumentation.snapshot()['counters']
+        record = dict(self.details)
+        record.update({
+            'operation': self.name,
+            'started': self.started,
+            'seconds': default_timer() - self.start,
+            'counters': dict((name, value - self.counters.get(name, 0)) for name, value in counters.items() if value != self.counters.get(name, 0))
+        })
+        self.instrumentation.log(record)
+        return False
+
+'''
+Named timers, counters and samples, a log of operations and an optional cProfile hook.
+Everything is off until enable is called, and while off every call returns at once, so the calls can stay on hot paths.
+Counters are shared by every robot and thread, so an operation's counters include anything running alongside it.
+'''
+class Instrumentation(object):
+    '''Initialises disabled instrumentation with nothing recorded.'''
+    def __init__(self):
+        self.enabled = False
+        self.profiling = False
+        self.lock = Lock()
+        self.reset()
+
+    '''Throws away everything recorded so far.'''
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.samples = {}
+            self.operations = []
+            self.profile = None
+
+    '''Starts recording, also profiling operations if asked to.'''
+    def enable(self, profile = False):
+        self.profiling = profile
+        self.enabled = True
+
+    '''Stops recording. What has been recorded is kept until reset.'''
+    def disable(self):
+        self.enabled = False
+        self.profiling = False
+
+    '''Adds an amount to a counter.'''
+    def count(self, name, amount = 1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    '''Records a value of something that is measured rather than counted, such as the number of hypotheses left.'''
+    def sample(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            sample = self.samples.get(name)
+            if sample is None:
+                self.samples[name] = {'count': 1, 'total': value, 'min': value, 'max': value, 'last': value}
+            else:
+                sample['count'] += 1
+                sample['total'] += value
+                sample['min'] = min(sample['min'], value)
+                sample['max'] = max(sample['max'], value)
+                sample['last'] = value
+
+    '''Adds a time in seconds to a timer.'''
+    def add_time(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = {'count': 1, 'seconds': seconds, 'max': seconds}
+            else:
+                timer['count'] += 1
+                timer['seconds'] += seconds
+                timer['max'] = max(timer['max'], seconds)
+
+    '''Returns a context manager timing the code inside it.'''
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    '''Returns a context manager timing, logging and possibly profiling a whole operation.'''
+    def operation(self, name, **details):
+        if not self.enabled:
+            return NULL_TIMER
+        return Operation(self, name, details)
+
+    '''Appends a record to the log of operations.'''
+    def log(self, record):
+        with self.lock:
+            self.operations.append(record)
+
+    '''Merges the statistics of a profiler into the profile kept so far.'''
+    def add_profile(self, profiler):
+        with self.lock:
+            if self.profile is None:
+                self.profile = pstats.Stats(profiler)
+            else:
+                self.profile.add(profiler)
+
+    '''Returns the functions taking the most cumulative time in the profile, as dicts.'''
+    def top_functions(self, limit = 20):
+        if self.profile is None:
+            return []
+        functions = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in self.profile.stats.items():
+            functions.append({'function': '%s:%d(%s)' % (filename, line, function), 'calls': calls, 'seconds': own, 'cumulative_seconds': cumulative})
+        functions.sort(key = lambda entry: entry['cumulative_seconds'], reverse = True)
+        return functions[:limit]
+
+    '''Returns a copy of everything recorded.'''
+    def snapshot(self):
+        with self.lock:
+            return {
+                'timers': dict((name, dict(timer)) for name, timer in self.timers.items()),
+                'counters': dict(self.counters),
+                'samples': dict((name, dict(sample)) for name, sample in self.samples.items()),
+                'operations': list(self.operations)
+            }
+
+    '''Writes everything recorded, with the top of the profile, to a JSON file.'''
+    def export(self, filename):
+        report = self.snapshot()
+        report['timestamp'] = time.time()
+        report['profile'] = self.top_functions()
+        with open(filename, 'w') as output:
+            json.dump(report, output, indent = 2, sort_keys = True)
+
+    '''Writes the full profile in the pstats format, for snakeviz or pstats.Stats.'''
+    def dump_profile(self, filename):
+        if self.profile is not None:
+            self.profile.dump_stats(filename)
+
+# The instrumentation used by the grid, the robot handler and the GUI.
+instruments = Instrumentation()
@@ -1,27 +1,97 @@
 '''Main file connecting the GUI and robot together.'''
-import sys
-from threading import Thread
-from HamsterAPI.comm_usb import RobotComm
+import argparse, random, sys
+from time import sleep
 from gui import GUI
 from robot_handler import RobotHandler
 from grid import Grid
+from coordinator import Coordinator
+from simulator import SimulatedRobot, random_obstacles, make_fleet
+from map_store import read_map, obstacle_nodes
+from instrumentation import instruments
+from robot_log import ReplayRobot
+from batch import parse_size
 
 # Constants
 MAX_ROBOT_NUM = 1
 
-def main():
-    robot_comm = RobotComm(MAX_ROBOT_NUM)
-    robot_comm.start()
-    robot_list = robot_comm.robotList
-    
-    while not robot_list:
-        pass
+'''Parses a number of robots, which must be at least one.'''
+def parse_count(text):
+    if not text.isdigit() or int(text) < 1:
+        raise argparse.ArgumentTypeError('%r is not a number of robots.' % text)
+    return int(text)
 
-    robot = RobotHandler(robot_list[0])
+'''Parses the command line.'''
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = 'Map, localise and return Hamster robots to the start from a GUI.')
+    parser.add_argument('--size', type = parse_size, default = (5, 5), help = 'grid size such as 5 or 5x7, with the start node in its centre; with --unbounded only the size of the simulated world')
+    parser.add_argument('--map', metavar = 'FILE', help = 'saved map to start from instead, which the simulator drives on too')
+    parser.add_argument('--unbounded', action = 'store_true', help = 'start from the start node alone and grow the map while mapping')
+    parser.add_argument('--robots', type = parse_count, default = MAX_ROBOT_NUM, help = 'number of robots')
+    parser.add_argument('--simulate', action = 'store_true', help = 'drive simulated robots instead of real ones')
+    parser.add_argument('--open-edges', action = 'store_true', help = 'the edges of the map are not walled, so localisation never drives towards them and may give up')
+    parser.add_argument('--record', metavar = 'FILE', help = 'log every sensor read and actuator command')
+    parser.add_argument('--replay', metavar = 'FILE', help = 'drive the robots from such a log at full speed, with the --size, --map, --unbounded and --open-edges options of the recording')
+    parser.add_argument('--stats', metavar = 'FILE', help = 'record timers and counters from the start and write them to FILE as JSON on exit')
+    parser.add_argument('--profile', metavar = 'FILE', help = 'run every operation under cProfile and write the merged profile to FILE in the pstats format on exit')
+    return parser.parse_args(argv)
+
+'''Returns the log file of a robot: the name given for the first robot, with the robot number appended for the others.'''
+def log_name(filename, number):
+    return filename if number == 0 else '%s.%d' % (filename, number)
+
+'''
+Connects the robots and starts the GUI; run with --help for the options.
+With several robots, the first stands on the start node and the others on the nodes nearest it, facing the same way.
+'''
+def main(argv = None):
+    args = parse_args(argv)
+    count = args.robots
+    if args.stats or args.profile:
+        instruments.enable(profile = bool(args.profile))
+    poses = None
+    if args.replay:
+        robot_list = [ReplayRobot(log_name(args.replay, number)) for number in xrange(count)]
+    elif args.simulate:
+        rows, columns = args.size
+        start = (rows // 2, columns // 2)
+        if args.map:
+            saved_map = read_map(args.map)
+            rows, columns = saved_map.rows, saved_map.columns
+            start = saved_map.start or (rows // 2, columns // 2)
+            obstacles = obstacle_nodes(saved_map) - set([start])
+        else:
+            obstacles = random_obstacles(rows, columns, 0.2, keep = [start])
+        free = sorted(((row, column) for row in xrange(rows) for column in xrange(columns) if not (row, column) in obstacles), key = lambda node: (abs(node[0] - start[0]) + abs(node[1] - start[1]), node))
+        robot_list = make_fleet([SimulatedRobot(rows, columns, obstacles, location = location, walls_at_border = not args.open_edges, fast = False) for location in free[:count]])
+        poses = [(location, 'up') for location in free[1:count]]
+    else:
+        from HamsterAPI.comm_usb import RobotComm
+        robot_comm = RobotComm(count)
+        robot_comm.start()
+        robot_list = robot_comm.robotList
+
+        while len(robot_list) < count:
+            sleep(0.1)
+
+    # A replay draws the grid's random movements from the seed in its log; a recording keeps a new seed in its log for replaying.
+    seed = robot_list[0].seed if args.replay else random.getrandbits(32)
+    robots = [RobotHandler(robot, record = log_name(args.record, number) if args.record else None, seed = seed) for number, robot in enumerate(robot_list[:count])]
     grid = Grid(500, 500)
-    gui = GUI(robot, grid)
+    grid.random.seed(seed)
+    grid.walls_at_border = not args.open_edges
+    coordinator = None
+    if count > 1:
+        coordinator = Coordinator(grid, robots, poses)
+    gui = GUI(robots[0], grid, coordinator = coordinator, size = args.size, map_file = args.map, unbounded = args.unbounded)
     gui.start()
+    if args.record:
+        for robot in robots:
+            robot.robot.close()
+    if args.stats:
+        instruments.export(args.stats)
+    if args.profile:
+        instruments.dump_profile(args.profile)
 
 
 if __name__ == '__main__':
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,72 @@
+'''File containing the compact binary format maps are saved in.'''
+import os, struct
+from collections import namedtuple
+
+# Constants
+MAGIC = b'GMAP'
+FORMAT_VERSION = 1
+FLAG_HAS_START = 1
+# Magic, format version, flags, rows, columns, start row, start column, map version, number of obstacles outside the grid.
+HEADER = struct.Struct('<4sHHIIiiQI')
+NODE = struct.Struct('<ii')
+FILE_EXTENSION = '.gmap'
+
+'''
+A map as stored on disk. bits is the obstacle bitmap laid out as in ObstacleIndex:
+the obstacle at (row, column) is bit i & 7 of byte i >> 3, where i = row * columns + column.
+outside lists obstacles found past the border of the grid.
+'''
+SavedMap = namedtuple('SavedMap', ['rows', 'columns', 'start', 'version', 'bits', 'outside'])
+
+'''
+Writes a map to a file: a fixed size header, the obstacle bitmap and then the obstacles outside the grid.
+The file is written next to the target and renamed over it, so an interrupted save never leaves half a map.
+'''
+def write_map(filename, saved_map):
+    flags = FLAG_HAS_START if saved_map.start is not None else 0
+    start = saved_map.start if saved_map.start is not None else (-1, -1)
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags, saved_map.rows, saved_map.columns, start[0], start[1], saved_map.version, len(saved_map.outside)))
+        output.write(bytes(saved_map.bits))
+        for node in saved_map.outside:
+            output.write(NODE.pack(node[0], node[1]))
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temporary, filename)
+
+'''
+Reads a map written by write_map. The bitmap is read straight into a bytearray, which ObstacleIndex.load takes over without copying it again.
+Raises ValueError if the file is not a map, is truncated or was written by a newer format version.
+'''
+def read_map(filename):
+    with open(filename, 'rb') as source:
+        header = source.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError('%s is not a saved map.' % filename)
+        magic, version, flags, rows, columns, start_row, start_column, map_version, outside_count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('%s is not a saved map.' % filename)
+        if version > FORMAT_VERSION:
+            raise ValueError('%s was saved in map format %d, which is newer than %d.' % (filename, version, FORMAT_VERSION))
+        bits = bytearray((rows * columns + 7) // 8)
+        if source.readinto(bits) < len(bits):
+            raise ValueError('%s is truncated.' % filename)
+        outside_data = source.read(outside_count * NODE.size)
+        if len(outside_data) < outside_count * NODE.size:
+            raise ValueError('%s is truncated.' % filename)
+    outside = [NODE.unpack_from(outside_data, i * NODE.size) for i in xrange(outside_count)]
+    start = (start_row, start_column) if flags & FLAG_HAS_START else None
+    return SavedMap(rows, columns, start, map_version, bits, outside)
+
+'''Returns the obstacles of a saved map as a set of nodes, including those outside the grid.'''
+def obstacle_nodes(saved_map):
+    bits = bytearray(saved_map.bits)
+    nodes = set(tuple(node) for node in saved_map.outside)
+    for byte_index, byte in enumerate(bits):
+        if byte:
+            for bit in xrange(8):
+                if byte & (1 << bit):
+                    index = (byte_index << 3) + bit
+                    nodes.add((index // saved_map.columns, index % saved_map.columns))
+    return nodes
@@ -0,0 +1,212 @@
+'''File containing the tiled raster view used to display large grids.'''
+import Tkinter as tk
+
+# Constants
+TILE_PIXELS = 128
+MIN_PIXELS_PER_CELL = 1.0 / 64
+MAX_PIXELS_PER_CELL = 32.0
+COLOUR_START = '#f00'
+COLOUR_OBSTACLE = '#0f0'
+COLOUR_FREE = '#00f'
+COLOUR_ABSENT = '#000'
+MARKER_COLOURS = ['#fff', '#ff0', '#f0f', '#0ff', '#f80', '#888']
+PATH_COLOURS = ['#ff0', '#f0f', '#0ff', '#fff', '#f80', '#888']
+DIRECTION_ARROWS = {
+    'up': (0, -1),
+    'right': (1, 0),
+    'down': (0, 1),
+    'left': (-1, 0)
+}
+
+'''
+Displays a grid as raster images instead of one canvas item per node and edge.
+The map is cut into square tiles of TILE_PIXELS pixels, each a PhotoImage rendered only once it scrolls into view.
+When zoomed out below one pixel per cell a tile samples every few cells, so rendering costs follow the pixels on screen, not the size of the map.
+The pose and planned path of every robot are drawn as vector overlays on top. Drag to pan and use the mouse wheel or +/- to zoom.
+The view covers the grid's display area when it is created, which for an unbounded grid starts at an origin other than (0, 0).
+'''
+class TiledMapView(object):
+    '''Initialises the view of a grid on a canvas, zoomed to fit if no scale is given.'''
+    def __init__(self, canvas, grid, pixels_per_cell = None):
+        self.canvas = canvas
+        self.grid = grid
+        self.width = int(float(canvas.cget('width')))
+        self.height = int(float(canvas.cget('height')))
+        self.first_row, self.first_column, self.rows, self.columns = grid.display_area()
+        self.pixels_per_cell = pixels_per_cell or self.fit_scale()
+        self.tiles = {}
+        self.pose_markers = {}
+        self.path_lines = {}
+        self.poses = {}
+        self.paths = {}
+        self.canvas.bind('<ButtonPress-1>', self.start_pan)
+        self.canvas.bind('<B1-Motion>', self.pan)
+        self.canvas.bind('<Button-4>', lambda event: self.zoom(2.0))
+        self.canvas.bind('<Button-5>', lambda event: self.zoom(0.5))
+        self.canvas.bind('<MouseWheel>', lambda event: self.zoom(2.0 if event.delta > 0 else 0.5))
+        self.canvas.bind_all('<plus>', lambda event: self.zoom(2.0))
+        self.canvas.bind_all('<minus>', lambda event: self.zoom(0.5))
+
+    '''Removes the pan and zoom bindings, before the canvas is handed to another view.'''
+    def close(self):
+        for sequence in ('<ButtonPress-1>', '<B1-Motion>', '<Button-4>', '<Button-5>', '<MouseWheel>'):
+            self.canvas.unbind(sequence)
+        for sequence in ('<plus>', '<minus>'):
+            self.canvas.unbind_all(sequence)
+
+    '''Returns the largest power of two pixels per cell that fits the whole grid on the canvas.'''
+    def fit_scale(self):
+        cells = max(self.rows, self.columns, 1)
+        scale = MAX_PIXELS_PER_CELL
+        while scale > MIN_PIXELS_PER_CELL and scale * cells > min(self.width, self.height):
+            scale /= 2.0
+        return scale
+
+    '''Returns the number of cells along the side of a tile.'''
+    def tile_cells(self):
+        return max(1, int(round(TILE_PIXELS / self.pixels_per_cell)))
+
+    '''Returns the number of cells a pixel of a zoomed out tile stands for along each side.'''
+    def stride(self):
+        return max(1, int(round(1.0 / self.pixels_per_cell)))
+
+    '''Clears the canvas and draws the visible part of the map with its overlays.'''
+    def draw(self):
+        for image, item in self.tiles.values():
+            self.canvas.delete(item)
+        self.tiles = {}
+        width = int(self.columns * self.pixels_per_cell)
+        height = int(self.rows * self.pixels_per_cell)
+        self.canvas.configure(scrollregion = (0, 0, max(width, 1), max(height, 1)))
+        self.refresh()
+
+    '''Renders the tiles that have come into view and redraws the overlays.'''
+    def refresh(self):
+        for tile in self.visible_tiles():
+            if not tile in self.tiles:
+                self.render_tile(tile)
+        self.draw_overlays()
+
+    '''Returns the (tile row, tile column) of every tile overlapping the visible part of the canvas.'''
+    def visible_tiles(self):
+        left, top = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        right, bottom = self.canvas.canvasx(self.width), self.canvas.canvasy(self.height)
+        tile_columns = (self.columns + self.tile_cells() - 1) // self.tile_cells()
+        tile_rows = (self.rows + self.tile_cells() - 1) // self.tile_cells()
+        tiles = []
+        for tile_y in xrange(max(0, int(top // TILE_PIXELS)), min(tile_rows, int(bottom // TILE_PIXELS) + 1)):
+            for tile_x in xrange(max(0, int(left // TILE_PIXELS)), min(tile_columns, int(right // TILE_PIXELS) + 1)):
+                tiles.append((tile_y, tile_x))
+        return tiles
+
+    '''Returns the colour of a cell.'''
+    def cell_colour(self, node):
+        if node == self.grid.start_node:
+            return COLOUR_START
+        elif node in self.grid.obstacles:
+            return COLOUR_OBSTACLE
+        elif node in self.grid.nodes:
+            return COLOUR_FREE
+        else:
+            return COLOUR_ABSENT
+
+    '''
+    Renders one tile into a PhotoImage and places it on the canvas.
+    Tile row 0 is at the top of the canvas, which shows the highest grid rows, as the vector display does.
+    '''
+    def render_tile(self, tile):
+        tile_y, tile_x = tile
+        cells, stride = self.tile_cells(), self.stride()
+        top_row = self.first_row + self.rows - 1 - tile_y * cells
+        first_column = self.first_column + tile_x * cells
+        last_column = self.first_column + self.columns
+        rows = []
+        for row in xrange(top_row, max(top_row - cells, self.first_row - 1), -stride):
+            rows.append('{' + ' '.join(self.cell_colour((row, column)) for column in xrange(first_column, min(first_column + cells, last_column), stride)) + '}')
+        image = tk.PhotoImage(width = (len(rows[0].split()) if rows else 0), height = len(rows))
+        if rows:
+            image.put(' '.join(rows))
+        if self.pixels_per_cell > 1:
+            image = image.zoom(int(self.pixels_per_cell))
+        item = self.canvas.create_image(tile_x * TILE_PIXELS, tile_y * TILE_PIXELS, image = image, anchor = 'nw')
+        self.canvas.tag_lower(item)
+        self.tiles[tile] = (image, item)
+
+    '''Returns the canvas coordinates of the centre of a cell.'''
+    def cell_centre(self, node):
+        return ((node[1] - self.first_column + 0.5) * self.pixels_per_cell, (self.first_row + self.rows - node[0] - 0.5) * self.pixels_per_cell)
+
+    '''Returns if a cell lies inside the area the view covers.'''
+    def covers(self, node):
+        return 0 <= node[0] - self.first_row < self.rows and 0 <= node[1] - self.first_column < self.columns
+
+    '''Recolours a cell in its tile, if the tile has been rendered and shows that cell.'''
+    def update_cell(self, node):
+        if not self.covers(node):
+            return
+        cells, stride = self.tile_cells(), self.stride()
+        flipped_row = self.first_row + self.rows - 1 - node[0]
+        column = node[1] - self.first_column
+        tile = (flipped_row // cells, column // cells)
+        if not tile in self.tiles:
+            return
+        y, x = flipped_row - tile[0] * cells, column - tile[1] * cells
+        if y % stride or x % stride:
+            return
+        size = max(1, int(self.pixels_per_cell))
+        x, y = x // stride * size, y // stride * size
+        self.tiles[tile][0].put(self.cell_colour(node), to = (x, y, x + size, y + size))
+
+    '''Moves the marker of a robot to a pose.'''
+    def show_pose(self, location, direction, robot_id = 0):
+        self.poses[robot_id] = (location, direction)
+        self.draw_overlays()
+
+    '''Draws the planned path of a robot, or removes it if the path is empty.'''
+    def show_path(self, path, robot_id = 0):
+        self.paths[robot_id] = path
+        self.draw_overlays()
+
+    '''Redraws the robot markers and planned paths at the current zoom.'''
+    def draw_overlays(self):
+        for item in self.path_lines.values() + self.pose_markers.values():
+            self.canvas.delete(item)
+        self.path_lines = {}
+        self.pose_markers = {}
+        for robot_id, path in self.paths.items():
+            if path and len(path) > 1:
+                points = []
+                for node in path:
+                    points.extend(self.cell_centre(node))
+                self.path_lines[robot_id] = self.canvas.create_line(*points, fill = PATH_COLOURS[robot_id % len(PATH_COLOURS)], width = 2)
+        for robot_id, (location, direction) in self.poses.items():
+            if location is None:
+                continue
+            x, y = self.cell_centre(location)
+            arrow_x, arrow_y = DIRECTION_ARROWS[direction]
+            size = max(6.0, self.pixels_per_cell)
+            self.pose_markers[robot_id] = self.canvas.create_line(x - arrow_x * size, y - arrow_y * size, x + arrow_x * size, y + arrow_y * size, fill = MARKER_COLOURS[robot_id % len(MARKER_COLOURS)], width = 3, arrow = 'last')
+
+    '''Starts panning from the pointer position.'''
+    def start_pan(self, event):
+        self.canvas.scan_mark(event.x, event.y)
+
+    '''Pans the view with the pointer and renders any tiles that come into view.'''
+    def pan(self, event):
+        self.canvas.scan_dragto(event.x, event.y, gain = 1)
+        self.refresh()
+
+    '''Zooms by a factor about the centre of the view.'''
+    def zoom(self, factor):
+        scale = min(MAX_PIXELS_PER_CELL, max(MIN_PIXELS_PER_CELL, self.pixels_per_cell * factor))
+        if scale == self.pixels_per_cell:
+            return
+        centre_x = self.canvas.canvasx(self.width / 2.0) / self.pixels_per_cell
+        centre_y = self.canvas.canvasy(self.height / 2.0) / self.pixels_per_cell
+        self.pixels_per_cell = scale
+        self.draw()
+        width = max(self.columns * scale, 1.0)
+        height = max(self.rows * scale, 1.0)
+        self.canvas.xview_moveto(max(0.0, (centre_x * scale - self.width / 2.0) / width))
+        self.canvas.yview_moveto(max(0.0, (centre_y * scale - self.height / 2.0) / height))
+        self.refresh()
@@ -0,0 +1,185 @@
+'''File containing the obstacle index shared by mapping, search and rendering.'''
+from binascii import hexlify
+from collections import deque
+from itertools import islice
+from threading import Lock
+
+# Constants
+DEFAULT_LOG_SIZE = 4096
+
+'''
+Set of obstacle nodes with constant time membership tests.
+Nodes inside the grid are stored in a bitmap, nodes outside it (such as walls found past the border) in a hashed set.
+Every change bumps a version counter and is kept in a bounded change log, so readers can ask what changed since the version they last saw.
+Listeners are also called with every change as it happens.
+'''
+class ObstacleIndex(object):
+    '''Initialises an empty index over a grid with the given number of rows and columns.'''
+    def __init__(self, rows = 0, columns = 0, log_size = DEFAULT_LOG_SIZE):
+        self.rows = int(rows)
+        self.columns = int(columns)
+        self.bits = bytearray((self.rows * self.columns + 7) // 8)
+        self.outside = set([])
+        self.count = 0
+        self.version = 0
+        self.log = deque(maxlen = log_size)
+        self.log_floor = 0
+        self.lock = Lock()
+        self.listeners = []
+
+    '''Changes the grid dimensions, keeping every obstacle already in the index.'''
+    def resize(self, rows, columns):
+        with self.lock:
+            obstacles = self._snapshot()
+            self.rows = int(rows)
+            self.columns = int(columns)
+            self.bits = bytearray((self.rows * self.columns + 7) // 8)
+            self.outside = set([])
+            self.count = 0
+            for node in obstacles:
+                self._set(node)
+
+    '''
+    Replaces the dimensions and every obstacle at once, for instance with a bitmap read from a saved map.
+    A bytearray bitmap is taken over rather than copied, so the caller must not change it afterwards.
+    Listeners are not called and readers asking for the changes since an earlier version are told to rescan.
+    '''
+    def load(self, rows, columns, bits, outside = (), version = 0):
+        rows, columns = int(rows), int(columns)
+        if not isinstance(bits, bytearray):
+            bits = bytearray(bits)
+        if len(bits) != (rows * columns + 7) // 8:
+            raise ValueError('A %dx%d bitmap needs %d bytes, not %d.' % (rows, columns, (rows * columns + 7) // 8, len(bits)))
+        if rows * columns % 8:
+            bits[-1] &= (1 << (rows * columns % 8)) - 1
+        with self.lock:
+            self.rows = rows
+            self.columns = columns
+            self.bits = bits
+            self.outside = set(tuple(node) for node in outside if not self._in_bounds(node))
+            self.count = (bin(int(hexlify(bits), 16)).count('1') if bits else 0) + len(self.outside)
+            self.version = max(self.version + 1, version)
+            self.log.clear()
+            self.log_floor = self.version
+
+    '''Returns the rows, columns, version, a copy of the bitmap and the obstacles outside it, all taken at once.'''
+    def dump(self):
+        with self.lock:
+            return self.rows, self.columns, self.version, bytes(self.bits), sorted(self.outside)
+
+    '''Adds an obstacle. Returns if the index changed.'''
+    def add(self, node):
+        node = tuple(node)
+        with self.lock:
+            if self._contains(node):
+                return False
+            self._set(node)
+            self._record(node, True)
+        self._notify(node, True)
+        return True
+
+    '''Removes an obstacle. Returns if the index changed.'''
+    def discard(self, node):
+        node = tuple(node)
+        with self.lock:
+            if not self._contains(node):
+                return False
+            if self._in_bounds(node):
+                index = node[0] * self.columns + node[1]
+                self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xff
+            else:
+                self.outside.discard(node)
+            self.count -= 1
+            self._record(node, False)
+        self._notify(node, False)
+        return True
+
+    '''Removes every obstacle.'''
+    def clear(self):
+        for node in list(self):
+            self.discard(node)
+
+    '''
+    Returns the current version and the (node, added) changes made after the given version.
+    Returns None instead of the changes when the log no longer reaches back that far and the caller must rescan.
+    '''
+    def changes_since(self, version):
+        with self.lock:
+            if version < self.log_floor:
+                return self.version, None
+            return self.version, [(node, added) for _, node, added in islice(self.log, version - self.log_floor, None)]
+
+    '''Returns if a node is an obstacle.'''
+    def __contains__(self, node):
+        if not self.count:
+            return False
+        row, column = node
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            index = row * self.columns + column
+            return bool(self.bits[index >> 3] & (1 << (index & 7)))
+        return (row, column) in self.outside
+
+    '''Returns the flat indices (row * columns + column) of the obstacles from start up to but not including end.'''
+    def indices_in_range(self, start, end):
+        if start >= end or not self.count:
+            return []
+        indices = []
+        bits = self.bits
+        for byte_index in xrange(start >> 3, ((end - 1) >> 3) + 1):
+            byte = bits[byte_index]
+            if byte:
+                for bit in xrange(8):
+                    if byte & (1 << bit) and start <= (byte_index << 3) + bit < end:
+                        indices.append((byte_index << 3) + bit)
+        return indices
+
+    '''Returns the number of obstacles.'''
+    def __len__(self):
+        return self.count
+
+    '''Iterates over a snapshot of the obstacles.'''
+    def __iter__(self):
+        with self.lock:
+            return iter(self._snapshot())
+
+    '''Returns if a node lies inside the bitmap.'''
+    def _in_bounds(self, node):
+        return 0 <= node[0] < self.rows and 0 <= node[1] < self.columns
+
+    '''Returns if a node is an obstacle without taking the lock.'''
+    def _contains(self, node):
+        if self._in_bounds(node):
+            index = node[0] * self.columns + node[1]
+            return bool(self.bits[index >> 3] & (1 << (index & 7)))
+        return node in self.outside
+
+    '''Stores a node that is not yet an obstacle without taking the lock.'''
+    def _set(self, node):
+        if self._in_bounds(node):
+            index = node[0] * self.columns + node[1]
+            self.bits[index >> 3] |= 1 << (index & 7)
+        else:
+            self.outside.add(node)
+        self.count += 1
+
+    '''Appends a change to the log, moving the floor forward if the oldest entry falls off.'''
+    def _record(self, node, added):
+        self.version += 1
+        if len(self.log) == self.log.maxlen:
+            self.log_floor = self.log[0][0]
+        self.log.append((self.version, node, added))
+
+    '''Calls every listener with a change, outside the lock.'''
+    def _notify(self, node, added):
+        for listener in self.listeners:
+            listener(node, added)
+
+    '''Lists the obstacles without taking the lock.'''
+    def _snapshot(self):
+        obstacles = list(self.outside)
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        obstacles.append(divmod(byte_index * 8 + bit, self.columns))
+        return obstacles
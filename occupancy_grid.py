@@ -0,0 +1,145 @@
+'''File containing the array-backed occupancy grid used as the node store of the grid.'''
+
+# Constants
+ABSENT = 0
+PRESENT = 1
+PRESENT_BYTE = b'\x01'
+ABSENT_BYTE = b'\x00'
+NEIGHBOUR_OFFSETS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+# The eight cells a bitmap byte stands for, absent where its bit is set.
+BYTE_CELLS = [bytes(bytearray(ABSENT if byte & (1 << bit) else PRESENT for bit in range(8))) for byte in range(256)]
+
+'''
+Stores which cells of a rows x columns grid are nodes in a flat bytearray.
+Adjacency is implicit: two nodes are neighbours if they are present and 4-adjacent.
+The object behaves like the old dict of neighbour sets keyed by (row, column).
+'''
+class OccupancyGrid(object):
+    '''Initialises an empty grid with the given number of rows and columns.'''
+    def __init__(self, rows = 0, columns = 0):
+        self.rows = int(rows)
+        self.columns = int(columns)
+        self.cells = bytearray(self.rows * self.columns)
+        self.size = 0
+        # Entries taken off the stack by flood fills, counted like the expansions of a planner.
+        self.expansions = 0
+
+    '''Marks every cell of the grid as a node.'''
+    def fill(self):
+        self.cells = bytearray([PRESENT]) * (self.rows * self.columns)
+        self.size = self.rows * self.columns
+
+    '''Marks every cell of the grid as a node except those set in a bitmap laid out as in ObstacleIndex.'''
+    def fill_except(self, bits):
+        self.cells = bytearray(b''.join([BYTE_CELLS[byte] for byte in bytearray(bits)])[:self.rows * self.columns])
+        self.size = self.cells.count(PRESENT_BYTE)
+
+    '''Returns if a node lies inside the grid.'''
+    def in_bounds(self, node):
+        return 0 <= node[0] < self.rows and 0 <= node[1] < self.columns
+
+    '''Returns the flat index of a node.'''
+    def index(self, node):
+        return node[0] * self.columns + node[1]
+
+    '''Returns the node at a flat index.'''
+    def node(self, index):
+        return divmod(index, self.columns)
+
+    '''Adds a node.'''
+    def add(self, node):
+        if not self.in_bounds(node):
+            raise IndexError('Node %s is outside the %dx%d grid.' % (node, self.rows, self.columns))
+        index = self.index(node)
+        if not self.cells[index]:
+            self.cells[index] = PRESENT
+            self.size += 1
+
+    '''Removes a node if it is present.'''
+    def discard(self, node):
+        if self.in_bounds(node):
+            index = self.index(node)
+            if self.cells[index]:
+                self.cells[index] = ABSENT
+                self.size -= 1
+
+    '''Returns the present 4-neighbours of a node.'''
+    def neighbours(self, node):
+        row, column = node
+        neighbours = []
+        for row_diff, column_diff in NEIGHBOUR_OFFSETS:
+            neighbour_row, neighbour_column = row + row_diff, column + column_diff
+            if 0 <= neighbour_row < self.rows and 0 <= neighbour_column < self.columns and self.cells[neighbour_row * self.columns + neighbour_column]:
+                neighbours.append((neighbour_row, neighbour_column))
+        return neighbours
+
+    '''Returns an empty grid of the same size, which serves as a compact set of its nodes.'''
+    def empty_copy(self):
+        return OccupancyGrid(self.rows, self.columns)
+
+    '''Returns the nodes reachable from start without passing through a blocked node.'''
+    def flood_fill(self, start, blocked = ()):
+        return set(self.flood_marks(start, blocked))
+
+    '''
+    Returns the nodes reachable from start without passing through a blocked node, as a grid of the same size holding only them.
+    Fills a row segment at a time with slice assignments, seeding the rows above and below from the free runs next to it,
+    so open space costs a few operations per segment rather than per node.
+    '''
+    def flood_marks(self, start, blocked = ()):
+        start = tuple(start)
+        marks = self.empty_copy()
+        if not start in self:
+            return marks
+        columns = self.columns
+        free = bytearray(self.cells)
+        for node in blocked:
+            if self.in_bounds(node):
+                free[self.index(node)] = ABSENT
+        start_index = self.index(start)
+        free[start_index] = PRESENT
+        stack = [start_index]
+        while stack:
+            index = stack.pop()
+            self.expansions += 1
+            if not free[index]:
+                continue
+            row_start = index - index % columns
+            left = free.rfind(ABSENT_BYTE, row_start, index)
+            left = row_start if left == -1 else left + 1
+            right = free.find(ABSENT_BYTE, index, row_start + columns)
+            right = row_start + columns if right == -1 else right
+            free[left:right] = bytearray(right - left)
+            marks.cells[left:right] = PRESENT_BYTE * (right - left)
+            marks.size += right - left
+            for low in (left - columns, left + columns):
+                if low < 0 or low >= len(free):
+                    continue
+                high = low + right - left
+                seed = free.find(PRESENT_BYTE, low, high)
+                while seed != -1:
+                    stack.append(seed)
+                    gap = free.find(ABSENT_BYTE, seed, high)
+                    seed = -1 if gap == -1 else free.find(PRESENT_BYTE, gap, high)
+        return marks
+
+    '''Returns the neighbours of a node as a set, like the old dict of sets.'''
+    def __getitem__(self, node):
+        if not node in self:
+            raise KeyError(node)
+        return set(self.neighbours(node))
+
+    '''Returns if a node is present.'''
+    def __contains__(self, node):
+        return self.in_bounds(node) and self.cells[self.index(node)] == PRESENT
+
+    '''Returns the number of nodes.'''
+    def __len__(self):
+        return self.size
+
+    '''Iterates over the present nodes in row-major order.'''
+    def __iter__(self):
+        index = self.cells.find(PRESENT_BYTE)
+        while index != -1:
+            yield divmod(index, self.columns)
+            index = self.cells.find(PRESENT_BYTE, index + 1)
@@ -0,0 +1,199 @@
+'''File containing the path planning engine used by the grid.'''
+import heapq
+from collections import deque
+
+'''
+Plans paths over the nodes of a grid, avoiding its obstacles.
+Searches use a deque or heap with parent pointers and mark nodes visited when they are queued.
+Shortest-path trees are cached per root and thrown away only when the nodes or obstacles change.
+'''
+class PathPlanner(object):
+    '''Initialises the planner for a grid.'''
+    def __init__(self, grid):
+        self.grid = grid
+        self.trees = {}
+        self.trees_key = None
+        self.expansions = 0
+
+    '''Returns if a node can be entered.'''
+    def passable(self, node):
+        return node in self.grid.nodes and not node in self.grid.obstacles
+
+    '''Returns the passable neighbours of a node.'''
+    def neighbours(self, node):
+        obstacles = self.grid.obstacles
+        return [neighbour for neighbour in self.grid.nodes.neighbours(node) if not neighbour in obstacles]
+
+    '''BFS to find a shortest path from start to goal. Returns None if there is no path.'''
+    def bfs(self, start, goal):
+        start, goal = tuple(start), tuple(goal)
+        if start == goal:
+            return [start]
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            self.expansions += 1
+            for neighbour in self.neighbours(node):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = node
+                if neighbour == goal:
+                    return self.reconstruct(parents, goal)
+                queue.append(neighbour)
+        return None
+
+    '''
+    BFS to find a shortest path from start to the nearest node satisfying a predicate. Returns None if there is no such node.
+    Nodes in avoid, such as those other robots stand on, are not entered.
+    Takes limit as an optional argument: the number of nodes to expand before giving up and returning None.
+    '''
+    def nearest(self, start, predicate, avoid = (), limit = None):
+        start = tuple(start)
+        if predicate(start):
+            return [start]
+        parents = {start: None}
+        queue = deque([start])
+        expansions = 0
+        while queue:
+            if limit is not None and expansions >= limit:
+                return None
+            node = queue.popleft()
+            expansions += 1
+            self.expansions += 1
+            for neighbour in self.neighbours(node):
+                if neighbour in parents or neighbour in avoid:
+                    continue
+                parents[neighbour] = node
+                if predicate(neighbour):
+                    return self.reconstruct(parents, neighbour)
+                queue.append(neighbour)
+        return None
+
+    '''A* with the Manhattan distance heuristic, breaking ties towards deeper nodes. Returns None if there is no path.'''
+    def astar(self, start, goal):
+        start, goal = tuple(start), tuple(goal)
+        parents = {start: None}
+        costs = {start: 0}
+        heap = [(self.heuristic(start, goal), 0, start)]
+        while heap:
+            _, negative_cost, node = heapq.heappop(heap)
+            cost = -negative_cost
+            if node == goal:
+                return self.reconstruct(parents, goal)
+            if cost > costs[node]:
+                continue
+            self.expansions += 1
+            for neighbour in self.neighbours(node):
+                neighbour_cost = cost + 1
+                if neighbour_cost < costs.get(neighbour, neighbour_cost + 1):
+                    costs[neighbour] = neighbour_cost
+                    parents[neighbour] = node
+                    heapq.heappush(heap, (neighbour_cost + self.heuristic(neighbour, goal), -neighbour_cost, neighbour))
+        return None
+
+    '''
+    Returns a shortest path from start to goal with as few turns as possible, or None if there is no path.
+    heading is the (row, column) step the robot faces at the start, or None if it does not matter.
+    A quarter turn costs one and a half turn two. Turns are only counted over the nodes lying on some shortest path.
+    '''
+    def fewest_turns(self, start, goal, heading = None):
+        start, goal = tuple(start), tuple(goal)
+        if start == goal:
+            return [start]
+        depths = {start: 0}
+        queue = deque([start])
+        while queue and not goal in depths:
+            node = queue.popleft()
+            self.expansions += 1
+            for neighbour in self.neighbours(node):
+                if not neighbour in depths:
+                    depths[neighbour] = depths[node] + 1
+                    queue.append(neighbour)
+        if not goal in depths:
+            return None
+        # Walk back from the goal, one depth at a time, to find the nodes on shortest paths.
+        layers = [[goal]]
+        on_path = set([goal])
+        for depth in xrange(depths[goal] - 1, -1, -1):
+            layer = []
+            for node in layers[-1]:
+                for neighbour in self.neighbours(node):
+                    if depths.get(neighbour) == depth and not neighbour in on_path:
+                        on_path.add(neighbour)
+                        layer.append(neighbour)
+            layers.append(layer)
+        layers.reverse()
+        # The cheapest way into every node on them for each heading, with the state it came from.
+        states = {start: {heading: (0, None)}}
+        for layer in layers[:-1]:
+            for node in layer:
+                for node_heading, (cost, _) in states[node].items():
+                    for neighbour in self.neighbours(node):
+                        if not neighbour in on_path or depths[neighbour] != depths[node] + 1:
+                            continue
+                        step = (neighbour[0] - node[0], neighbour[1] - node[1])
+                        step_cost = cost + self.turn_cost(node_heading, step)
+                        entries = states.setdefault(neighbour, {})
+                        if not step in entries or step_cost < entries[step][0]:
+                            entries[step] = (step_cost, (node, node_heading))
+        entries = states[goal]
+        state = entries[min(entries, key = lambda step: entries[step][0])][1]
+        path = [goal]
+        while state is not None:
+            path.append(state[0])
+            state = states[state[0]][state[1]][1]
+        path.reverse()
+        return path
+
+    '''Returns the number of quarter turns between two headings. Any heading follows None for free.'''
+    def turn_cost(self, heading, step):
+        if heading is None or heading == step:
+            return 0
+        elif heading == (-step[0], -step[1]):
+            return 2
+        return 1
+
+    '''Returns the Manhattan distance between two nodes.'''
+    def heuristic(self, node, goal):
+        return abs(node[0] - goal[0]) + abs(node[1] - goal[1])
+
+    '''Returns the shortest-path tree rooted at a node as a dict of parent pointers, using the cache when it is still valid.'''
+    def tree(self, root):
+        root = tuple(root)
+        key = (id(self.grid.nodes), len(self.grid.nodes), self.grid.obstacles.version)
+        if key != self.trees_key:
+            self.trees = {}
+            self.trees_key = key
+        if not root in self.trees:
+            parents = {root: None}
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                self.expansions += 1
+                for neighbour in self.neighbours(node):
+                    if not neighbour in parents:
+                        parents[neighbour] = node
+                        queue.append(neighbour)
+            self.trees[root] = parents
+        return self.trees[root]
+
+    '''Returns a shortest path from a node to the root of its tree, or None if the root cannot be reached.'''
+    def path_to_root(self, root, node):
+        parents = self.tree(root)
+        node = tuple(node)
+        if not node in parents:
+            return None
+        path = [node]
+        while parents[node] is not None:
+            node = parents[node]
+            path.append(node)
+        return path
+
+    '''Follows parent pointers back from the goal to build a path.'''
+    def reconstruct(self, parents, goal):
+        path = [goal]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        path.reverse()
+        return path
@@ -0,0 +1,146 @@
+'''File containing the incremental reachability tracker used to decide when mapping is finished.'''
+from collections import deque
+from threading import RLock
+from occupancy_grid import OccupancyGrid
+
+# Constants
+RING_OFFSETS = ((1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1))
+
+'''
+Tracks the nodes reachable from a root and how many of them are still unvisited.
+The reachable and visited nodes are kept in empty copies of the grid's node store, one byte per cell, rather than sets of tuples.
+Obstacle changes are read from the grid's obstacle index and applied one at a time.
+A new obstacle only triggers a full recount when the nodes around it stop being connected to each other.
+Nodes added to an unbounded grid as it is explored are passed in with add_node.
+Several robots may share a tracker, so its public methods hold a lock.
+'''
+class ReachabilityTracker(object):
+    '''Initialises the tracker for a grid.'''
+    def __init__(self, grid):
+        self.grid = grid
+        self.root = None
+        self.nodes = None
+        self.version = 0
+        self.reachable = OccupancyGrid()
+        self.visited = OccupancyGrid()
+        self.unvisited = 0
+        self.recounts = 0
+        self.lock = RLock()
+
+    '''Starts tracking from a root unless already tracking it on the current nodes.'''
+    def track(self, root):
+        with self.lock:
+            root = tuple(root)
+            if root != self.root or self.nodes is not self.grid.nodes:
+                self.root = root
+                self.nodes = self.grid.nodes
+                self.visited = self.nodes.empty_copy()
+                self.recount()
+
+    '''Recomputes the reachable nodes from scratch, forgetting visits to nodes no longer reachable.'''
+    def recount(self):
+        with self.lock:
+            self.version = self.grid.obstacles.version
+            expansions = self.nodes.expansions
+            self.reachable = self.nodes.flood_marks(self.root, self.grid.obstacles)
+            self.grid.planner.expansions += self.nodes.expansions - expansions
+            for node in [node for node in self.visited if not node in self.reachable]:
+                self.visited.discard(node)
+            self.unvisited = len(self.reachable) - len(self.visited)
+            self.recounts += 1
+
+    '''Marks a node as visited.'''
+    def visit(self, node):
+        with self.lock:
+            node = tuple(node)
+            if node in self.reachable and not node in self.visited:
+                self.visited.add(node)
+                self.unvisited -= 1
+
+    '''Returns if every reachable node has been visited.'''
+    def complete(self):
+        with self.lock:
+            self.sync()
+            return self.unvisited == 0
+
+    '''Returns the reachable nodes that have not been visited yet.'''
+    def remaining(self):
+        with self.lock:
+            self.sync()
+            return [node for node in self.reachable if not node in self.visited]
+
+    '''Adds a node just added to the grid, along with anything it connects, if it is not an obstacle.'''
+    def add_node(self, node):
+        with self.lock:
+            if self.nodes is self.grid.nodes and not node in self.grid.obstacles:
+                self.remove_obstacle(node)
+
+    '''Applies the obstacle changes made since the last sync.'''
+    def sync(self):
+        with self.lock:
+            self.version, changes = self.grid.obstacles.changes_since(self.version)
+            if changes is None:
+                self.recount()
+                return
+            for node, added in changes:
+                if added:
+                    self.add_obstacle(node)
+                else:
+                    self.remove_obstacle(node)
+
+    '''Removes a node that became an obstacle.'''
+    def add_obstacle(self, node):
+        if not node in self.reachable:
+            return
+        if node == self.root:
+            self.reachable = self.nodes.empty_copy()
+            self.visited = self.nodes.empty_copy()
+            self.unvisited = 0
+            return
+        self.reachable.discard(node)
+        if node in self.visited:
+            self.visited.discard(node)
+        else:
+            self.unvisited -= 1
+        if not self.locally_connected(node):
+            self.recount()
+
+    '''Adds back a node that stopped being an obstacle, along with anything it reconnects. The root is added back on its own.'''
+    def remove_obstacle(self, node):
+        if not node in self.grid.nodes or node in self.reachable:
+            return
+        if node != self.root and not any(neighbour in self.reachable for neighbour in self.grid.nodes.neighbours(node)):
+            return
+        queue = deque([node])
+        self.reachable.add(node)
+        self.unvisited += 1
+        while queue:
+            current = queue.popleft()
+            for neighbour in self.grid.nodes.neighbours(current):
+                if neighbour in self.reachable or neighbour in self.grid.obstacles:
+                    continue
+                self.reachable.add(neighbour)
+                if not neighbour in self.visited:
+                    self.unvisited += 1
+                queue.append(neighbour)
+
+    '''Returns if the reachable neighbours of a removed node are still connected through the ring of cells around it.'''
+    def locally_connected(self, node):
+        row, column = node
+        neighbours = [neighbour for neighbour in self.grid.nodes.neighbours(node) if neighbour in self.reachable]
+        if len(neighbours) <= 1:
+            return True
+        ring = set([])
+        for row_diff, column_diff in RING_OFFSETS:
+            cell = (row + row_diff, column + column_diff)
+            if cell in self.reachable:
+                ring.add(cell)
+        reached = set([neighbours[0]])
+        queue = deque([neighbours[0]])
+        while queue:
+            current = queue.popleft()
+            for neighbour in ((current[0] + 1, current[1]), (current[0] - 1, current[1]), (current[0], current[1] + 1), (current[0], current[1] - 1)):
+                if neighbour in ring and not neighbour in reached:
+                    reached.add(neighbour)
+                    queue.append(neighbour)
+        return all(neighbour in reached for neighbour in neighbours)
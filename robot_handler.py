@@ -1,144 +1,257 @@
 '''File containing the class controlling the robot'''
 import random
-from threading import Thread
+from threading import Thread, Event
+from Queue import Queue, Empty
 from time import sleep
+from directions import DIRECTIONS, STEP_DIRECTIONS
+from instrumentation import instruments
+from robot_log import RecordingRobot
 
-'''Controls the movement and sensing of the robot.'''
+# Constants
+POLL_INTERVAL = 0.01
+# The turns from one heading to another, by how many quarter turns clockwise the second is from the first.
+TURNS = [[], ['right'], ['right', 'right'], ['left']]
+
+'''Merges runs of the same movement into (movement, count) pairs, so a straight run or a half turn is made without stopping.'''
+def compress(directions):
+    runs = []
+    for direction in directions:
+        if runs and runs[-1][0] == direction:
+            runs[-1] = (direction, runs[-1][1] + 1)
+        else:
+            runs.append((direction, 1))
+    return runs
+
+'''Result of a movement queued on the control thread of a RobotHandler.'''
+class MoveFuture(object):
+    '''Initialises an unfinished future for a movement repeated count times, which a check may cut short.'''
+    def __init__(self, movement, count = 1, check = None):
+        self.movement = movement
+        self.count = count
+        self.check = check
+        self.completed = 0
+        self.finished = Event()
+        self.error = None
+
+    '''Returns if the movement has finished.'''
+    def done(self):
+        return self.finished.is_set()
+
+    '''Waits for the movement to finish and re-raises any error it ended with. Returns the movement.'''
+    def result(self, timeout = None):
+        if not self.finished.wait(timeout):
+            raise RuntimeError('Movement %r did not finish within %s seconds.' % (self.movement, timeout))
+        if self.error is not None:
+            raise self.error
+        return self.movement
+
+    '''Marks the movement as finished after completing some of its repeats, with the error it ended with if any.'''
+    def finish(self, error = None, completed = 0):
+        self.error = error
+        self.completed = completed
+        self.finished.set()
+
+'''
+Controls the movement and sensing of the robot.
+Movements run one after another on a control thread fed by a command queue, so callers can plan while the robot moves.
+The control loops read the floor sensors once every poll_interval seconds and only send wheel speeds that changed.
+Given a record file, every sensor read and actuator command is appended to it, to be played back later by ReplayRobot,
+along with the seed the grid's random movements are drawn with.
+'''
 class RobotHandler(object):
-    '''Initialises the robot.'''
-    def __init__(self, robot, initial_direction = 'up'):
-        self.robot = robot
+    '''Initialises the robot, recording its sensor reads and commands, after the seed of the grid's random movements, to the record file if one is given.'''
+    def __init__(self, robot, initial_direction = 'up', poll_interval = POLL_INTERVAL, record = None, seed = 0):
+        self.robot = RecordingRobot(robot, record, seed) if record else robot
         self.floor_thresh = 40
         self.prox_thresh = 60
         self.initial_direction = initial_direction
+        self.sleep = getattr(robot, 'sleep', sleep)
+        self.poll_interval = poll_interval
+        self.wheels = [None, None]
+        self.commands = Queue()
+        self.control_thread = None
+
+    '''Plays a note for a while.'''
+    def beep(self, note = 50, duration = 0.3):
+        self.robot.set_musical_note(note)
+        self.sleep(duration)
+        self.robot.set_musical_note(0)
 
     '''Returns if there is an obstacle in front.'''
     def obstacle_in_front(self):
+        instruments.count('robot.proximity_reads')
         return self.robot.get_proximity(0) > self.prox_thresh or self.robot.get_proximity(1) > self.prox_thresh
    
-    '''Converts a grid path to directions.'''
+    '''Converts a grid path to directions, turning whichever way is shorter before each step.'''
     def path2directions(self, path, last_direction = 'up'):
         directions = []
         last_location = path.pop(0)
         for node in path:
-            diff = map(lambda x, y: x - y, node, last_location)
-            if diff == [0, 1]:
-                if last_direction == 'right':
-                    directions.append('forwards')
-                elif last_direction == 'up':
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'left':
-                    directions.append('right')
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'down':
-                    directions.append('left')
-                    directions.append('forwards')
-                last_direction = 'right'
-            elif diff == [1, 0]:
-                if last_direction == 'right':
-                    directions.append('left')
-                    directions.append('forwards')
-                elif last_direction == 'up':
-                    directions.append('forwards')
-                elif last_direction == 'left':
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'down':
-                    directions.append('right')
-                    directions.append('right')
-                    directions.append('forwards')
-                last_direction = 'up'
-            elif diff == [0, -1]:
-                if last_direction == 'right':
-                    directions.append('right')
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'up':
-                    directions.append('left')
-                    directions.append('forwards')
-                elif last_direction == 'left':
-                    directions.append('forwards')
-                elif last_direction == 'down':
-                    directions.append('right')
-                    directions.append('forwards')
-                last_direction = 'left'
-            elif diff == [-1, 0]:
-                if last_direction == 'right':
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'up':
-                    directions.append('right')
-                    directions.append('right')
-                    directions.append('forwards')
-                elif last_direction == 'left':
-                    directions.append('left')
-                    directions.append('forwards')
-                elif last_direction == 'down':
-                    directions.append('forwards')
-                last_direction = 'down'
+            direction = STEP_DIRECTIONS.get((node[0] - last_location[0], node[1] - last_location[1]))
+            if direction is not None:
+                directions.extend(TURNS[(DIRECTIONS.index(direction) - DIRECTIONS.index(last_direction)) % 4])
+                directions.append('forwards')
+                last_direction = direction
             last_location = node
         return directions, last_direction
     
-    '''Moves robot based on a list of directions.'''
+    '''Moves robot based on a list of directions, driving each run of the same movement in one go.'''
     def move(self, directions):
-        for direction in directions:
-            if direction == 'forwards':
-                self.forwards()
-            elif direction == 'right':
-                self.right()
-            elif direction == 'left':
-                self.left()
-        self.robot.reset()
-    
-    '''Move robot forwards.'''
-    def forwards(self):
-        while self.robot.get_floor(0) > self.floor_thresh or self.robot.get_floor(1) > self.floor_thresh:
-            if self.robot.get_floor(0) < self.floor_thresh:
-                self.robot.set_wheel(0, 0)
-                self.robot.set_wheel(1, 50)
-            elif self.robot.get_floor(1) < self.floor_thresh:
-                self.robot.set_wheel(0, 50)
-                self.robot.set_wheel(1, 0)
+        futures = [self.submit(direction, count) for direction, count in compress(directions)]
+        futures.append(self.submit('stop'))
+        for future in futures:
+            future.result()
+
+    '''
+    Queues a movement ('forwards', 'left', 'right' or 'stop') on the control thread and returns a MoveFuture for it.
+    A count above one drives that many cells or turns that many quarter turns before stopping.
+    Takes check as an optional argument for forwards: a function called at every line crossed before the last,
+    which stops the robot there if it returns True. The future's completed attribute then tells how many cells were driven.
+    The control thread is started on first use.
+    '''
+    def submit(self, movement, count = 1, check = None):
+        if not movement in ('forwards', 'left', 'right', 'stop'):
+            raise ValueError('Unknown movement %r.' % (movement,))
+        if self.control_thread is None:
+            self.control_thread = Thread(target = self.control)
+            self.control_thread.daemon = True
+            self.control_thread.start()
+        future = MoveFuture(movement, count, check)
+        self.commands.put(future)
+        return future
+
+    '''Stops the control thread once the movements already queued have run, then closes the record file if there is one.'''
+    def close(self):
+        if self.control_thread is not None:
+            self.commands.put(None)
+            self.control_thread.join()
+            self.control_thread = None
+        if isinstance(self.robot, RecordingRobot):
+            self.robot.close()
+
+    '''
+    Runs queued movements one after another until closed. Runs on the control thread.
+    When a movement fails, the robot is stopped and the movements queued behind it end with the same error, as they were planned from where it should have got to.
+    '''
+    def control(self):
+        while True:
+            future = self.commands.get()
+            if future is None:
+                return
+            completed = future.count
+            try:
+                with instruments.timer('robot.' + future.movement):
+                    if future.movement == 'forwards':
+                        completed = self.forwards(future.count, future.check)
+                    elif future.movement == 'right':
+                        self.right(future.count)
+                    elif future.movement == 'left':
+                        self.left(future.count)
+                    else:
+                        self.stop()
+            except Exception as error:
+                future.finish(error)
+                if not self.abandon(error):
+                    return
             else:
-                self.robot.set_wheel(0, 40)
-                self.robot.set_wheel(1, 40)
-        while self.robot.get_floor(0) < self.floor_thresh or self.robot.get_floor(1) < self.floor_thresh:
-            self.robot.set_wheel(0, 40)
-            self.robot.set_wheel(1, 40)
+                future.finish(completed = completed)
+
+    '''Stops the robot and finishes every queued movement with an error. Returns False if the handler was closed meanwhile.'''
+    def abandon(self, error):
+        try:
+            self.stop()
+        except Exception:
+            # The robot may be what failed; the caller hears of it through the error already.
+            pass
+        while True:
+            try:
+                future = self.commands.get_nowait()
+            except Empty:
+                return True
+            if future is None:
+                return False
+            future.finish(error)
+
+    '''Sets the wheel speeds, sending only those that changed.'''
+    def set_wheels(self, left, right):
+        if self.wheels[0] != left:
+            self.robot.set_wheel(0, left)
+            self.wheels[0] = left
+            instruments.count('robot.wheel_commands')
+        if self.wheels[1] != right:
+            self.robot.set_wheel(1, right)
+            self.wheels[1] = right
+            instruments.count('robot.wheel_commands')
+
+    '''Stops the wheels and the buzzer.'''
+    def stop(self):
+        self.robot.reset()
+        self.wheels = [None, None]
+
+    '''Waits until the sensors are next due to be polled.'''
+    def wait(self):
+        instruments.count('robot.floor_polls')
+        with instruments.timer('robot.sleep'):
+            self.sleep(self.poll_interval)
+
+    '''Stops at a line and beeps.'''
+    def arrive(self):
+        instruments.count('robot.stops')
         self.robot.set_musical_note(40)
-        self.robot.set_wheel(0, 0)
-        self.robot.set_wheel(1, 0)
-        sleep(0.1)
+        self.set_wheels(0, 0)
+        with instruments.timer('robot.sleep'):
+            self.sleep(0.1)
         self.robot.set_musical_note(0)
     
-    '''Turns robot right.'''
-    def right(self):
-        while self.robot.get_floor(1) > self.floor_thresh:
-            self.robot.set_wheel(0, 40)
-            self.robot.set_wheel(1, -40)
-        while self.robot.get_floor(1) < self.floor_thresh:
-            self.robot.set_wheel(0, 40)
-            self.robot.set_wheel(1, -40)
-        #sleep(0.1)
-        self.robot.set_musical_note(40)
-        self.robot.set_wheel(0, 0)
-        self.robot.set_wheel(1, 0)
-        sleep(0.1)
-        self.robot.set_musical_note(0)
+    '''
+    Move robot forwards by a number of cells, following the line and counting the lines crossed.
+    If a check is given, it is called on every line crossed before the last and the robot stops there if it returns True.
+    Returns the number of cells driven.
+    '''
+    def forwards(self, cells = 1, check = None):
+        driven = 0
+        while driven < cells:
+            while True:
+                left, right = self.robot.get_floor(0), self.robot.get_floor(1)
+                if left < self.floor_thresh and right < self.floor_thresh:
+                    break
+                if left < self.floor_thresh:
+                    self.set_wheels(0, 50)
+                elif right < self.floor_thresh:
+                    self.set_wheels(50, 0)
+                else:
+                    self.set_wheels(40, 40)
+                self.wait()
+            while True:
+                left, right = self.robot.get_floor(0), self.robot.get_floor(1)
+                if left >= self.floor_thresh and right >= self.floor_thresh:
+                    break
+                self.set_wheels(40, 40)
+                self.wait()
+            driven += 1
+            if driven < cells and check is not None and check():
+                break
+        self.arrive()
+        return driven
     
-    '''Turns robot left.'''
-    def left(self):
-        while self.robot.get_floor(0) > self.floor_thresh:
-            self.robot.set_wheel(0, -40)
-            self.robot.set_wheel(1, 40)
-        while self.robot.get_floor(0) < self.floor_thresh:
-            self.robot.set_wheel(0, -40)
-            self.robot.set_wheel(1, 40)
-        #sleep(0.1)
-        self.robot.set_musical_note(40)
-        self.robot.set_wheel(0, 0)
-        self.robot.set_wheel(1, 0)
-        sleep(0.1)
-        self.robot.set_musical_note(0)
+    '''Turns robot right by a number of quarter turns.'''
+    def right(self, turns = 1):
+        for _ in xrange(turns):
+            while self.robot.get_floor(1) > self.floor_thresh:
+                self.set_wheels(40, -40)
+                self.wait()
+            while self.robot.get_floor(1) < self.floor_thresh:
+                self.set_wheels(40, -40)
+                self.wait()
+        self.arrive()
+    
+    '''Turns robot left by a number of quarter turns.'''
+    def left(self, turns = 1):
+        for _ in xrange(turns):
+            while self.robot.get_floor(0) > self.floor_thresh:
+                self.set_wheels(-40, 40)
+                self.wait()
+            while self.robot.get_floor(0) < self.floor_thresh:
+                self.set_wheels(-40, 40)
+                self.wait()
+        self.arrive()
@@ -0,0 +1,196 @@
+'''File containing the binary log of sensor reads and actuator commands, and the robots that record and replay it.'''
+import mmap, os, struct
+from threading import Lock
+from time import sleep
+
+# Constants
+MAGIC = b'RLOG'
+FORMAT_VERSION = 2
+# Magic and format version.
+HEADER = struct.Struct('<4sH')
+# From format version 2 the header goes on with the seed of the grid's random movements, so a replay makes the same choices.
+SEED = struct.Struct('<I')
+# Operation, sensor or wheel index, and the value read or sent.
+RECORD = struct.Struct('<BBh')
+PROXIMITY = 1
+FLOOR = 2
+WHEEL = 3
+NOTE = 4
+RESET = 5
+OPERATION_NAMES = {
+    PROXIMITY: 'get_proximity',
+    FLOOR: 'get_floor',
+    WHEEL: 'set_wheel',
+    NOTE: 'set_musical_note',
+    RESET: 'reset'
+}
+COMMANDS = (WHEEL, NOTE, RESET)
+FLUSH_RECORDS = 4096
+
+'''Returns a record as readable text, for error messages.'''
+def describe(record):
+    operation, index, value = record
+    if operation == RESET:
+        return 'reset()'
+    elif operation == NOTE:
+        return 'set_musical_note(%d)' % value
+    elif operation == WHEEL:
+        return 'set_wheel(%d, %d)' % (index, value)
+    return '%s(%d) = %d' % (OPERATION_NAMES.get(operation, 'operation %d' % operation), index, value)
+
+'''
+Wraps a robot, passing every call through and appending each sensor read and actuator command to a log file.
+The header holds the seed the grid's random movements were drawn with; see Grid.random. Records are four bytes each and are buffered, so they reach the file every FLUSH_RECORDS records and on close.
+A log that already exists is replaced, so it always holds one session; after a crash it keeps what was flushed before it.
+'''
+class RecordingRobot(object):
+    '''Initialises the wrapper around a robot, starting a new log file with the seed of the grid's random movements.'''
+    def __init__(self, robot, filename, seed = 0):
+        self.robot = robot
+        self.filename = filename
+        self.seed = seed
+        self.sleep = getattr(robot, 'sleep', sleep)
+        self.lock = Lock()
+        self.buffer = bytearray()
+        self.pending = 0
+        self.log = open(filename, 'wb')
+        self.log.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        self.log.write(SEED.pack(seed))
+
+    '''Appends a record, writing the buffer out once it is full. Records made after closing are dropped.'''
+    def record(self, operation, index, value):
+        with self.lock:
+            if self.log.closed:
+                return
+            self.buffer.extend(RECORD.pack(operation, index, value))
+            self.pending += 1
+            if self.pending >= FLUSH_RECORDS:
+                self.flush()
+
+    '''Writes the buffered records to the file. The lock must be held.'''
+    def flush(self):
+        self.log.write(self.buffer)
+        self.log.flush()
+        self.buffer = bytearray()
+        self.pending = 0
+
+    '''Writes the remaining records and closes the log.'''
+    def close(self):
+        with self.lock:
+            if not self.log.closed:
+                self.flush()
+                self.log.close()
+
+    '''Reads and records a proximity sensor.'''
+    def get_proximity(self, index):
+        value = self.robot.get_proximity(index)
+        self.record(PROXIMITY, index, value)
+        return value
+
+    '''Reads and records a floor sensor.'''
+    def get_floor(self, index):
+        value = self.robot.get_floor(index)
+        self.record(FLOOR, index, value)
+        return value
+
+    '''Records and sets the speed of a wheel.'''
+    def set_wheel(self, index, speed):
+        self.record(WHEEL, index, speed)
+        self.robot.set_wheel(index, speed)
+
+    '''Records and plays a note.'''
+    def set_musical_note(self, note):
+        self.record(NOTE, 0, note)
+        self.robot.set_musical_note(note)
+
+    '''Records and stops the wheels and the buzzer.'''
+    def reset(self):
+        self.record(RESET, 0, 0)
+        self.robot.reset()
+
+'''
+Stand-in for a robot that plays back a log written by RecordingRobot, so RobotHandler and the grid rerun a session at full CPU speed.
+Every sensor read returns the next value read in the log, after checking it is a read of the same sensor.
+The grid must draw its random movements from the seed in the log, or None for a log from before seeds were kept, to make the same choices.
+In strict mode every actuator command must also match the next one in the log, so any change in behaviour is reported where it happens.
+Otherwise commands are ignored and skipped over, which lets a changed algorithm be run against recorded data as long as it reads the same sensors.
+Raises ValueError when the run diverges from the log and EOFError when it reads past the end.
+'''
+class ReplayRobot(object):
+    '''Initialises the robot from a log file. Raises ValueError if the file is not a log or was written by a newer format version.'''
+    def __init__(self, filename, strict = True):
+        self.filename = filename
+        self.strict = strict
+        self.lock = Lock()
+        with open(filename, 'rb') as source:
+            if os.fstat(source.fileno()).st_size < HEADER.size:
+                raise ValueError('%s is not a robot log.' % filename)
+            self.data = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a robot log.' % filename)
+        if version > FORMAT_VERSION:
+            raise ValueError('%s was written in log format %d, which is newer than %d.' % (filename, version, FORMAT_VERSION))
+        self.seed = None
+        self.start = HEADER.size
+        if version >= 2:
+            if len(self.data) < HEADER.size + SEED.size:
+                raise ValueError('%s is not a robot log.' % filename)
+            self.seed = SEED.unpack_from(self.data, HEADER.size)[0]
+            self.start += SEED.size
+        # A record cut short by a crash is dropped.
+        self.end = self.start + (len(self.data) - self.start) // RECORD.size * RECORD.size
+        self.position = self.start
+
+    '''Returns the number of records played back so far.'''
+    def records_played(self):
+        return (self.position - self.start) // RECORD.size
+
+    '''Returns if every record has been played back.'''
+    def finished(self):
+        return self.position >= self.end
+
+    '''Consumes records up to the next one for an operation and index and returns its value, skipping commands unless strict.'''
+    def expect(self, operation, index, value = None):
+        expected = describe((operation, index, value)) if value is not None else '%s(%d)' % (OPERATION_NAMES[operation], index)
+        with self.lock:
+            while True:
+                if self.position >= self.end:
+                    raise EOFError('%s ended after %d records, expecting %s.' % (self.filename, self.records_played(), expected))
+                record = RECORD.unpack_from(self.data, self.position)
+                self.position += RECORD.size
+                if record[0] == operation and record[1] == index and (value is None or record[2] == value):
+                    return record[2]
+                if self.strict or not record[0] in COMMANDS:
+                    raise ValueError('Record %d of %s is %s, not %s.' % (self.records_played() - 1, self.filename, describe(record), expected))
+
+    '''Returns the next logged proximity reading.'''
+    def get_proximity(self, index):
+        return self.expect(PROXIMITY, index)
+
+    '''Returns the next logged floor reading.'''
+    def get_floor(self, index):
+        return self.expect(FLOOR, index)
+
+    '''Checks a wheel speed against the log in strict mode.'''
+    def set_wheel(self, index, speed):
+        if self.strict:
+            self.expect(WHEEL, index, speed)
+
+    '''Checks a note against the log in strict mode.'''
+    def set_musical_note(self, note):
+        if self.strict:
+            self.expect(NOTE, 0, note)
+
+    '''Checks a reset against the log in strict mode.'''
+    def reset(self):
+        if self.strict:
+            self.expect(RESET, 0, 0)
+
+    '''Returns at once, so the replay runs at full CPU speed.'''
+    def sleep(self, seconds):
+        pass
+
+    '''Releases the log.'''
+    def close(self):
+        self.data.close()
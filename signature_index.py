@@ -0,0 +1,82 @@
+'''File containing the precomputed index of what the robot expects to sense in every pose.'''
+from directions import DIRECTIONS, DIRECTION_MAP
+from belief import bitmap_to_int, indices_to_int, int_to_indices, repeat_bits
+
+# Constants
+CLEAR = 0
+BLOCKED = 1
+BORDER = 2
+READINGS = ('clear', 'blocked', 'border')
+
+'''
+Expected proximity readings of every pose of a mapped grid, and the poses that expect each reading.
+A pose's signature is what it expects in front: an obstacle ('blocked'), nothing ('clear') or an unmapped border ('border').
+A grid with walls_at_border set has no unmapped border: poses facing its edges expect an obstacle.
+The inverted index is one bitboard per direction and signature, laid out as in BeliefState, so narrowing a belief down is a mask.
+The forward lookup from a pose to its signature is built on first use, since only the histogram filter needs it.
+An index describes the grid as it was when built; Grid.signature_index builds a new one when the map changes.
+'''
+class SignatureIndex(object):
+    '''Builds the index for the nodes reachable from the start node of a grid.'''
+    def __init__(self, grid):
+        self.key = grid.signature_key()
+        self.rows = grid.grid_rows
+        self.columns = grid.grid_columns
+        self.size = self.rows * self.columns
+        self.full = (1 << self.size) - 1
+        self.free_nodes = grid.connected_nodes(grid.start_node)
+        self.free = indices_to_int((row * self.columns + column for row, column in self.free_nodes), self.size)
+        first_column = repeat_bits(1, self.columns, self.rows)
+        self.not_first_column = self.full & ~first_column
+        self.not_last_column = self.full & ~(first_column << (self.columns - 1))
+        first_row = (1 << self.columns) - 1
+        last_row = first_row << ((self.rows - 1) * self.columns)
+        self.border = {'up': last_row, 'down': first_row, 'right': self.full & ~self.not_last_column, 'left': self.full & ~self.not_first_column}
+        obstacles = bitmap_to_int(grid.obstacles.bits) & self.full
+        self.blocked = {
+            'up': obstacles >> self.columns,
+            'down': (obstacles << self.columns) & self.full,
+            'right': (obstacles >> 1) & self.not_last_column,
+            'left': (obstacles << 1) & self.not_first_column
+        }
+        for row, column in grid.obstacles.outside:
+            for direction in DIRECTIONS:
+                row_diff, column_diff = DIRECTION_MAP[direction]
+                behind = (row - row_diff, column - column_diff)
+                if 0 <= behind[0] < self.rows and 0 <= behind[1] < self.columns:
+                    self.blocked[direction] |= 1 << (behind[0] * self.columns + behind[1])
+        if grid.walls_at_border:
+            for direction in DIRECTIONS:
+                self.blocked[direction] |= self.border[direction]
+        self.candidates = {
+            'blocked': dict((direction, self.blocked[direction]) for direction in DIRECTIONS),
+            'border': dict((direction, self.border[direction] & ~self.blocked[direction]) for direction in DIRECTIONS),
+            'clear': dict((direction, self.full & ~self.blocked[direction] & ~self.border[direction]) for direction in DIRECTIONS)
+        }
+        self.agreeing = {
+            True: dict((direction, self.candidates['blocked'][direction] | self.candidates['border'][direction]) for direction in DIRECTIONS),
+            False: dict((direction, self.candidates['clear'][direction] | self.candidates['border'][direction]) for direction in DIRECTIONS)
+        }
+        self.readings = None
+
+    '''Returns, per direction, the bitboard of poses agreeing with whether an obstacle was seen. Poses facing an unmapped border agree with either reading.'''
+    def consistent(self, obstacle_in_front):
+        return self.agreeing[bool(obstacle_in_front)]
+
+    '''Returns the signature of a pose: 'blocked', 'border' or 'clear'.'''
+    def signature(self, pose):
+        if self.readings is None:
+            self.build_readings()
+        return READINGS[self.readings[pose[2]][pose[0] * self.columns + pose[1]]]
+
+    '''Builds the lookup from pose to signature, one byte per node and direction, from the inverted index.'''
+    def build_readings(self):
+        readings = {}
+        for direction in DIRECTIONS:
+            cells = bytearray(self.size)
+            for index in int_to_indices(self.candidates['border'][direction]):
+                cells[index] = BORDER
+            for index in int_to_indices(self.candidates['blocked'][direction]):
+                cells[index] = BLOCKED
+            readings[direction] = cells
+        self.readings = readings
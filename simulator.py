@@ -0,0 +1,147 @@
+'''File containing a simulated Hamster robot moving over a ground-truth grid.'''
+import random
+from time import sleep
+from directions import DIRECTION_MAP, DIRECTION_TURN_LEFT, DIRECTION_TURN_RIGHT
+
+# Constants
+FLOOR_WHITE = 80
+FLOOR_BLACK = 10
+PROXIMITY_NEAR = 100
+PROXIMITY_FAR = 0
+
+'''Makes simulated robots sense and block each other.'''
+def make_fleet(robots):
+    fleet = list(robots)
+    for robot in fleet:
+        robot.fleet = fleet
+    return fleet
+
+'''Returns a random set of obstacles covering roughly a fraction of the grid, never on the kept nodes.'''
+def random_obstacles(rows, columns, density, seed = None, keep = ()):
+    generator = random.Random(seed)
+    obstacles = set([])
+    for row in xrange(rows):
+        for column in xrange(columns):
+            if generator.random() < density:
+                obstacles.add((row, column))
+    return obstacles - set(tuple(node) for node in keep)
+
+'''
+Deterministic stand-in for a Hamster robot from HamsterAPI, driving on a grid of black lines.
+It implements the sensor and motor calls used by RobotHandler: get_proximity, get_floor, set_wheel, set_musical_note and reset.
+Time advances by one tick on every floor reading. Driving forwards crosses a line every cell_ticks + line_ticks ticks
+and turning on the spot crosses one every turn_ticks + line_ticks ticks, which is when the pose changes.
+Lines are line_ticks wide, which must be more than twice the readings RobotHandler takes per loop so it sees both sensors on a line.
+In fast mode sleep returns immediately, so RobotHandler runs at full CPU speed.
+Robots sharing a fleet list sense and block each other like obstacles.
+'''
+class SimulatedRobot(object):
+    '''Initialises the robot at a location and direction of a grid with the given obstacles.'''
+    def __init__(self, rows, columns, obstacles = (), location = (0, 0), direction = 'up', walls_at_border = True, fast = True, proximity_noise = 0.0, seed = None, cell_ticks = 20, line_ticks = 8, turn_ticks = 20):
+        self.rows = int(rows)
+        self.columns = int(columns)
+        self.obstacles = set(tuple(node) for node in obstacles)
+        self.location = tuple(location)
+        self.direction = direction
+        self.walls_at_border = walls_at_border
+        self.fast = fast
+        self.proximity_noise = proximity_noise
+        self.random = random.Random(seed)
+        self.cell_ticks = cell_ticks
+        self.line_ticks = line_ticks
+        self.turn_ticks = turn_ticks
+        self.wheels = [0, 0]
+        self.note = 0
+        self.progress = 0
+        self.rotation = 0
+        self.rotating = None
+        self.forwards = 0
+        self.turns = 0
+        self.collisions = 0
+        self.polls = 0
+        self.wheel_commands = 0
+        self.fleet = [self]
+
+    '''Returns the node in front of the robot.'''
+    def node_in_front(self):
+        return (self.location[0] + DIRECTION_MAP[self.direction][0], self.location[1] + DIRECTION_MAP[self.direction][1])
+
+    '''Returns if a node is blocked by an obstacle or another robot of the fleet or, when the border has walls, lies outside the grid.'''
+    def blocked(self, node):
+        if node in self.obstacles:
+            return True
+        if any(robot.location == node for robot in self.fleet if robot is not self):
+            return True
+        return self.walls_at_border and not (0 <= node[0] < self.rows and 0 <= node[1] < self.columns)
+
+    '''Returns the reading of a proximity sensor, possibly flipped by noise.'''
+    def get_proximity(self, index):
+        near = self.blocked(self.node_in_front())
+        if self.proximity_noise and self.random.random() < self.proximity_noise:
+            near = not near
+        return PROXIMITY_NEAR if near else PROXIMITY_FAR
+
+    '''Advances time by one tick and returns the reading of a floor sensor.'''
+    def get_floor(self, index):
+        self.polls += 1
+        left, right = self.wheels
+        if left >= 0 and right >= 0 and left + right > 0:
+            return self.drive(index)
+        elif left > 0 > right:
+            return self.turn('right', index)
+        elif right > 0 > left:
+            return self.turn('left', index)
+        return self.floor_at(self.progress, self.cell_ticks)
+
+    '''Moves forwards by one tick, crossing into the next node at the end of a line.'''
+    def drive(self, index):
+        self.rotation = 0
+        self.rotating = None
+        self.progress += 1
+        if self.progress >= self.cell_ticks + self.line_ticks:
+            self.progress = 0
+            node = self.node_in_front()
+            if self.blocked(node):
+                self.collisions += 1
+            else:
+                self.location = node
+            self.forwards += 1
+        return self.floor_at(self.progress, self.cell_ticks)
+
+    '''Turns by one tick. Only the sensor on the side of the turn sweeps over the lines.'''
+    def turn(self, direction, index):
+        self.progress = 0
+        if self.rotating != direction:
+            self.rotating = direction
+            self.rotation = 0
+        self.rotation += 1
+        if self.rotation >= self.turn_ticks + self.line_ticks:
+            self.rotation = 0
+            self.direction = (DIRECTION_TURN_RIGHT if direction == 'right' else DIRECTION_TURN_LEFT)[self.direction]
+            self.turns += 1
+        if index != (1 if direction == 'right' else 0):
+            return FLOOR_WHITE
+        return self.floor_at(self.rotation, self.turn_ticks)
+
+    '''Returns black while a position lies on a line and white otherwise.'''
+    def floor_at(self, position, white_ticks):
+        return FLOOR_BLACK if white_ticks <= position < white_ticks + self.line_ticks else FLOOR_WHITE
+
+    '''Sets the speed of a wheel.'''
+    def set_wheel(self, index, speed):
+        self.wheel_commands += 1
+        self.wheels[index] = speed
+
+    '''Plays a note, or stops playing if the note is 0.'''
+    def set_musical_note(self, note):
+        self.note = note
+
+    '''Stops the wheels and the buzzer.'''
+    def reset(self):
+        self.wheels = [0, 0]
+        self.note = 0
+
+    '''Waits for a while, unless running in fast mode.'''
+    def sleep(self, seconds):
+        if not self.fast:
+            sleep(seconds)
@@ -0,0 +1,79 @@
+'''File containing the tests of the bitboard belief state.'''
+import random, unittest
+from belief import BeliefState
+from directions import DIRECTIONS, DIRECTION_MAP, DIRECTION_TURN_LEFT, DIRECTION_TURN_RIGHT
+from grid import Grid
+from tests.test_reachability import flood_fill
+
+'''Returns what a pose expects in front on a grid: 'blocked', 'clear' or, past an unwalled edge, 'border'.'''
+def reading(grid, pose):
+    front = (pose[0] + DIRECTION_MAP[pose[2]][0], pose[1] + DIRECTION_MAP[pose[2]][1])
+    if not (0 <= front[0] < grid.grid_rows and 0 <= front[1] < grid.grid_columns):
+        return 'blocked' if grid.walls_at_border else 'border'
+    return 'blocked' if front in grid.obstacles else 'clear'
+
+'''Keeps track of the possible poses as a set of (row, column, direction) tuples, one pose at a time.'''
+class PoseSet(object):
+    '''Initialises the set with every node reachable from the start node in every direction.'''
+    def __init__(self, grid):
+        self.grid = grid
+        self.free = flood_fill(grid, grid.start_node)
+        self.poses = set((row, column, direction) for row, column in self.free for direction in DIRECTIONS)
+
+    '''Keeps the poses agreeing with a reading. Those facing an unmapped border agree with either.'''
+    def observe(self, obstacle_in_front):
+        expected = 'blocked' if obstacle_in_front else 'clear'
+        self.poses = set(pose for pose in self.poses if reading(self.grid, pose) in (expected, 'border'))
+
+    '''Applies a movement to every pose, dropping those driven off the reachable nodes.'''
+    def apply(self, movement):
+        if movement == 'forwards':
+            moved = set((row + DIRECTION_MAP[direction][0], column + DIRECTION_MAP[direction][1], direction) for row, column, direction in self.poses)
+            self.poses = set(pose for pose in moved if pose[:2] in self.free)
+        else:
+            turn = DIRECTION_TURN_LEFT if movement == 'left' else DIRECTION_TURN_RIGHT
+            self.poses = set((row, column, turn[direction]) for row, column, direction in self.poses)
+
+'''Checks the bitboards narrow the poses down exactly as a set of poses would.'''
+class BeliefStateTest(unittest.TestCase):
+    '''Drives a robot around 150 random grids, walled and unwalled, comparing the belief with a set of poses after every step.'''
+    def test_matches_pose_set(self):
+        generator = random.Random(0)
+        for _ in xrange(150):
+            grid = Grid(500, 500)
+            grid.set_grid_rows(generator.randint(1, 9))
+            grid.set_grid_cols(generator.randint(1, 9))
+            grid.make_grid()
+            grid.walls_at_border = generator.random() < 0.5
+            cells = list(grid.nodes)
+            for node in cells:
+                if generator.random() < 0.25:
+                    grid.obstacles.add(node)
+            start = generator.choice(cells)
+            grid.obstacles.discard(start)
+            grid.set_start(start)
+            belief = BeliefState(grid)
+            reference = PoseSet(grid)
+            pose = (start[0], start[1], generator.choice(DIRECTIONS))
+            for _ in xrange(30):
+                expected = reading(grid, pose)
+                obstacle_in_front = generator.random() < 0.5 if expected == 'border' else expected == 'blocked'
+                belief.observe(obstacle_in_front)
+                reference.observe(obstacle_in_front)
+                self.assertEqual(set(belief.poses()), reference.poses)
+                self.assertIn(pose, reference.poses)
+                self.assertEqual(belief.count(), len(reference.poses))
+                self.assertEqual(belief.faces_border(), any(reading(grid, other) == 'border' for other in reference.poses))
+                self.assertEqual(belief.can_move_forwards(), not belief.faces_border() and any(reading(grid, other) == 'clear' for other in reference.poses))
+                movement = 'forwards' if expected == 'clear' and generator.random() < 0.6 else generator.choice(['left', 'right'])
+                belief.apply(movement)
+                reference.apply(movement)
+                if movement == 'forwards':
+                    pose = (pose[0] + DIRECTION_MAP[pose[2]][0], pose[1] + DIRECTION_MAP[pose[2]][1], pose[2])
+                else:
+                    pose = (pose[0], pose[1], (DIRECTION_TURN_LEFT if movement == 'left' else DIRECTION_TURN_RIGHT)[pose[2]])
+                self.assertEqual(set(belief.poses()), reference.poses)
+            self.assertEqual(belief.localised(), len(reference.poses) <= 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+'''File containing the tests of the coordinator sending robots home in turn.'''
+import unittest
+from coordinator import Coordinator
+from grid import Grid
+
+'''Checks a robot is only sent home if its teammates can still come home after it.'''
+class ReturnOrderTest(unittest.TestCase):
+    '''
+    Places three robots in front of a dead end holding the start and the homes of the others, deepest last.
+    The robots stand on one node, since only the homes they fill block the way.
+    '''
+    def setUp(self):
+        grid = Grid(500, 500)
+        grid.set_grid_rows(1)
+        grid.set_grid_cols(4)
+        grid.set_start((0, 1))
+        grid.make_grid()
+        self.coordinator = Coordinator(grid, [None] * 3, [((0, 2), 'right'), ((0, 3), 'right')])
+        self.coordinator.place()
+        for robot in self.coordinator.grids:
+            robot.set_pose((0, 0), 'right')
+        self.pending = zip(self.coordinator.grids, self.coordinator.robots)
+
+    '''Sends the robot with the deepest home first and holds back the others.'''
+    def test_deepest_home_first(self):
+        self.assertEqual([self.coordinator.leaves_way_home(grid, self.pending) for grid in self.coordinator.grids], [False, False, True])
+
+    '''Sends the next robot once the deepest one is home.'''
+    def test_after_deepest_home(self):
+        first, second, deepest = self.coordinator.grids
+        deepest.set_pose((0, 3), 'right')
+        pending = self.pending[:2]
+        self.assertEqual([self.coordinator.leaves_way_home(grid, pending) for grid in (first, second)], [False, True])
+
+if __name__ == '__main__':
+    unittest.main()
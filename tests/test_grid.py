@@ -0,0 +1,109 @@
+'''File containing the tests of adding nodes to the grid and of localising on it.'''
+import unittest
+from grid import Grid
+from robot_handler import RobotHandler
+from simulator import SimulatedRobot
+
+'''Returns a grid of a size whose nodes have been made.'''
+def sized_grid(rows, columns):
+    grid = Grid(500, 500)
+    grid.set_grid_rows(rows)
+    grid.set_grid_cols(columns)
+    grid.make_grid()
+    return grid
+
+'''Checks nodes are only added to a grid whose nodes have been made at its current size.'''
+class AddNodeTest(unittest.TestCase):
+    '''Adds nodes and neighbours to a grid once make_grid has been called.'''
+    def test_add_after_make_grid(self):
+        grid = sized_grid(3, 4)
+        grid.nodes.discard((1, 1))
+        grid.nodes.discard((1, 2))
+        grid.add_neighbour((1, 1), (1, 2))
+        self.assertEqual(len(grid.nodes), 12)
+        self.assertEqual(grid.nodes[(1, 1)], set([(0, 1), (2, 1), (1, 0), (1, 2)]))
+
+    '''Rejects nodes added before the grid has a size.'''
+    def test_add_without_size(self):
+        grid = Grid(500, 500)
+        self.assertRaises(ValueError, grid.add_node, (0, 0))
+        grid.set_grid_rows(3)
+        self.assertRaises(ValueError, grid.add_node, (0, 0))
+
+    '''Rejects nodes added after a size change, keeping the nodes already made.'''
+    def test_add_after_resize(self):
+        grid = sized_grid(3, 4)
+        grid.set_grid_rows(5)
+        self.assertRaises(ValueError, grid.add_node, (0, 0))
+        self.assertEqual(len(grid.nodes), 12)
+        grid.make_grid()
+        grid.add_node((4, 3))
+        self.assertEqual(len(grid.nodes), 20)
+
+    '''Adds nodes to an unbounded grid, which has no size.'''
+    def test_add_unbounded(self):
+        grid = Grid(500, 500)
+        grid.set_start((0, 0))
+        grid.make_unbounded_grid()
+        grid.add_node((-5, 7))
+        self.assertIn((-5, 7), grid.nodes)
+
+'''Checks robots sharing a grid reserve the nodes they are about to drive into.'''
+class ReserveTest(unittest.TestCase):
+    '''Reserves a run only up to the first node another robot stands on or has reserved.'''
+    def test_reserve_run(self):
+        grid = sized_grid(1, 6)
+        grid.set_start((0, 0))
+        teammate = grid.add_robot((0, 5))
+        run = [(0, 1), (0, 2), (0, 3), (0, 4), (0, 5)]
+        self.assertEqual(grid.reserve_run(run), 4)
+        self.assertEqual(grid.reserved, set(run[:4]))
+        self.assertFalse(teammate.reserve([(0, 4)]))
+        grid.reserve([])
+        self.assertTrue(teammate.reserve([(0, 3), (0, 4)]))
+        self.assertEqual(grid.reserve_run(run), 2)
+        grid.reserve([])
+        self.assertTrue(teammate.reserve([(0, 1)]))
+        self.assertEqual(grid.reserve_run(run), 0)
+        self.assertEqual(grid.reserved, set([]))
+        self.assertEqual(len(grid.obstacles), 0)
+
+'''Checks localisation stops, rather than turning on the spot for ever, when it cannot go on safely.'''
+class LocaliseTest(unittest.TestCase):
+    '''Localises a robot put down on a map, returning the grid and the simulated robot.'''
+    def localise(self, walls_at_border, mode, policy):
+        grid = sized_grid(6, 6)
+        grid.set_start((3, 3))
+        grid.walls_at_border = walls_at_border
+        grid.set_localisation_mode(mode)
+        grid.set_localisation_policy(policy)
+        grid.obstacles.add((2, 2))
+        grid.obstacles.add((3, 4))
+        simulator = SimulatedRobot(6, 6, [(2, 2), (3, 4)], location = (1, 4), direction = 'right', walls_at_border = walls_at_border)
+        robot = RobotHandler(simulator)
+        try:
+            grid.localising = True
+            grid.localise(robot)
+        finally:
+            robot.close()
+        return grid, simulator
+
+    '''Gives up on a map with open edges without driving off it.'''
+    def test_gives_up_at_open_edges(self):
+        for mode in ('exact', 'histogram'):
+            for policy in ('active', 'random'):
+                grid, simulator = self.localise(False, mode, policy)
+                self.assertFalse(grid.localised)
+                self.assertEqual(simulator.forwards, 0)
+                self.assertEqual(simulator.location, (1, 4))
+
+    '''Localises on a walled map, which bounded grids are by default.'''
+    def test_localises_when_walled(self):
+        self.assertTrue(Grid(500, 500).walls_at_border)
+        for mode in ('exact', 'histogram'):
+            grid, simulator = self.localise(True, mode, 'active')
+            self.assertTrue(grid.localised)
+            self.assertEqual((grid.current_location, grid.current_direction), (simulator.location, simulator.direction))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+'''File containing the tests of the hierarchical block map.'''
+import random, unittest
+from grid import Grid
+from hierarchy import BlockMap
+from tests.test_reachability import flood_fill
+
+'''Checks paths and floods over blocks against searches over cells.'''
+class BlockMapTest(unittest.TestCase):
+    '''Checks a path runs from start to goal through passable, 4-adjacent nodes.'''
+    def assertValidPath(self, grid, path, start, goal):
+        self.assertEqual((path[0], path[-1]), (start, goal))
+        for node, following in zip(path, path[1:]):
+            self.assertEqual(abs(node[0] - following[0]) + abs(node[1] - following[1]), 1)
+            self.assertTrue(grid.planner.passable(following))
+
+    '''
+    Plans and floods over small blocks of 60 random grids, changing obstacles in between so blocks are forgotten and worked out again.
+    Paths must agree with BFS on whether the goal can be reached and be no shorter; floods must match a flood fill.
+    '''
+    def test_matches_cell_searches(self):
+        generator = random.Random(0)
+        for _ in xrange(60):
+            grid = Grid(500, 500)
+            grid.set_grid_rows(generator.randint(1, 24))
+            grid.set_grid_cols(generator.randint(1, 24))
+            grid.make_grid()
+            density = generator.choice([0.0, 0.1, 0.3])
+            cells = list(grid.nodes)
+            for node in cells:
+                if generator.random() < density:
+                    grid.obstacles.add(node)
+            blocks = BlockMap(grid, generator.randint(2, 6))
+            for _ in xrange(10):
+                free = [node for node in cells if grid.planner.passable(node)]
+                if free:
+                    start, goal = generator.choice(free), generator.choice(free)
+                    shortest = grid.planner.bfs(start, goal)
+                    path = blocks.path(start, goal)
+                    self.assertEqual(path is None, shortest is None)
+                    if path is not None:
+                        self.assertValidPath(grid, path, start, goal)
+                        self.assertTrue(len(path) >= len(shortest))
+                    self.assertEqual(blocks.flood(start), flood_fill(grid, start))
+                for node in generator.sample(cells, min(3, len(cells))):
+                    if node in grid.obstacles:
+                        grid.obstacles.discard(node)
+                    else:
+                        grid.obstacles.add(node)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+'''File containing the tests of the incremental planner used to return to the start.'''
+import random, unittest
+from collections import deque
+from grid import Grid
+from incremental_planner import DStarLite
+from simulator import random_obstacles
+
+# Constants
+HEADINGS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+'''Returns the length of a shortest path between two nodes of a grid found by BFS, or None if there is none.'''
+def bfs_length(grid, start, goal, blocked):
+    passable = lambda node: node in grid.nodes and not node in grid.obstacles and not node in blocked
+    depths = {start: 0}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        if node == goal:
+            return depths[node] + 1
+        for neighbour in grid.nodes.neighbours(node):
+            if passable(neighbour) and not neighbour in depths:
+                depths[neighbour] = depths[node] + 1
+                queue.append(neighbour)
+    return None
+
+'''Returns the number of quarter turns along a path, starting from a heading.'''
+def count_turns(path, heading):
+    turns = 0
+    for node, next_node in zip(path, path[1:]):
+        step = (next_node[0] - node[0], next_node[1] - node[1])
+        if heading is not None and step != heading:
+            turns += 2 if step == (-heading[0], -heading[1]) else 1
+        heading = step
+    return turns
+
+'''Returns a square grid of a random size with random obstacles, never on the start node (0, 0).'''
+def random_grid(generator, seed):
+    size = generator.randint(5, 20)
+    grid = Grid(500, 500)
+    grid.set_grid_rows(size)
+    grid.set_grid_cols(size)
+    grid.set_start((0, 0))
+    grid.make_grid()
+    for obstacle in random_obstacles(size, size, 0.2, seed, keep = [(0, 0)]):
+        grid.obstacles.add(obstacle)
+    return grid
+
+'''Checks D* Lite against BFS as obstacles come and go, nodes are blocked and the robot moves.'''
+class DStarLiteTest(unittest.TestCase):
+    '''Checks a path is a valid shortest path with the fewest turns, or that there is none when BFS finds none.'''
+    def check_path(self, grid, planner, heading):
+        path = planner.path(heading)
+        length = bfs_length(grid, planner.start, planner.goal, planner.blocked)
+        if length is None:
+            self.assertIsNone(path)
+            return path
+        self.assertIsNotNone(path)
+        self.assertEqual(len(path), length)
+        self.assertEqual(path[0], planner.start)
+        self.assertEqual(path[-1], planner.goal)
+        for node, next_node in zip(path, path[1:]):
+            self.assertEqual(abs(node[0] - next_node[0]) + abs(node[1] - next_node[1]), 1)
+            self.assertTrue(planner.passable(next_node))
+        if not planner.blocked:
+            self.assertEqual(count_turns(path, heading), count_turns(grid.planner.fewest_turns(planner.start, planner.goal, heading), heading))
+        return path
+
+    '''Replans after random obstacle changes, blocked nodes and moves along the path.'''
+    def test_matches_bfs_after_changes(self):
+        for seed in xrange(100):
+            generator = random.Random(seed)
+            grid = random_grid(generator, seed)
+            free = sorted(grid.connected_nodes((0, 0)))
+            planner = DStarLite(grid, generator.choice(free), (0, 0))
+            for _ in xrange(30):
+                path = self.check_path(grid, planner, generator.choice(HEADINGS))
+                roll = generator.random()
+                if roll < 0.3:
+                    node = generator.choice(free)
+                    if not node in (planner.start, planner.goal):
+                        grid.obstacles.add(node)
+                elif roll < 0.5 and len(grid.obstacles):
+                    grid.obstacles.discard(generator.choice(sorted(grid.obstacles)))
+                elif roll < 0.6:
+                    planner.set_blocked(generator.sample(free, min(2, len(free))))
+                elif roll < 0.7:
+                    planner.set_blocked([])
+                elif path and len(path) > 1:
+                    planner.move_to(path[1])
+
+    '''Starts over when the grid's nodes are replaced.'''
+    def test_new_nodes_reset_the_search(self):
+        grid = random_grid(random.Random(0), 0)
+        planner = DStarLite(grid, (0, 0), (0, 0))
+        grid.make_grid()
+        planner.move_to((grid.grid_rows - 1, grid.grid_columns - 1))
+        grid.obstacles.clear()
+        self.check_path(grid, planner, None)
+        self.assertIs(planner.nodes, grid.nodes)
+
+if __name__ == '__main__':
+    unittest.main()
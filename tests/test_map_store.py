@@ -0,0 +1,88 @@
+'''File containing the tests of saving and loading maps.'''
+import os, shutil, tempfile, unittest
+from grid import Grid
+from map_store import FILE_EXTENSION, HEADER, SavedMap, obstacle_nodes, read_map, write_map
+from simulator import random_obstacles
+
+# Constants
+OUTSIDE = [(-1, 4), (7, 2), (3, -1)]
+
+'''Returns a mapped grid of a size with random obstacles, some of them past its border.'''
+def obstacle_grid(rows, columns, seed):
+    grid = Grid(500, 500)
+    grid.set_grid_rows(rows)
+    grid.set_grid_cols(columns)
+    grid.set_start((rows // 2, columns // 2))
+    grid.make_grid()
+    for obstacle in random_obstacles(rows, columns, 0.2, seed, keep = [grid.start_node]) | set(OUTSIDE):
+        grid.obstacles.add(obstacle)
+    return grid
+
+'''Checks maps come back from a file as they were saved.'''
+class MapStoreTest(unittest.TestCase):
+    '''Makes a directory to save maps in.'''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    '''Removes the directory and the maps in it.'''
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    '''Returns the name of a map file in the directory.'''
+    def filename(self, name):
+        return os.path.join(self.directory, name + FILE_EXTENSION)
+
+    '''Saves grids whose cell counts are and are not a multiple of eight and loads them into new grids.'''
+    def test_save_and_reload(self):
+        for seed, (rows, columns) in enumerate([(7, 9), (8, 8), (1, 1), (33, 5)]):
+            grid = obstacle_grid(rows, columns, seed)
+            filename = self.filename('grid%d' % seed)
+            grid.save_map(filename)
+            loaded = Grid(500, 500)
+            loaded.load_map(filename)
+            self.assertEqual((loaded.grid_rows, loaded.grid_columns), (rows, columns))
+            self.assertEqual(loaded.start_node, grid.start_node)
+            self.assertEqual(sorted(loaded.obstacles), sorted(grid.obstacles))
+            self.assertEqual(loaded.obstacles.version, grid.obstacles.version)
+            self.assertEqual(sorted(loaded.nodes), sorted(node for node in grid.nodes if not node in grid.obstacles))
+            self.assertEqual(loaded.connected_nodes(loaded.start_node), grid.connected_nodes(grid.start_node))
+
+    '''Saves an unbounded grid, which is bounded first, and loads it back.'''
+    def test_save_unbounded(self):
+        grid = Grid(500, 500)
+        grid.set_start((0, 0))
+        grid.make_unbounded_grid()
+        grid.discover((0, 1))
+        grid.obstacles.add((-1, 0))
+        filename = self.filename('unbounded')
+        grid.save_map(filename)
+        self.assertFalse(grid.unbounded)
+        loaded = Grid(500, 500)
+        loaded.load_map(filename)
+        self.assertEqual((loaded.grid_rows, loaded.grid_columns), (3, 4))
+        self.assertEqual(loaded.start_node, (1, 1))
+        self.assertEqual(sorted(loaded.obstacles), [(0, 1)])
+
+    '''Writes and reads a map without a start node.'''
+    def test_map_without_start(self):
+        filename = self.filename('no_start')
+        write_map(filename, SavedMap(2, 3, None, 4, bytearray([0x21]), [(5, 5)]))
+        saved_map = read_map(filename)
+        self.assertIsNone(saved_map.start)
+        self.assertEqual(saved_map.version, 4)
+        self.assertEqual(obstacle_nodes(saved_map), set([(0, 0), (1, 2), (5, 5)]))
+
+    '''Rejects files that are not maps or have been cut short.'''
+    def test_bad_files(self):
+        filename = self.filename('grid')
+        obstacle_grid(7, 9, 0).save_map(filename)
+        with open(filename, 'rb') as source:
+            data = source.read()
+        for name, contents in (('empty', b''), ('header', data[:HEADER.size]), ('bitmap', data[:HEADER.size + 3]), ('outside', data[:-1]), ('magic', b'XMAP' + data[4:])):
+            bad_filename = self.filename(name)
+            with open(bad_filename, 'wb') as output:
+                output.write(contents)
+            self.assertRaises(ValueError, read_map, bad_filename)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+'''File containing the tests of the path planning engine's searches and its cache of shortest-path trees.'''
+import random, unittest
+from grid import Grid
+
+'''Returns a grid of a size with random obstacles and the nodes made.'''
+def random_grid(generator, rows, columns, density):
+    grid = Grid(500, 500)
+    grid.set_grid_rows(rows)
+    grid.set_grid_cols(columns)
+    grid.make_grid()
+    for row in xrange(rows):
+        for column in xrange(columns):
+            if generator.random() < density:
+                grid.obstacles.add((row, column))
+    return grid
+
+'''Checks the searches find paths of the same length, or agree there is none.'''
+class SearchTest(unittest.TestCase):
+    '''Checks a path runs from start to goal through passable, 4-adjacent nodes.'''
+    def assertValidPath(self, planner, path, start, goal):
+        self.assertEqual((path[0], path[-1]), (start, goal))
+        for node, following in zip(path, path[1:]):
+            self.assertEqual(abs(node[0] - following[0]) + abs(node[1] - following[1]), 1)
+            self.assertTrue(planner.passable(following))
+
+    '''Compares bfs, astar, path_to_root and fewest_turns on 200 random grids.'''
+    def test_searches_agree(self):
+        generator = random.Random(0)
+        for _ in xrange(200):
+            grid = random_grid(generator, generator.randint(1, 9), generator.randint(1, 9), 0.3)
+            planner = grid.planner
+            free = [node for node in grid.nodes if planner.passable(node)]
+            if not free:
+                continue
+            start, goal = generator.choice(free), generator.choice(free)
+            paths = [planner.bfs(start, goal), planner.astar(start, goal), planner.fewest_turns(start, goal)]
+            to_root = planner.path_to_root(goal, start)
+            self.assertEqual([path is None for path in paths + [to_root]], [paths[0] is None] * 4)
+            if paths[0] is None:
+                continue
+            for path in paths + [to_root]:
+                self.assertValidPath(planner, path, start, goal)
+                self.assertEqual(len(path), len(paths[0]))
+
+    '''Throws cached trees away when the obstacles change, and keeps them otherwise.'''
+    def test_tree_cache(self):
+        grid = random_grid(random.Random(0), 1, 5, 0)
+        planner = grid.planner
+        tree = planner.tree((0, 0))
+        self.assertIs(planner.tree((0, 0)), tree)
+        self.assertEqual(len(planner.path_to_root((0, 0), (0, 4))), 5)
+        grid.obstacles.add((0, 2))
+        self.assertIsNone(planner.path_to_root((0, 0), (0, 4)))
+        self.assertIsNot(planner.tree((0, 0)), tree)
+
+if __name__ == '__main__':
+    unittest.main()
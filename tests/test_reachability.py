@@ -0,0 +1,59 @@
+'''File containing the tests of the incremental reachability tracker.'''
+import random, unittest
+from collections import deque
+from grid import Grid
+
+'''Returns the nodes reachable from a root by a plain flood fill over a set, or none if the root is an obstacle.'''
+def flood_fill(grid, root):
+    if root in grid.obstacles:
+        return set([])
+    reached = set([root])
+    queue = deque([root])
+    while queue:
+        row, column = queue.popleft()
+        for node in ((row + 1, column), (row - 1, column), (row, column + 1), (row, column - 1)):
+            if 0 <= node[0] < grid.grid_rows and 0 <= node[1] < grid.grid_columns and not node in grid.obstacles and not node in reached:
+                reached.add(node)
+                queue.append(node)
+    return reached
+
+'''Checks the tracker keeps up with obstacles being added and removed.'''
+class ReachabilityTest(unittest.TestCase):
+    '''Adds and removes random obstacles and visits random nodes on 100 random grids, comparing the tracker with a flood fill after every change.'''
+    def test_matches_flood_fill(self):
+        generator = random.Random(0)
+        for _ in xrange(100):
+            grid = Grid(500, 500)
+            grid.set_grid_rows(generator.randint(1, 10))
+            grid.set_grid_cols(generator.randint(1, 10))
+            grid.make_grid()
+            cells = list(grid.nodes)
+            for node in cells:
+                if generator.random() < 0.2:
+                    grid.obstacles.add(node)
+            root = generator.choice(cells)
+            grid.obstacles.discard(root)
+            tracker = grid.reachability
+            tracker.track(root)
+            visited = set([])
+            for _ in xrange(60):
+                node = generator.choice(cells)
+                action = generator.random()
+                if action < 0.4:
+                    grid.obstacles.add(node)
+                elif action < 0.7:
+                    grid.obstacles.discard(node)
+                else:
+                    tracker.visit(node)
+                    visited.add(node)
+                remaining = set(tracker.remaining())
+                reachable = flood_fill(grid, root)
+                # Visits to nodes that stop being reachable are forgotten, even if they become reachable again.
+                visited &= reachable
+                self.assertEqual(set(tracker.reachable), reachable)
+                self.assertEqual(remaining, reachable - visited)
+                self.assertEqual(tracker.unvisited, len(reachable - visited))
+                self.assertEqual(tracker.complete(), not reachable - visited)
+
+if __name__ == '__main__':
+    unittest.main()
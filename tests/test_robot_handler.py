@@ -0,0 +1,93 @@
+'''File containing the tests of how the robot handler turns paths into movements.'''
+import random, unittest
+from robot_handler import MoveFuture, RobotHandler, compress
+
+# Constants
+STEPS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+HEADINGS = ['up', 'right', 'down', 'left']
+# The movements the original path2directions made for a step, by the step and the heading before it.
+ORIGINAL_MOVEMENTS = {
+    (0, 1): {'right': ['forwards'], 'up': ['right', 'forwards'], 'left': ['right', 'right', 'forwards'], 'down': ['left', 'forwards']},
+    (1, 0): {'right': ['left', 'forwards'], 'up': ['forwards'], 'left': ['right', 'forwards'], 'down': ['right', 'right', 'forwards']},
+    (0, -1): {'right': ['right', 'right', 'forwards'], 'up': ['left', 'forwards'], 'left': ['forwards'], 'down': ['right', 'forwards']},
+    (-1, 0): {'right': ['right', 'forwards'], 'up': ['right', 'right', 'forwards'], 'left': ['left', 'forwards'], 'down': ['forwards']}
+}
+ORIGINAL_HEADINGS = {(0, 1): 'right', (1, 0): 'up', (0, -1): 'left', (-1, 0): 'down'}
+
+'''The original path2directions, which made the movements for each step from a table. Steps that are not 4-adjacent are skipped.'''
+def original_path2directions(path, last_direction = 'up'):
+    directions = []
+    last_location = path.pop(0)
+    for node in path:
+        step = (node[0] - last_location[0], node[1] - last_location[1])
+        if step in ORIGINAL_MOVEMENTS:
+            directions.extend(ORIGINAL_MOVEMENTS[step][last_direction])
+            last_direction = ORIGINAL_HEADINGS[step]
+        last_location = node
+    return directions, last_direction
+
+'''Returns a random walk of 4-adjacent nodes, occasionally standing still.'''
+def random_path(generator):
+    node = (generator.randint(-5, 5), generator.randint(-5, 5))
+    path = [node]
+    for _ in xrange(generator.randint(0, 12)):
+        step = generator.choice(STEPS + [(0, 0)])
+        node = (node[0] + step[0], node[1] + step[1])
+        path.append(node)
+    return path
+
+'''Checks the movements made for paths.'''
+class PathToDirectionsTest(unittest.TestCase):
+    '''Checks path2directions against the original on 2000 random paths and headings.'''
+    def test_matches_original(self):
+        handler = RobotHandler(None)
+        generator = random.Random(0)
+        for _ in xrange(2000):
+            path = random_path(generator)
+            heading = generator.choice(HEADINGS)
+            self.assertEqual(handler.path2directions(list(path), heading), original_path2directions(list(path), heading))
+
+    '''Checks runs of the same movement are merged.'''
+    def test_compress(self):
+        self.assertEqual(compress(['right', 'right', 'forwards', 'forwards', 'forwards', 'left', 'forwards']), [('right', 2), ('forwards', 3), ('left', 1), ('forwards', 1)])
+        self.assertEqual(compress([]), [])
+
+'''A robot whose floor sensors fail on the first read.'''
+class FailingRobot(object):
+    '''Initialises the robot with no reads or resets made.'''
+    def __init__(self):
+        self.floor_reads = 0
+        self.resets = 0
+
+    '''Fails every floor sensor read.'''
+    def get_floor(self, sensor):
+        self.floor_reads += 1
+        raise IOError('Floor sensor %d failed.' % sensor)
+
+    '''Counts the resets.'''
+    def reset(self):
+        self.resets += 1
+
+    '''Does not wait.'''
+    def sleep(self, seconds):
+        pass
+
+'''Checks what happens to queued movements when one of them fails.'''
+class ControlTest(unittest.TestCase):
+    '''Stops the robot and fails the movements queued behind a failed one with its error, without running them.'''
+    def test_failure_ends_queue(self):
+        robot = FailingRobot()
+        handler = RobotHandler(robot)
+        futures = [MoveFuture('forwards', 2), MoveFuture('right'), MoveFuture('forwards'), MoveFuture('stop')]
+        for future in futures + [None]:
+            handler.commands.put(future)
+        handler.control()
+        for future in futures:
+            self.assertRaises(IOError, future.result, 0)
+            self.assertIs(future.error, futures[0].error)
+        self.assertEqual(robot.floor_reads, 1)
+        self.assertEqual(robot.resets, 1)
+        self.assertTrue(handler.commands.empty())
+
+if __name__ == '__main__':
+    unittest.main()
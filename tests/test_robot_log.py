@@ -0,0 +1,82 @@
+'''File containing the tests of recording a session to a robot log and replaying it.'''
+import os, random, shutil, struct, tempfile, unittest
+from grid import Grid, RandomWalkExplorer
+from robot_handler import RobotHandler
+from robot_log import HEADER, MAGIC, RECORD, PROXIMITY, ReplayRobot
+from simulator import SimulatedRobot
+
+# Constants
+OBSTACLES = [(1, 1), (3, 2), (0, 4)]
+
+'''Maps a 5x5 grid with a random walk, then localises with the random policy, and returns the grid.'''
+def run_session(robot, seed):
+    grid = Grid(500, 500)
+    grid.random.seed(seed)
+    grid.set_grid_rows(5)
+    grid.set_grid_cols(5)
+    grid.set_start((2, 2))
+    grid.make_grid()
+    grid.set_explorer(RandomWalkExplorer())
+    grid.set_localisation_policy('random')
+    grid.mapping = True
+    grid.map(robot)
+    grid.localising = True
+    grid.localise(robot)
+    return grid
+
+'''Checks a recorded session replays through the same grid code.'''
+class RobotLogTest(unittest.TestCase):
+    '''Makes a directory for the logs.'''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    '''Removes the directory and the logs in it.'''
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    '''Records sessions that make random choices and replays them, with the global random state changed in between.'''
+    def test_record_and_replay(self):
+        for seed in xrange(3):
+            filename = os.path.join(self.directory, 'session%d.log' % seed)
+            simulator = SimulatedRobot(5, 5, OBSTACLES, location = (2, 2))
+            robot = RobotHandler(simulator, record = filename, seed = seed)
+            try:
+                recorded = run_session(robot, seed)
+            finally:
+                robot.close()
+            random.seed(seed + 100)
+            replay = ReplayRobot(filename)
+            self.assertEqual(replay.seed, seed)
+            robot = RobotHandler(replay)
+            try:
+                replayed = run_session(robot, replay.seed)
+            finally:
+                robot.close()
+                replay.close()
+            self.assertTrue(replay.finished())
+            self.assertEqual(sorted(replayed.obstacles), sorted(recorded.obstacles))
+            self.assertEqual((replayed.current_location, replayed.current_direction), (recorded.current_location, recorded.current_direction))
+            self.assertEqual([entry['movement'] for entry in replayed.localisation_log], [entry['movement'] for entry in recorded.localisation_log])
+
+    '''Replays a log in the first format version, which kept no seed.'''
+    def test_log_without_seed(self):
+        filename = os.path.join(self.directory, 'old.log')
+        with open(filename, 'wb') as output:
+            output.write(HEADER.pack(MAGIC, 1) + RECORD.pack(PROXIMITY, 0, 70) + RECORD.pack(PROXIMITY, 1, 10))
+        replay = ReplayRobot(filename)
+        try:
+            self.assertIsNone(replay.seed)
+            self.assertEqual((replay.get_proximity(0), replay.get_proximity(1)), (70, 10))
+            self.assertTrue(replay.finished())
+        finally:
+            replay.close()
+
+    '''Rejects a log whose header is cut short before its seed.'''
+    def test_truncated_seed(self):
+        filename = os.path.join(self.directory, 'short.log')
+        with open(filename, 'wb') as output:
+            output.write(HEADER.pack(MAGIC, 2) + struct.pack('<H', 7))
+        self.assertRaises(ValueError, ReplayRobot, filename)
+
+if __name__ == '__main__':
+    unittest.main()